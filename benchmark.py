@@ -0,0 +1,231 @@
+import os, sys, json, math, time, glob, random, asyncio, argparse, platform, resource, tempfile, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from langchain_core.callbacks import BaseCallbackHandler
+from config import config as CONFIG
+
+# Benchmarks always run offline against the deterministic fake backend
+CONFIG.LLM_BACKEND = "fake"
+CONFIG.RATE_LIMIT_PAUSE = 0
+CONFIG.CHECKPOINTING_ENABLED = False  # Every run must do the full work
+CONFIG.DEDUP_ENABLED = False
+CONFIG.RESULTS_STORE_ENABLED = False  # Keep synthetic documents out of the results store
+
+from utils.llm_backends import register_llm_callback, clear_model_cache
+from utils.async_runtime import run_sync
+from document_loader import load_document, chunk_text
+from clause_extractor import extract_clauses, merge_clause_chunks
+from classify_documents import classify_document
+from risk_detector import analyze_clause_risks
+from summarizer import get_doc_summary
+from pdf_agent import build_graph
+
+STAGES = ["load_document", "chunk_text", "extract_clauses", "classify_document",
+          "analyze_clause_risks", "get_doc_summary", "graph_invoke"]
+
+class UsageCounter(BaseCallbackHandler):
+    """Counts LLM calls and tokens across every model created by configure_llm."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = self.prompt_tokens = self.completion_tokens = 0
+
+    def on_llm_end(self, response, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage", {})
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += usage.get("prompt_tokens", 0)
+            self.completion_tokens += usage.get("completion_tokens", 0)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {"calls": self.calls, "prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens}
+
+SYNTHETIC_SECTIONS = [
+    ("Confidentiality", "The Receiving Party shall keep all Confidential Information strictly confidential and shall not disclose it to any third party."),
+    ("Term and Termination", "Either party may terminate this Agreement upon thirty (30) days written notice to the other party."),
+    ("Payment Terms", "The Client shall pay all fees within thirty (30) days of receipt of a valid invoice."),
+    ("Limitation of Liability", "Neither party shall be liable for any indirect or consequential loss arising under this Agreement."),
+    ("Indemnification", "The Supplier shall indemnify the Client against all claims arising from the Supplier's breach."),
+    ("Intellectual Property", "All intellectual property rights in the Deliverables shall vest in the Client upon payment."),
+    ("Force Majeure", "Neither party shall be in breach for delays caused by events of force majeure beyond its control."),
+    ("Dispute Resolution", "Any dispute shall first be referred to senior management and then to binding arbitration."),
+    ("Governing Law", "This Agreement shall be governed by the laws of England and Wales."),
+    ("Amendments", "No amendment to this Agreement shall be effective unless made in writing and signed by both parties."),
+]
+
+def make_synthetic_corpus(directory: str, count: int, sections_per_doc: int, seed: int = 0) -> List[str]:
+    """
+    Write `count` synthetic contracts (numbered sections with filler paragraphs) as .txt files.
+    """
+    rng = random.Random(seed)
+    paths = []
+    for n in range(count):
+        lines = [f"MASTER SERVICES AGREEMENT No. {n + 1}", ""]
+        for i in range(sections_per_doc):
+            heading, body = SYNTHETIC_SECTIONS[rng.randrange(len(SYNTHETIC_SECTIONS))]
+            filler = " ".join(rng.choice(SYNTHETIC_SECTIONS)[1] for _ in range(3))
+            lines += [f"{i + 1}. {heading.upper()}", f"{i + 1}.1 {body}", f"{i + 1}.2 {filler}", ""]
+        path = os.path.join(directory, f"synthetic_{n + 1}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+        paths.append(path)
+    return paths
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_document(path: str, counter: UsageCounter) -> Dict[str, Dict[str, float]]:
+    """Run every stage once on `path` and return per-stage seconds, LLM calls and tokens."""
+    results = {}
+
+    def timed(stage, fn):
+        before = counter.snapshot()
+        start = time.perf_counter()
+        value = fn()
+        elapsed = time.perf_counter() - start
+        after = counter.snapshot()
+        results[stage] = {
+            "seconds": elapsed,
+            "llm_calls": after["calls"] - before["calls"],
+            "tokens": (after["prompt_tokens"] + after["completion_tokens"]) - (before["prompt_tokens"] + before["completion_tokens"]),
+        }
+        return value
+
+    text = timed("load_document", lambda: load_document(path))
+    timed("chunk_text", lambda: chunk_text(text, CONFIG.CHUNK_SIZE, CONFIG.CHUNK_OVERLAP))
+    clauses = merge_clause_chunks(timed("extract_clauses", lambda: extract_clauses(path)))
+    timed("classify_document", lambda: classify_document(text))
+    timed("analyze_clause_risks", lambda: analyze_clause_risks(clauses, CONFIG.RISK_ANALYZER_PATH))
+    timed("get_doc_summary", lambda: get_doc_summary(path))
+    graph = build_graph()
+    timed("graph_invoke", lambda: graph.invoke({"file_path": path}))
+    return results
+
+async def _ainvoke_all(graph, paths: List[str], concurrency: int):
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(path):
+        async with limit:
+            return await graph.ainvoke({"file_path": path})
+
+    return await asyncio.gather(*(one(p) for p in paths))
+
+def run_throughput(paths: List[str], concurrency: int, counter: UsageCounter, async_mode: bool = False) -> Dict[str, float]:
+    """
+    Invoke the full graph on every document, `concurrency` at a time: on worker
+    threads, or as coroutines on the shared event loop with async_mode.
+    """
+    graph = build_graph(async_mode=async_mode)
+    before = counter.snapshot()
+    start = time.perf_counter()
+    if async_mode:
+        run_sync(_ainvoke_all(graph, paths, concurrency))
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda p: graph.invoke({"file_path": p}), paths))
+    elapsed = time.perf_counter() - start
+    calls = counter.snapshot()["calls"] - before["calls"]
+    return {"concurrency": concurrency, "async": async_mode, "documents": len(paths), "seconds": elapsed,
+            "docs_per_second": len(paths) / elapsed if elapsed else 0.0,
+            "llm_calls_per_second": calls / elapsed if elapsed else 0.0}
+
+def summarize_runs(runs: List[Dict[str, Dict[str, float]]]) -> Dict[str, Dict[str, float]]:
+    report = {}
+    for stage in STAGES:
+        samples = [run[stage] for run in runs if stage in run]
+        seconds = [s["seconds"] for s in samples]
+        report[stage] = {
+            "p50_ms": percentile(seconds, 50) * 1000,
+            "p95_ms": percentile(seconds, 95) * 1000,
+            "llm_calls_per_doc": sum(s["llm_calls"] for s in samples) / len(samples) if samples else 0.0,
+            "tokens_per_doc": sum(s["tokens"] for s in samples) / len(samples) if samples else 0.0,
+        }
+    return report
+
+def compare(current: Dict, baseline_path: str):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\n📊 Comparison against {baseline_path}")
+    print(f"{'stage':<22}{'p50 Δ%':>10}{'p95 Δ%':>10}{'calls Δ':>10}{'tokens Δ':>12}")
+    for stage, now in current["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if not before:
+            continue
+        delta = lambda key: (now[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+        print(f"{stage:<22}{delta('p50_ms'):>9.1f}%{delta('p95_ms'):>9.1f}%"
+              f"{now['llm_calls_per_doc'] - before['llm_calls_per_doc']:>10.1f}"
+              f"{now['tokens_per_doc'] - before['tokens_per_doc']:>12.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the LexiAgent pipeline.")
+    parser.add_argument("--data-dir", default="data", help="Directory with sample PDFs")
+    parser.add_argument("--synthetic", type=int, default=5, help="Number of synthetic contracts to generate")
+    parser.add_argument("--sections", type=int, default=20, help="Sections per synthetic contract")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub LLM latency per call (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra uniform random latency (seconds)")
+    parser.add_argument("--repeats", type=int, default=1, help="Runs per document")
+    parser.add_argument("--concurrency", type=int, default=4, help="Worker threads for the throughput run (0 to skip)")
+    parser.add_argument("--async", dest="async_mode", action="store_true", help="Run the throughput pass on the async graph")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON report")
+    parser.add_argument("--compare", help="Previous JSON report to compare against")
+    args = parser.parse_args()
+
+    CONFIG.FAKE_LLM_LATENCY = args.latency
+    CONFIG.FAKE_LLM_LATENCY_JITTER = args.jitter
+    clear_model_cache()  # models are cached per process; rebuild them with the new latency
+    counter = UsageCounter()
+    register_llm_callback(counter)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = sorted(glob.glob(os.path.join(args.data_dir, "*.pdf")))
+        corpus += make_synthetic_corpus(tmp, args.synthetic, args.sections)
+        print(f"📂 Benchmarking {len(corpus)} documents x {args.repeats} repeats (stub latency {args.latency}s)")
+
+        runs = []
+        for path in corpus:
+            for _ in range(args.repeats):
+                runs.append(run_document(path, counter))
+            print(f"✅ {os.path.basename(path)}")
+
+        throughput = run_throughput(corpus, args.concurrency, counter, args.async_mode) if args.concurrency else None
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "settings": {"documents": len(corpus), "repeats": args.repeats, "latency": args.latency,
+                     "jitter": args.jitter, "chunk_size": CONFIG.CHUNK_SIZE, "chunk_overlap": CONFIG.CHUNK_OVERLAP,
+                     "clause_batch_mode": CONFIG.CLAUSE_BATCH_MODE},
+        "stages": summarize_runs(runs),
+        "throughput": throughput,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    print(f"\n{'stage':<22}{'p50 ms':>10}{'p95 ms':>10}{'calls/doc':>11}{'tokens/doc':>12}")
+    for stage, stats in report["stages"].items():
+        print(f"{stage:<22}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}"
+              f"{stats['llm_calls_per_doc']:>11.1f}{stats['tokens_per_doc']:>12.0f}")
+    if throughput:
+        print(f"\n🚀 Throughput: {throughput['docs_per_second']:.2f} docs/s at concurrency {throughput['concurrency']}"
+              f"{' (async)' if throughput['async'] else ''}")
+    print(f"🧠 Peak RSS: {report['peak_rss_mb']:.1f} MB")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Report written to {args.output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import os, re, sys, json, glob, time, resource, argparse, subprocess, tempfile
+import numpy as np
+from typing import Dict, List
+from config import config as CONFIG
+
+# Compares the torch (sentence-transformers) and ONNX int8 embedding backends. Each
+# backend runs in its own process so load time and peak RSS are measured cold.
+
+def sample_sentences(data_dir: str, limit: int) -> List[str]:
+    """Sentences from the sample documents (up to `limit`)."""
+    from document_loader import load_document
+    sentences = []
+    for path in sorted(glob.glob(os.path.join(data_dir, "*.pdf"))):
+        text = load_document(path) or ""
+        sentences += [s.strip() for s in re.split(r'(?<=[.!?])\s+', text) if len(s.split()) >= 4]
+    return sentences[:limit]
+
+def run_backend(backend: str, sentences_path: str, output_path: str, repeats: int) -> Dict:
+    """Load one backend, encode the sentences and report timings (runs in a child process)."""
+    with open(sentences_path, encoding="utf-8") as f:
+        sentences = json.load(f)
+    start = time.perf_counter()
+    if backend == "onnx":
+        from utils.onnx_embedding import load_onnx_embedding_model
+        model = load_onnx_embedding_model(CONFIG.EMBEDDING_MODEL_NAME)
+    else:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(CONFIG.EMBEDDING_MODEL_NAME, device="cpu")
+    load_seconds = time.perf_counter() - start
+    model.encode(sentences[:8], batch_size=CONFIG.EMBEDDING_ENCODE_BATCH_SIZE)  # warm-up
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        embeddings = model.encode(sentences, batch_size=CONFIG.EMBEDDING_ENCODE_BATCH_SIZE, convert_to_numpy=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    np.save(output_path, np.asarray(embeddings, dtype=np.float32))
+    return {
+        "backend": backend,
+        "load_seconds": round(load_seconds, 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),  # KiB on Linux
+        "sentences_per_second": round(len(sentences) / best, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare torch and ONNX int8 embedding backends.")
+    parser.add_argument("--data-dir", default="data", help="Directory with sample PDFs")
+    parser.add_argument("--sentences", type=int, default=512, help="Sentences to embed")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per backend (best is reported)")
+    parser.add_argument("--output", default="benchmark_embedding_results.json", help="Where to write the JSON report")
+    parser.add_argument("--worker", choices=["torch", "onnx"], help=argparse.SUPPRESS)
+    parser.add_argument("--sentences-file", help=argparse.SUPPRESS)
+    parser.add_argument("--embeddings-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_backend(args.worker, args.sentences_file, args.embeddings_file, args.repeats)))
+        return
+
+    sentences = sample_sentences(args.data_dir, args.sentences)
+    print(f"📂 Embedding {len(sentences)} sentences with {CONFIG.EMBEDDING_MODEL_NAME}")
+    with tempfile.TemporaryDirectory() as tmp:
+        sentences_file = os.path.join(tmp, "sentences.json")
+        with open(sentences_file, "w", encoding="utf-8") as f:
+            json.dump(sentences, f)
+        results, embeddings = [], {}
+        for backend in ("torch", "onnx"):
+            embeddings_file = os.path.join(tmp, f"{backend}.npy")
+            completed = subprocess.run(
+                [sys.executable, __file__, "--worker", backend, "--repeats", str(args.repeats),
+                 "--sentences-file", sentences_file, "--embeddings-file", embeddings_file],
+                capture_output=True, text=True, check=True,
+            )
+            results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+            embeddings[backend] = np.load(embeddings_file)
+
+    # Both backends L2-normalise, so the row-wise dot product is the cosine similarity
+    cosine = (embeddings["torch"] * embeddings["onnx"]).sum(axis=1)
+    agreement = {"min_cosine": round(float(cosine.min()), 4), "mean_cosine": round(float(cosine.mean()), 4),
+                 "tolerance": CONFIG.ONNX_MIN_COSINE, "within_tolerance": bool(cosine.min() >= CONFIG.ONNX_MIN_COSINE)}
+
+    print(f"\n{'backend':<10}{'load s':>9}{'peak RSS MB':>13}{'sent/s':>10}")
+    for r in results:
+        print(f"{r['backend']:<10}{r['load_seconds']:>9.2f}{r['peak_rss_mb']:>13.1f}{r['sentences_per_second']:>10.1f}")
+    status = "✅" if agreement["within_tolerance"] else "❌"
+    print(f"{status} Cosine similarity to torch embeddings: min {agreement['min_cosine']}, "
+          f"mean {agreement['mean_cosine']} (tolerance {CONFIG.ONNX_MIN_COSINE})")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "sentences": len(sentences),
+                   "backends": results, "agreement": agreement}, f, indent=2)
+    print(f"💾 Report written to {args.output}")
+    if not agreement["within_tolerance"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
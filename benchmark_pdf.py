@@ -0,0 +1,61 @@
+import os, re, json, glob, time, argparse
+from collections import Counter
+from typing import Dict, List
+from config import config as CONFIG
+from utils.pdf_engines import extract_pdf_text
+
+def word_overlap(a: str, b: str) -> float:
+    """Jaccard overlap of the two texts' word sets, a cheap check that no content was lost."""
+    words_a, words_b = set(re.findall(r'\w+', a.lower())), set(re.findall(r'\w+', b.lower()))
+    return len(words_a & words_b) / len(words_a | words_b) if words_a | words_b else 1.0
+
+def best_of(path: str, repeats: int, fast_engine: str):
+    """Fastest of `repeats` extractions (the first run also pays for imports and disk cache)."""
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        text, reports = extract_pdf_text(path, fast_engine=fast_engine)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, text, reports)
+    return best
+
+def benchmark_file(path: str, repeats: int) -> Dict:
+    layout_seconds, layout_text, _ = best_of(path, repeats, fast_engine="")
+    hybrid_seconds, hybrid_text, reports = best_of(path, repeats, fast_engine=CONFIG.PDF_FAST_ENGINE)
+    return {
+        "file": os.path.basename(path),
+        "pages": len(reports),
+        "layout_only_ms": round(layout_seconds * 1000, 1),
+        "hybrid_ms": round(hybrid_seconds * 1000, 1),
+        "speedup": round(layout_seconds / hybrid_seconds, 2) if hybrid_seconds else None,
+        "engines": dict(Counter(r["engine"] for r in reports)),
+        "fallback_reasons": dict(Counter(r["reason"] for r in reports if r["reason"])),
+        "word_overlap": round(word_overlap(layout_text, hybrid_text), 3),
+        "per_page": reports,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare layout-only and hybrid PDF text extraction.")
+    parser.add_argument("--data-dir", default="data", help="Directory with sample PDFs")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per engine setting (best is reported)")
+    parser.add_argument("--output", default="benchmark_pdf_results.json", help="Where to write the JSON report")
+    args = parser.parse_args()
+
+    paths: List[str] = sorted(glob.glob(os.path.join(args.data_dir, "*.pdf")))
+    print(f"📂 Benchmarking PDF extraction on {len(paths)} files (fast engine: {CONFIG.PDF_FAST_ENGINE or 'none'})")
+    results = [benchmark_file(path, args.repeats) for path in paths]
+
+    print(f"\n{'file':<45}{'pages':>6}{'layout ms':>11}{'hybrid ms':>11}{'speedup':>9}{'overlap':>9}  engines")
+    for r in results:
+        print(f"{r['file'][:44]:<45}{r['pages']:>6}{r['layout_only_ms']:>11.1f}{r['hybrid_ms']:>11.1f}"
+              f"{r['speedup'] or 0:>8.2f}x{r['word_overlap']:>9.3f}  {r['engines']}")
+        for reason, count in r["fallback_reasons"].items():
+            print(f"    ↳ {count} page(s) fell back: {reason}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "files": results}, f, indent=2)
+    print(f"💾 Report written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,60 @@
-import logging, json
-from typing import TypedDict, Annotated
+import json, uuid
+from typing import Any, Dict, List, Optional, TypedDict, Annotated
 from langgraph.graph import StateGraph, END, START
 from langchain_core.messages import ToolMessage
 from langchain.tools import Tool
 from langgraph.graph.message import add_messages
 from dotenv import load_dotenv
-from clause_extractor import get_clause_extracted
-from classify_documents import get_classified_doc
-from risk_detector import get_clause_risks
-from summarizer import get_doc_summary
-from utils.utils import configure_llm
+from clause_extractor import extract_clauses_from_document, merge_clause_chunks
+from classify_documents import classify_document
+from risk_detector import analyze_clause_risks
+from summarizer import summarize_chunks
+from config import config as CONFIG
+from utils.utils import configure_llm, invoke_llm
+from chat_memory import CHAT_CONTEXT, compact_tool_result, history_messages
+from utils import instrumentation
+from utils.logging_setup import get_logger
 
 # Load environment variables
 load_dotenv()
 
 # Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler("logs/langgraph.log"),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+logger = get_logger("chat_agent", "chat_agent.log")
 
 # --- Chatbot Agent and Tools ---
 
 # Define Chatbot State Schema
 class ChatState(TypedDict):
     messages: Annotated[list, add_messages]
-    file_path: str
+    document: Dict[str, Any]  # Parsed upload: {"name", "full_text", "chunks"}
+
+def _clauses(document: Dict[str, Any]) -> Dict[str, str]:
+    return merge_clause_chunks(extract_clauses_from_document(document["full_text"], document["chunks"]))
+
+def _risks(document: Dict[str, Any]) -> Dict[str, Any]:
+    risks, _ = analyze_clause_risks(_clauses(document), CONFIG.RISK_ANALYZER_PATH)
+    return risks
 
-# Chatbot Tools
+# Chatbot Tools. Each works on the parsed document held in the chat state.
 tools = [
     Tool(
         name="ClassifyDocument",
-        func=lambda file_path: get_classified_doc(file_path),
+        func=lambda document: classify_document(document["full_text"]),
         description="Classify the uploaded legal document as a specific type."
     ),
     Tool(
         name="ExtractClauses",
-        func=lambda file_path: get_clause_extracted(file_path),
+        func=_clauses,
         description="Extract clauses from the uploaded legal document."
     ),
     Tool(
         name="DetectRisks",
-        func=lambda file_path: get_clause_risks(file_path),
+        func=_risks,
         description="Detect risks in the uploaded legal document."
     ),
     Tool(
         name="SummarizeDocument",
-        func=lambda file_path: get_doc_summary(file_path),
+        func=lambda document: summarize_chunks(document["chunks"]),
         description="Summarize the uploaded legal document."
     ),
 ]
@@ -72,12 +75,15 @@ class ToolExecutor:
         for tool_call in last_message.tool_calls:
             tool_name = tool_call["name"]
             tool_args = tool_call.get("args", {})
-            file_path = state["file_path"]  # Pass file_path from state
+            document = state["document"]  # Pass the parsed document from state
             
             if tool_name in self.tools_by_name:
-                tool_result = self.tools_by_name[tool_name].invoke(file_path)
+                with instrumentation.span(f"chat.tool.{tool_name}"):
+                    tool_result = self.tools_by_name[tool_name].func(document)
+                # The model sees a compact rendering; the full result rides along as the artifact
                 tool_results.append(ToolMessage(
-                    content=json.dumps(tool_result),
+                    content=compact_tool_result(tool_name, tool_result),
+                    artifact=tool_result,
                     tool=tool_name,
                     tool_call_id=tool_call["id"]
                 ))
@@ -98,7 +104,8 @@ llm_with_tools = llm.bind_tools(tools)
 
 def chatbot(state: ChatState):
     """Handles AI response and tool calling."""
-    ai_response = llm_with_tools.invoke(state["messages"])
+    with instrumentation.span("chat.llm_step", messages=len(state["messages"])):
+        ai_response = invoke_llm(llm_with_tools, CHAT_CONTEXT.fit(state["messages"]))
     return {"messages": [ai_response]}
 
 # Add nodes to the graph
@@ -111,8 +118,12 @@ graph_builder.add_edge(START, "chatbot")
 # Compile the graph
 chat_graph = graph_builder.compile()
 
-def stream_chat_response(user_input: str, file_path: str) -> str:
-    """Streams chatbot responses and formats them for legal document analysis."""
+def stream_chat_response(user_input: str, document: Dict[str, Any], history: Optional[List[Dict[str, str]]] = None) -> str:
+    """
+    Streams chatbot responses and formats them for legal document analysis.
+    `document` is the parsed upload: {"name": ..., "full_text": ..., "chunks": [...]};
+    `history` holds earlier turns as {"role", "content"} dicts.
+    """
     messages = [
         {"role": "system", "content": (
             "You are LexiAgent, a professional AI-powered legal document assistant. "
@@ -124,17 +135,20 @@ def stream_chat_response(user_input: str, file_path: str) -> str:
             "Always respond in English."
         )}
     ]
+    messages.extend(history_messages(history))
     messages.append({"role": "user", "content": user_input})
 
     final_response = ""
-    for event in chat_graph.stream({"messages": messages, "file_path": file_path}):
+    with instrumentation.bind_context(chat_turn=uuid.uuid4().hex, document=document.get("name")):
+        events = list(chat_graph.stream({"messages": messages, "document": document}))
+    for event in events:
         for value in event.values():
             assistant_message = value["messages"][-1]
             if hasattr(assistant_message, "tool_calls") and assistant_message.tool_calls:
                 continue  # Skip intermediate tool call messages
             content = assistant_message.content
             if isinstance(assistant_message, ToolMessage):
-                tool_result = json.loads(content)
+                tool_result = assistant_message.artifact if assistant_message.artifact is not None else json.loads(content)
                 if assistant_message.tool == "ClassifyDocument":
                     final_response += "### 📄 Document Type\n"
                     final_response += f"- {tool_result}\n"
@@ -0,0 +1,167 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from langchain_core.messages import BaseMessage, SystemMessage
+from config import config as CONFIG
+from utils.utils import configure_llm, invoke_llm, estimate_tokens
+from utils import instrumentation
+from utils.logging_setup import get_logger
+
+# Setup logging
+logger = get_logger("chat_memory", "chat_agent.log")
+
+# Token-budgeted context for the chat agent. Tool results are compacted before they
+# enter the conversation, recent messages are kept verbatim and older ones are folded
+# into a running summary, so every LLM step's prompt stays under CONFIG.CHAT_CONTEXT_TOKENS.
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+def _clip(text: str, tokens: int) -> str:
+    limit = tokens * 4  # estimate_tokens counts ~4 characters per token
+    return text if len(text) <= limit else text[:limit].rstrip() + " …"
+
+def compact_tool_result(tool_name: str, result: Any) -> str:
+    """
+    What the model needs from a tool result, within CONFIG.CHAT_TOOL_RESULT_TOKENS:
+    found clauses only, risks and suggestions per clause, summary bullets.
+    """
+    budget = CONFIG.CHAT_TOOL_RESULT_TOKENS
+    if tool_name == "ExtractClauses" and isinstance(result, dict):
+        found = {c: v for c, v in result.items() if v and v != "Not Found"}
+        missing = [c for c in result if c not in found]
+        per_clause = max(20, budget // max(1, len(found)) - 8)
+        lines = [f"{c}: {_clip(v, per_clause)}" for c, v in found.items()]
+        if missing:
+            lines.append("Not found: " + ", ".join(missing))
+        text = "\n".join(lines)
+    elif tool_name == "DetectRisks" and isinstance(result, dict):
+        risks, suggestions = result.get("ambiguous_clauses", {}), result.get("suggestions", {})
+        per_clause = max(20, budget // max(1, len(risks) + len(suggestions)) - 8)
+        lines = [f"Risk - {c}: {_clip(v, per_clause)}" for c, v in risks.items()]
+        lines += [f"Suggestion - {c}: {_clip(v, per_clause)}" for c, v in suggestions.items()]
+        text = "\n".join(lines) or _clip(str(result.get("raw_response", "")), budget)
+    elif tool_name == "SummarizeDocument" and isinstance(result, str):
+        bullets = [line.strip() for line in result.split("\n") if line.strip().startswith("-")]
+        text = "\n".join(bullets) or result
+    elif isinstance(result, str):
+        text = result
+    else:
+        text = json.dumps(result)
+    return _clip(text, budget)
+
+def message_tokens(message: BaseMessage) -> int:
+    tokens = estimate_tokens(str(message.content)) + 4  # role and framing
+    if getattr(message, "tool_calls", None):
+        tokens += estimate_tokens(json.dumps(message.tool_calls, default=str))
+    return tokens
+
+class ChatContext:
+    """
+    Builds the prompt for one LLM step under a hard token budget. Summaries of
+    evicted messages are cached by prefix, so a long conversation is summarised
+    incrementally: each turn only folds the newly evicted messages into the summary.
+    """
+
+    def __init__(self, budget: int, recent_tokens: int, summary_tokens: int, cache_size: int = 256):
+        self.budget = budget
+        self.recent_tokens = recent_tokens
+        self.summary_tokens = summary_tokens
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _prefix_keys(messages: List[BaseMessage]) -> List[str]:
+        """Key of every prefix messages[:i + 1], computed with one running hash."""
+        digest, keys = hashlib.sha256(), []
+        for message in messages:
+            digest.update(f"{message.type}\0{message.content}\0".encode("utf-8"))
+            keys.append(digest.copy().hexdigest())
+        return keys
+
+    def _summarize(self, previous: Optional[str], messages: List[BaseMessage]) -> str:
+        transcript = "\n".join(f"{m.type}: {_clip(str(m.content), 300)}" for m in messages)
+        prompt = (
+            "Condense this conversation about a legal document into a short factual summary. "
+            "Keep facts about the document (type, clauses, risks), the user's questions and the answers given. "
+            f"At most {self.summary_tokens} tokens.\n\n"
+            + (f"Summary so far:\n{previous}\n\n" if previous else "")
+            + f"New messages:\n{transcript}\n\nSummary:"
+        )
+        try:
+            llm = configure_llm(MODEL_NAME=CONFIG.CHAT_SUMMARY_MODEL).bind(max_tokens=self.summary_tokens)
+            summary = str(invoke_llm(llm, prompt).content).strip()
+        except Exception as e:
+            # Fall back to an extractive summary: the start of every evicted message
+            logger.warning("⚠️ Conversation summary failed (%s); keeping message openings instead", e)
+            summary = "\n".join(filter(None, [previous] + [f"{m.type}: {_clip(str(m.content), 40)}" for m in messages]))
+        return _clip(summary, self.summary_tokens)
+
+    def summary_of(self, messages: List[BaseMessage]) -> str:
+        """Summary of `messages`, extending the longest already-summarised prefix."""
+        keys = self._prefix_keys(messages)
+        with self._lock:
+            done = next((i for i in range(len(keys) - 1, -1, -1) if keys[i] in self._summaries), None)
+            previous = self._summaries[keys[done]] if done is not None else None
+        if done == len(keys) - 1:
+            return previous
+        summary = self._summarize(previous, messages[(done + 1) if done is not None else 0:])
+        with self._lock:
+            self._summaries[keys[-1]] = summary
+            while len(self._summaries) > self._cache_size:
+                self._summaries.popitem(last=False)
+        return summary
+
+    def _split(self, conversation: List[BaseMessage]) -> int:
+        """Index where the verbatim tail starts: as many recent messages as recent_tokens allows."""
+        used, start = 0, len(conversation)
+        while start > 0 and (start == len(conversation) or used + message_tokens(conversation[start - 1]) <= self.recent_tokens):
+            start -= 1
+            used += message_tokens(conversation[start])
+        # Tool results must follow the assistant message that requested them
+        while 0 < start < len(conversation) and conversation[start].type == "tool":
+            start -= 1
+        return start
+
+    def _enforce(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """Truncate the largest messages (never the system prompt) until the budget holds."""
+        messages = list(messages)
+        while sum(message_tokens(m) for m in messages) > self.budget:
+            index = max(range(1, len(messages)), key=lambda i: message_tokens(messages[i]), default=None)
+            if index is None:
+                break
+            excess = sum(message_tokens(m) for m in messages) - self.budget
+            keep = max(16, message_tokens(messages[index]) - excess - 8)
+            if keep >= message_tokens(messages[index]) - 4:
+                break  # nothing left worth cutting
+            messages[index] = messages[index].model_copy(update={"content": _clip(str(messages[index].content), keep)})
+        return messages
+
+    def fit(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """The messages to send for one LLM step, within the token budget."""
+        total = sum(message_tokens(m) for m in messages)
+        if total <= self.budget:
+            instrumentation.observe("lexi_chat_prompt_tokens", total)
+            return messages
+
+        system = [m for m in messages[:1] if m.type == "system"]
+        conversation = messages[len(system):]
+        start = self._split(conversation)
+        fitted = system + conversation[start:]
+        if start:
+            fitted.insert(len(system), SystemMessage(content=SUMMARY_PREFIX + self.summary_of(conversation[:start])))
+        fitted = self._enforce(fitted)
+        tokens = sum(message_tokens(m) for m in fitted)
+        logger.info("🧠 Chat context %s -> %s tokens (%s messages summarised, %s kept verbatim)",
+                    total, tokens, start, len(conversation) - start)
+        instrumentation.observe("lexi_chat_prompt_tokens", tokens)
+        return fitted
+
+CHAT_CONTEXT = ChatContext(CONFIG.CHAT_CONTEXT_TOKENS, CONFIG.CHAT_RECENT_TOKENS, CONFIG.CHAT_SUMMARY_TOKENS)
+
+def history_messages(history: Optional[List[Dict[str, str]]]) -> List[Dict[str, str]]:
+    """Earlier chat turns ({"role", "content"} dicts, e.g. Streamlit's history) for the graph input."""
+    return [{"role": m["role"], "content": m["content"]} for m in history or []
+            if m.get("role") in ("user", "assistant") and m.get("content")]
@@ -1,21 +1,16 @@
-import os
-import logging
 import re
+import asyncio
 from typing import Optional
-from utils.utils import configure_llm, load_prompt_template
+from utils.utils import (configure_llm, load_prompt_template, invoke_llm, ainvoke_llm, stream_until, astream_until,
+                         estimate_tokens, invoke_structured, ainvoke_structured)
+from utils.model_router import route, aroute, cascade
+from schemas import DocumentClassification
 from document_loader import load_document
 from config import config as CONFIG
+from utils.logging_setup import get_logger
 
 # Setup logging
-os.makedirs("logs", exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler("logs/document_classifier.log"),
-        logging.StreamHandler()
-    ]
-)
+logger = get_logger("classify_documents", "document_classifier.log")
 
 # Category mapping for numeric to text conversion
 CATEGORY_MAPPING = {
@@ -38,7 +33,7 @@ CATEGORY_MAPPING = {
 
 def parse_llm_response(response: str) -> Optional[str]:
     """
-    Parse Qwen-QwQ-32B response to extract only the document type, ignoring reasoning and tags.
+    Parse a classifier response to extract only the document type, ignoring reasoning and tags.
     Converts numeric outputs to category names using CATEGORY_MAPPING.
     """
     try:
@@ -47,54 +42,137 @@ def parse_llm_response(response: str) -> Optional[str]:
         # Clean up any remaining tags or whitespace
         response = response.strip()
 
-        # Check if response is numeric (e.g., "1")
-        if response in CATEGORY_MAPPING:
-            return CATEGORY_MAPPING[response]
+        # Check if response is numeric (e.g., "1" or "1.")
+        match = re.fullmatch(r'(\d{1,2})[.)]?', response)
+        if match and match.group(1) in CATEGORY_MAPPING:
+            return CATEGORY_MAPPING[match.group(1)]
         
         # Check if response is a valid category name
         if response in CATEGORY_MAPPING.values():
             return response
         
         # Log unexpected response
-        logging.warning(f"⚠️ Unexpected response format: {response}")
+        logger.warning("⚠️ Unexpected response format: %s", response)
         return None
     except Exception as e:
-        logging.error(f"❌ Error parsing response: {e}")
+        logger.error("❌ Error parsing response: %s", e)
         return None
 
-def classify_document(text: str) -> Optional[str]:
-    try:
-        # Load prompt template
-        prompt_template = load_prompt_template(CONFIG.DOC_CLASSIFICATION_PATH)
-        # Ensure text is truncated to avoid exceeding token limits
-        prompt = prompt_template.replace("{text}", text.strip()[:CONFIG.MAX_TEXT_LIMIT])
-        # Reinforce concise output
+def build_classification_prompt(text: str, fast: bool = False) -> str:
+    # Load prompt template
+    prompt_template = load_prompt_template(CONFIG.DOC_CLASSIFICATION_PATH)
+    # Ensure text is truncated to avoid exceeding token limits
+    prompt = prompt_template.replace("{text}", text.strip()[:CONFIG.MAX_TEXT_LIMIT])
+    # Reinforce concise output
+    if fast:
+        prompt += "\nStrictly output only the category number (1-15), nothing else."
+    else:
         prompt += "\nStrictly output only the document type (e.g., 'Non Disclosure Agreement') as a single phrase, no numbers, no tags, no explanation."
+    return prompt
+
+def category_complete(text: str) -> bool:
+    """True once a streamed answer holds a whole category id (or name), so reading can stop."""
+    match = re.match(r'\s*(\d{1,2})(\D|$)', text)
+    if match:
+        # A lone "1" may still become 10-15
+        return bool(match.group(2)) or match.group(1) != "1"
+    return text.strip() in CATEGORY_MAPPING.values()
 
-        logging.info("🔍 Sending document to LLM for classification...")
+def _fast_llm(model: str):
+    # A category id needs a couple of tokens; reasoning is switched off where the model allows it
+    return configure_llm(MODEL_NAME=model).bind(max_tokens=CONFIG.CLASSIFICATION_MAX_TOKENS,
+                                                **CONFIG.NO_REASONING_KWARGS.get(model, {}))
+
+def _log_result(result: Optional[str]) -> Optional[str]:
+    if result:
+        logger.info("✅ Classification result: %s", result)
+    else:
+        logger.warning("⚠️ No valid classification found in response")
+    return result
 
-        # Initialize Groq LLM with Qwen-QwQ-32B
-        llm = configure_llm(MODEL_NAME="qwen-qwq-32b")
+def _valid_category(result: Optional[str]) -> Optional[str]:
+    return None if result in CATEGORY_MAPPING.values() else "unrecognised category"
 
-        # Get LLM response
-        response = llm.invoke(prompt)
-        result = parse_llm_response(response.content.strip())
+STRUCTURED_SUFFIX = '\nRespond with a JSON object only: {"category": "<document type>"}'
 
-        if result:
-            logging.info(f"✅ Classification result: {result}")
-            return result
-        else:
-            logging.warning("⚠️ No valid classification found in response")
-            return None
+def _structured_category(parsed) -> Optional[str]:
+    return parse_llm_response(str(parsed["category"])) if parsed else None
 
+def classify_structured(text: str) -> Optional[str]:
+    """Non-streaming JSON-mode classification with the stage's strongest model."""
+    try:
+        prompt = build_classification_prompt(text) + STRUCTURED_SUFFIX
+        llm = configure_llm(MODEL_NAME=cascade("classification")[-1])
+        parsed, _ = invoke_structured(llm, prompt, DocumentClassification, stage="classification")
+        return _structured_category(parsed)
+    except Exception as e:
+        logger.error("❌ Structured classification failed: %s", e)
+        return None
+
+async def aclassify_structured(text: str) -> Optional[str]:
+    """Async variant of classify_structured."""
+    try:
+        prompt = build_classification_prompt(text) + STRUCTURED_SUFFIX
+        llm = configure_llm(MODEL_NAME=cascade("classification")[-1])
+        parsed, _ = await ainvoke_structured(llm, prompt, DocumentClassification, stage="classification")
+        return _structured_category(parsed)
     except Exception as e:
-        logging.error(f"❌ Error during classification: {e}")
+        logger.error("❌ Structured classification failed: %s", e)
         return None
 
+def classify_document(text: str) -> Optional[str]:
+    try:
+        fast = CONFIG.CLASSIFICATION_FAST_MODE
+        prompt = build_classification_prompt(text, fast)
+        logger.info("🔍 Sending document to LLM for classification...")
+
+        def attempt(model: str):
+            if fast:
+                response = stream_until(_fast_llm(model), prompt, category_complete).strip()
+            else:
+                response = invoke_llm(configure_llm(MODEL_NAME=model), prompt).content.strip()
+            return parse_llm_response(response), estimate_tokens(prompt), estimate_tokens(response)
+
+        # Cheapest model first; escalate when the answer is not a known category
+        result = route("classification", attempt, _valid_category)
+        if _valid_category(result) is None:
+            return _log_result(result)
+        logger.warning("⚠️ No valid category from the classification cascade; retrying with a structured call")
+
+    except Exception as e:
+        logger.error("❌ Error during classification: %s; retrying with a structured call", e)
+    return _log_result(classify_structured(text))
+
+async def aclassify_document(text: str) -> Optional[str]:
+    try:
+        fast = CONFIG.CLASSIFICATION_FAST_MODE
+        prompt = build_classification_prompt(text, fast)
+        logger.info("🔍 Sending document to LLM for classification...")
+
+        async def attempt(model: str):
+            if fast:
+                response = (await astream_until(_fast_llm(model), prompt, category_complete)).strip()
+            else:
+                response = (await ainvoke_llm(configure_llm(MODEL_NAME=model), prompt)).content.strip()
+            return parse_llm_response(response), estimate_tokens(prompt), estimate_tokens(response)
+
+        result = await aroute("classification", attempt, _valid_category)
+        if _valid_category(result) is None:
+            return _log_result(result)
+        logger.warning("⚠️ No valid category from the classification cascade; retrying with a structured call")
+
+    except Exception as e:
+        logger.error("❌ Error during classification: %s; retrying with a structured call", e)
+    return _log_result(await aclassify_structured(text))
+
 def get_classified_doc(file: str) -> Optional[str]:
     text = load_document(file)
     return classify_document(text)
 
+async def aget_classified_doc(file: str) -> Optional[str]:
+    text = await asyncio.to_thread(load_document, file)
+    return await aclassify_document(text)
+
 if __name__ == "__main__":
     # Sample test
     result = get_classified_doc(CONFIG.FILE_PATH)
@@ -1,92 +1,347 @@
-import os
-import logging
-import json
 import re
-from typing import Dict, Optional, List
+import json
+import asyncio
+import time
+import hashlib
+from typing import Dict, Optional, List, Tuple, Type
 from collections import defaultdict
-from utils.utils import configure_llm, load_prompt_template
+from utils.utils import configure_llm, load_prompt_template, invoke_structured, ainvoke_structured, estimate_tokens, PARSE_STATS
+from pydantic import BaseModel
+from schemas import ClauseExtraction, ClauseBatchExtraction, clause_subset_schemas
 from document_loader import load_and_chunk
 from config import config as CONFIG
+from utils.checkpoints import get_chunk_cache
+from utils.model_router import cascade, log_decision
+from section_parser import structural_extraction
+from utils.logging_setup import get_logger, SAMPLED
 
 # Setup logging
-os.makedirs("logs", exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler("logs/clause_extractor.log"),
-        logging.StreamHandler()
-    ]
-)
-
-def fix_json_string(json_string: str) -> str:
-    """
-    Fix malformed JSON by removing <think> tags and extracting valid JSON content.
-    """
+logger = get_logger("clause_extractor", "clause_extractor.log")
+
+def extract_clauses_from_chunk(chunk: str, prompt_template: str, llm, schema: Type[BaseModel] = ClauseExtraction) -> Optional[Dict[str, str]]:
     try:
-        # Remove <think> tags and their content
-        json_string = re.sub(r'<think>.*?</think>', '', json_string, flags=re.DOTALL)
-        # Remove any leading/trailing non-JSON text
-        json_string = re.sub(r'^[^\{]*', '', json_string)
-        json_string = re.sub(r'[^\}]*$', '', json_string)
-        # Ensure proper JSON structure
-        json_string = json_string.strip()
-        if not json_string.startswith('{'):
-            json_string = '{' + json_string
-        if not json_string.endswith('}'):
-            json_string = json_string + '}'
-        return json_string
+        prompt = prompt_template.replace("{text}", chunk.strip())
+        logger.info("🔹 Sending chunk to LLM for clause extraction...", extra=SAMPLED)
+        clauses, raw = invoke_structured(llm, prompt, schema, stage="clause_extraction", exclude_unset=True)
+        logger.debug("Raw LLM response for chunk: %.500s", raw, extra=SAMPLED)
+        return clauses
     except Exception as e:
-        logging.error(f"❌ Error fixing JSON string: {e}")
-        return json_string
+        logger.error("❌ Error in extracting clauses from chunk: %s", e)
+        return None
+
+async def aextract_clauses_from_chunk(chunk: str, prompt_template: str, llm, schema: Type[BaseModel] = ClauseExtraction) -> Optional[Dict[str, str]]:
+    try:
+        prompt = prompt_template.replace("{text}", chunk.strip())
+        logger.info("🔹 Sending chunk to LLM for clause extraction...", extra=SAMPLED)
+        clauses, raw = await ainvoke_structured(llm, prompt, schema, stage="clause_extraction", exclude_unset=True)
+        logger.debug("Raw LLM response for chunk: %.500s", raw, extra=SAMPLED)
+        return clauses
+    except Exception as e:
+        logger.error("❌ Error in extracting clauses from chunk: %s", e)
+        return None
+
+def requested_clauses(clauses: Optional[List[str]] = None) -> Tuple[str, ...]:
+    """The required clauses to extract, in config order (all of them by default)."""
+    return tuple(c for c in CONFIG.REQUIRED_CLAUSES if clauses is None or c in clauses)
+
+def restrict_prompt(prompt_template: str, clauses: Tuple[str, ...]) -> str:
+    """Drop the required clauses outside `clauses` from a template's numbered list and JSON format."""
+    lines, number = [], 0
+    for line in prompt_template.splitlines():
+        listed = re.fullmatch(r'\d+\. (.+)', line.strip())
+        keyed = re.fullmatch(r'\s*"(.+)": "\.\.\.",?', line)
+        name = listed.group(1) if listed else keyed.group(1) if keyed else None
+        if name in CONFIG.REQUIRED_CLAUSES and name not in clauses:
+            continue
+        if listed:
+            number += 1
+            line = f"{number}. {name}"
+        lines.append(line)
+    # The last key of each JSON block must not end with a comma
+    for i, line in enumerate(lines):
+        if re.fullmatch(r'\s*".+": "\.\.\.",?', line):
+            following = lines[i + 1] if i + 1 < len(lines) else ""
+            comma = "," if re.fullmatch(r'\s*".+": "\.\.\.",?', following) else ""
+            lines[i] = line.rstrip(",") + comma
+    return "\n".join(lines)
+
+def _extraction_setup(clauses: Tuple[str, ...]) -> Tuple[str, str, Type[BaseModel], Type[BaseModel]]:
+    """Single and batch prompt templates and schemas asking only for `clauses`."""
+    single_template = load_prompt_template(CONFIG.CLAUSE_EXTRACTION_PROMPT_PATH)
+    batch_template = load_prompt_template(CONFIG.CLAUSE_EXTRACTION_BATCH_PROMPT_PATH)
+    if clauses == requested_clauses():
+        return single_template, batch_template, ClauseExtraction, ClauseBatchExtraction
+    single_schema, batch_schema = clause_subset_schemas(clauses)
+    return restrict_prompt(single_template, clauses), restrict_prompt(batch_template, clauses), single_schema, batch_schema
+
+def batch_chunks(chunks: List[str], prompt_template: str, token_budget: int, max_chunks: int) -> List[List[int]]:
+    """
+    Group chunk indexes into batches whose prompt (template + labelled chunks)
+    stays within `token_budget` tokens and holds at most `max_chunks` chunks.
+    """
+    overhead = estimate_tokens(prompt_template)
+    batches, current, current_tokens = [], [], overhead
+    for i, chunk in enumerate(chunks):
+        chunk_tokens = estimate_tokens(chunk) + 4  # label line
+        if current and (current_tokens + chunk_tokens > token_budget or len(current) >= max_chunks):
+            batches.append(current)
+            current, current_tokens = [], overhead
+        current.append(i)
+        current_tokens += chunk_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def _batch_prompt(chunks: List[str], indexes: List[int], prompt_template: str) -> str:
+    labelled = "\n\n".join(f"[chunk_{i}]\n{chunks[i].strip()}" for i in indexes)
+    return prompt_template.replace("{chunks}", labelled)
 
-def parse_json_safely(json_string: str, chunk_index: int) -> Optional[Dict]:
+def _batch_results(parsed: Optional[Dict], indexes: List[int]) -> Dict[int, Dict[str, str]]:
+    if parsed is None:
+        return {}
+    results = parsed.get("chunks", {})
+    return {i: results[f"chunk_{i}"] for i in indexes if f"chunk_{i}" in results}
+
+def extract_clauses_from_batch(chunks: List[str], indexes: List[int], prompt_template: str, llm,
+                               schema: Type[BaseModel] = ClauseBatchExtraction) -> Dict[int, Dict[str, str]]:
     """
-    Parse JSON string, attempting to fix malformed JSON if necessary.
+    Extract clauses for several chunks with one request.
+
+    Returns:
+        Mapping of chunk index to its clause dict. Chunks the model left out are missing.
     """
     try:
-        return json.loads(json_string)
-    except json.JSONDecodeError:
-        logging.warning(f"⚠️ Chunk {chunk_index+1} returned invalid JSON. Attempting to fix...")
-        try:
-            fixed_json = fix_json_string(json_string)
-            return json.loads(fixed_json)
-        except Exception as e:
-            logging.error(f"❌ JSON fix failed for chunk {chunk_index+1}: {e}")
-            return None
-
-def extract_clauses_from_chunk(chunk: str, prompt_template: str, llm) -> Optional[str]:
+        prompt = _batch_prompt(chunks, indexes, prompt_template)
+        logger.info("🔹 Sending batch of %s chunks to LLM for clause extraction...", len(indexes), extra=SAMPLED)
+        parsed, raw = invoke_structured(llm, prompt, schema, stage="clause_extraction_batch", exclude_unset=True)
+        logger.debug("Raw LLM response for batch: %.500s", raw, extra=SAMPLED)
+        return _batch_results(parsed, indexes)
+    except Exception as e:
+        logger.error("❌ Error in extracting clauses from batch: %s", e)
+        return {}
+
+async def aextract_clauses_from_batch(chunks: List[str], indexes: List[int], prompt_template: str, llm,
+                                      schema: Type[BaseModel] = ClauseBatchExtraction) -> Dict[int, Dict[str, str]]:
     try:
-        prompt = prompt_template.replace("{text}", chunk.strip())
-        logging.info("🔹 Sending chunk to LLM for clause extraction...")
-        response = llm.invoke(prompt)
-        content = response.content if hasattr(response, "content") else response
-        logging.debug(f"Raw LLM response for chunk: {content}")
-        return content
+        prompt = _batch_prompt(chunks, indexes, prompt_template)
+        logger.info("🔹 Sending batch of %s chunks to LLM for clause extraction...", len(indexes), extra=SAMPLED)
+        parsed, raw = await ainvoke_structured(llm, prompt, schema, stage="clause_extraction_batch", exclude_unset=True)
+        logger.debug("Raw LLM response for batch: %.500s", raw, extra=SAMPLED)
+        return _batch_results(parsed, indexes)
     except Exception as e:
-        logging.error(f"❌ Error in extracting clauses from chunk: {e}")
-        return None
+        logger.error("❌ Error in extracting clauses from batch: %s", e)
+        return {}
+
+def extract_clauses_batched(chunks: List[str], llm, clauses: Tuple[str, ...] = ()) -> Dict[int, Dict[str, str]]:
+    """
+    Batched extraction: several labelled chunks per request, with per-chunk
+    fallback for any chunk the batch answer did not cover.
+
+    Returns:
+        Mapping of chunk index to its clause dict; chunks that failed are missing.
+    """
+    single_template, batch_template, single_schema, batch_schema = _extraction_setup(clauses or requested_clauses())
+    batches = batch_chunks(chunks, batch_template, CONFIG.CLAUSE_BATCH_TOKEN_BUDGET, CONFIG.CLAUSE_BATCH_MAX_CHUNKS)
+    logger.info("📦 Packed %s chunks into %s extraction requests", len(chunks), len(batches))
+
+    results: Dict[int, Dict[str, str]] = {}
+    for batch in batches:
+        results.update(extract_clauses_from_batch(chunks, batch, batch_template, llm, batch_schema))
+
+    missing = [i for i in range(len(chunks)) if i not in results]
+    for i in missing:
+        logger.warning("⚠️ Chunk %s missing from batch answer. Re-extracting it alone...", i + 1)
+        extracted = extract_clauses_from_chunk(chunks[i], single_template, llm, single_schema)
+        if extracted:
+            results[i] = extracted
+
+    return results
+
+async def aextract_clauses_batched(chunks: List[str], llm, clauses: Tuple[str, ...] = ()) -> Dict[int, Dict[str, str]]:
+    """Async variant of extract_clauses_batched; all batches are in flight at once."""
+    single_template, batch_template, single_schema, batch_schema = _extraction_setup(clauses or requested_clauses())
+    batches = batch_chunks(chunks, batch_template, CONFIG.CLAUSE_BATCH_TOKEN_BUDGET, CONFIG.CLAUSE_BATCH_MAX_CHUNKS)
+    logger.info("📦 Packed %s chunks into %s extraction requests", len(chunks), len(batches))
 
-def extract_clauses(file_path: str) -> List[str]:
+    results: Dict[int, Dict[str, str]] = {}
+    for batch_result in await asyncio.gather(*(aextract_clauses_from_batch(chunks, b, batch_template, llm, batch_schema) for b in batches)):
+        results.update(batch_result)
+
+    missing = [i for i in range(len(chunks)) if i not in results]
+    if missing:
+        logger.warning("⚠️ Chunks %s missing from batch answers. Re-extracting them alone...", [i + 1 for i in missing])
+    retried = await asyncio.gather(*(aextract_clauses_from_chunk(chunks[i], single_template, llm, single_schema) for i in missing))
+    results.update({i: extracted for i, extracted in zip(missing, retried) if extracted})
+
+    return results
+
+def _extract_indexed(chunks: List[str], llm, clauses: Tuple[str, ...]) -> Dict[int, Dict[str, str]]:
+    if CONFIG.CLAUSE_BATCH_MODE:
+        return extract_clauses_batched(chunks, llm, clauses)
+    prompt_template, _, schema, _ = _extraction_setup(clauses)
+    results = {}
+    for i, chunk in enumerate(chunks):
+        logger.info("📄 Processing chunk %s/%s...", i + 1, len(chunks), extra=SAMPLED)
+        extracted = extract_clauses_from_chunk(chunk, prompt_template, llm, schema)
+        if extracted:
+            results[i] = extracted
+    return results
+
+async def _aextract_indexed(chunks: List[str], llm, clauses: Tuple[str, ...]) -> Dict[int, Dict[str, str]]:
+    if CONFIG.CLAUSE_BATCH_MODE:
+        return await aextract_clauses_batched(chunks, llm, clauses)
+    prompt_template, _, schema, _ = _extraction_setup(clauses)
+    extracted = await asyncio.gather(*(aextract_clauses_from_chunk(c, prompt_template, llm, schema) for c in chunks))
+    return {i: result for i, result in enumerate(extracted) if result}
+
+def _clause_issue(clauses: Optional[Dict[str, str]], requested: Tuple[str, ...]) -> Optional[str]:
+    """Why a chunk's answer should go to a larger model, or None when it is complete."""
+    if not clauses:
+        return "no answer"
+    missing = [c for c in requested if clauses.get(c) is None]
+    return f"missing {len(missing)} clause keys" if missing else None
+
+def _split_accepted(results: Dict[int, Dict[str, str]], pending: List[int], last: bool,
+                    requested: Tuple[str, ...]) -> Tuple[Dict[int, Dict[str, str]], List[int]]:
+    """
+    Split one cascade level's answers (keyed by position in `pending`) into accepted
+    results keyed by chunk index and the chunk indexes to escalate.
+    """
+    accepted, escalate = {}, []
+    for j, i in enumerate(pending):
+        clauses = results.get(j)
+        if _clause_issue(clauses, requested) is None or (last and clauses):
+            accepted[i] = clauses
+        elif not last:
+            escalate.append(i)
+    return accepted, escalate
+
+def _log_level(model: str, chunks: List[str], pending: List[int], accepted: Dict[int, Dict[str, str]], escalate: List[int], start: float):
+    prompt_tokens = sum(estimate_tokens(chunks[i]) for i in pending)
+    completion_tokens = estimate_tokens(json.dumps(list(accepted.values())))
+    log_decision("clause_extraction", model, len(accepted), len(escalate), time.perf_counter() - start,
+                 prompt_tokens, completion_tokens, "incomplete clause answers" if escalate else None)
+
+def _extract_with_cascade(chunks: List[str], pending: List[int], clauses: Tuple[str, ...]) -> Dict[int, Dict[str, str]]:
+    """
+    Extract `pending` chunks with the cheapest model first; only chunks whose answer
+    is incomplete are re-extracted by the next model of the cascade.
+    """
+    models = cascade("clause_extraction")
+    fresh: Dict[int, Dict[str, str]] = {}
+    for level, model in enumerate(models):
+        if not pending:
+            break
+        start = time.perf_counter()
+        extracted = _extract_indexed([chunks[i] for i in pending], configure_llm(MODEL_NAME=model), clauses)
+        accepted, escalate = _split_accepted(extracted, pending, level == len(models) - 1, clauses)
+        _log_level(model, chunks, pending, accepted, escalate, start)
+        fresh.update(accepted)
+        pending = escalate
+    return fresh
+
+async def _aextract_with_cascade(chunks: List[str], pending: List[int], clauses: Tuple[str, ...]) -> Dict[int, Dict[str, str]]:
+    models = cascade("clause_extraction")
+    fresh: Dict[int, Dict[str, str]] = {}
+    for level, model in enumerate(models):
+        if not pending:
+            break
+        start = time.perf_counter()
+        extracted = await _aextract_indexed([chunks[i] for i in pending], configure_llm(MODEL_NAME=model), clauses)
+        accepted, escalate = _split_accepted(extracted, pending, level == len(models) - 1, clauses)
+        _log_level(model, chunks, pending, accepted, escalate, start)
+        fresh.update(accepted)
+        pending = escalate
+    return fresh
+
+def _cache_namespace(clauses: Tuple[str, ...]) -> str:
+    # A different cascade, prompt or clause subset must not reuse old answers
+    single_template, batch_template, _, _ = _extraction_setup(clauses)
+    prompts = single_template + batch_template
+    return f"clause_extraction:{'>'.join(cascade('clause_extraction'))}:{hashlib.sha256(prompts.encode('utf-8')).hexdigest()[:16]}"
+
+def _cached_results(chunks: List[str], clauses: Tuple[str, ...]) -> Tuple[Dict[int, Dict[str, str]], List[int]]:
+    cache = get_chunk_cache()
+    cached = cache.get_many(_cache_namespace(clauses), chunks) if cache else {}
+    if cached:
+        logger.info("♻️ Reusing cached clause extraction for %s/%s chunks", len(cached), len(chunks))
+    return cached, [i for i in range(len(chunks)) if i not in cached]
+
+def _finish_extraction(chunks: List[str], results: Dict[int, Dict[str, str]], fresh: Dict[int, Dict[str, str]], strict: bool,
+                       clauses: Tuple[str, ...]) -> List[Dict[str, str]]:
+    cache = get_chunk_cache()
+    if cache:
+        cache.put_many(_cache_namespace(clauses), {chunks[i]: extracted for i, extracted in fresh.items()})
+    results.update(fresh)
+
+    logger.info("✅ All chunks processed for clause extraction.")
+    logger.info("📊 Clause extraction parse-failure rates: %s", PARSE_STATS.report())
+    missing = [i + 1 for i in range(len(chunks)) if i not in results]
+    if strict and missing:
+        # Completed chunks are cached, so a retry only re-extracts these
+        raise RuntimeError(f"Clause extraction failed for chunks {missing}")
+    # Keep document order so merge_clause_chunks prefers earlier chunks
+    return [results[i] for i in sorted(results)]
+
+def extract_clauses_from_chunks(chunks: List[str], strict: bool = False, clauses: Optional[List[str]] = None) -> List[Dict[str, str]]:
+    """
+    Extract clauses from every chunk, reusing cached per-chunk results. `clauses`
+    limits the prompt and schema to those required clauses (all by default).
+    With strict=True a chunk that could not be extracted raises instead of being skipped.
+    """
+    requested = requested_clauses(clauses)
+    results, pending = _cached_results(chunks, requested)
+    fresh = _extract_with_cascade(chunks, pending, requested) if pending else {}
+    return _finish_extraction(chunks, results, fresh, strict, requested)
+
+async def aextract_clauses_from_chunks(chunks: List[str], strict: bool = False, clauses: Optional[List[str]] = None) -> List[Dict[str, str]]:
+    requested = requested_clauses(clauses)
+    results, pending = _cached_results(chunks, requested)
+    fresh = await _aextract_with_cascade(chunks, pending, requested) if pending else {}
+    return _finish_extraction(chunks, results, fresh, strict, requested)
+
+def _structural_first(full_text: str, chunks: List[str]) -> Tuple[List[Dict[str, str]], List[str], List[str]]:
+    """Rule-based outputs, the chunks that still need the LLM and the clauses still unresolved."""
+    if not CONFIG.CLAUSE_RULES_ENABLED:
+        return [], chunks, list(CONFIG.REQUIRED_CLAUSES)
+    resolved, remaining = structural_extraction(full_text, chunks)
+    unresolved = [c for c in CONFIG.REQUIRED_CLAUSES if resolved.get(c) in (None, "", "Not Found")]
+    if remaining and not unresolved:
+        logger.info("⏭️ Every required clause resolved from headings; skipping LLM extraction of %s chunks", len(remaining))
+        remaining = []
+    return ([resolved] if resolved else []), remaining, unresolved
+
+def extract_clauses_from_document(full_text: str, chunks: List[str], strict: bool = False) -> List[Dict[str, str]]:
+    """
+    Clauses resolved from the document's headings first, then LLM extraction of only
+    the chunks outside those sections, asking only for the clauses still unresolved.
+    The rule-based result comes first, so merge_clause_chunks prefers it.
+    """
+    outputs, remaining, unresolved = _structural_first(full_text, chunks)
+    return outputs + (extract_clauses_from_chunks(remaining, strict, unresolved) if remaining else [])
+
+async def aextract_clauses_from_document(full_text: str, chunks: List[str], strict: bool = False) -> List[Dict[str, str]]:
+    outputs, remaining, unresolved = _structural_first(full_text, chunks)
+    return outputs + (await aextract_clauses_from_chunks(remaining, strict, unresolved) if remaining else [])
+
+def extract_clauses(file_path: str) -> List[Dict[str, str]]:
     try:
-        logging.info(f"📂 Loading and chunking document: {file_path}")
-        _, chunks = load_and_chunk(file_path)
-        
-        prompt_template = load_prompt_template(CONFIG.CLAUSE_EXTRACTION_PROMPT_PATH)
-        llm = configure_llm(MODEL_NAME="meta-llama/llama-4-maverick-17b-128e-instruct")
-        
-        all_extracted_clauses = []
-        for i, chunk in enumerate(chunks):
-            logging.info(f"📄 Processing chunk {i+1}/{len(chunks)}...")
-            clauses = extract_clauses_from_chunk(chunk, prompt_template, llm)
-            if clauses:
-                all_extracted_clauses.append(clauses)
-        
-        logging.info("✅ All chunks processed for clause extraction.")
-        return all_extracted_clauses
+        logger.info("📂 Loading and chunking document: %s", file_path)
+        full_text, chunks = load_and_chunk(file_path)
+        return extract_clauses_from_document(full_text, chunks)
     
     except Exception as e:
-        logging.exception(f"❌ Failed to extract clauses from document: {e}")
+        logger.exception("❌ Failed to extract clauses from document: %s", e)
+        return []
+
+async def aextract_clauses(file_path: str) -> List[Dict[str, str]]:
+    try:
+        logger.info("📂 Loading and chunking document: %s", file_path)
+        full_text, chunks = await asyncio.to_thread(load_and_chunk, file_path)
+        return await aextract_clauses_from_document(full_text, chunks)
+
+    except Exception as e:
+        logger.exception("❌ Failed to extract clauses from document: %s", e)
         return []
 
 def merge_clause_chunks(chunk_outputs: List[Dict[str, str]]) -> Dict[str, str]:
@@ -100,24 +355,20 @@ def merge_clause_chunks(chunk_outputs: List[Dict[str, str]]) -> Dict[str, str]:
                 final_clauses[clause] = value
 
     # Initialize all required clauses with "Not Found" if missing
-    required_clauses = [
-        "Termination Clause", "Confidentiality Clause", "Governing Law", "Payment Terms",
-        "Liability Clause", "Force Majeure", "Dispute Resolution", "Indemnification Clause",
-        "Intellectual Property", "Amendment Clause"
-    ]
-    for clause in required_clauses:
+    for clause in CONFIG.REQUIRED_CLAUSES:
         if clause not in final_clauses or not final_clauses[clause]:
             final_clauses[clause] = "Not Found"
 
     return dict(final_clauses)
 
 def get_clause_extracted(file_path: str) -> Dict[str, str]:
-    extracted = extract_clauses(file_path)
-    parsed_results = [parse_json_safely(text, idx) for idx, text in enumerate(extracted)]
-    merged_clauses = merge_clause_chunks([res for res in parsed_results if res])
+    merged_clauses = merge_clause_chunks(extract_clauses(file_path))
     
     return merged_clauses
 
+async def aget_clause_extracted(file_path: str) -> Dict[str, str]:
+    return merge_clause_chunks(await aextract_clauses(file_path))
+
 # Sample Test
 if __name__ == "__main__":
     merged_clauses = get_clause_extracted(CONFIG.FILE_PATH)
@@ -1,42 +1,217 @@
 import os
-import logging
 from dotenv import load_dotenv
+from utils.logging_setup import get_logger
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Logging configuration
-os.makedirs(os.path.join("..", "logs"), exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(os.path.join("..", "logs", "config.log")),
-        logging.StreamHandler()
-    ]
-)
+logger = get_logger("config", "config.log")
 
 try:
     # API Keys (Keep them private using .env)
     GROQ_API_KEY = os.getenv("GROK_API_KEY")
 except:
-    logging.error("❌ API KEYS not found or not set.")
+    logger.error("❌ API KEYS not found or not set.")
+
+try:
+    # LLM backend: "groq" (hosted API) or "fake" (deterministic in-process stand-in)
+    LLM_BACKEND = os.getenv("LEXI_LLM_BACKEND", "groq").lower()
+    # Append every prompt/response pair to this JSONL file (replayable by the fake backend)
+    LLM_RECORD_PATH = os.getenv("LEXI_LLM_RECORD_PATH")
+    FAKE_LLM_RECORDINGS_PATH = os.getenv("LEXI_FAKE_LLM_RECORDINGS")
+    FAKE_LLM_LATENCY = float(os.getenv("LEXI_FAKE_LLM_LATENCY", "0.0"))
+    FAKE_LLM_LATENCY_JITTER = float(os.getenv("LEXI_FAKE_LLM_LATENCY_JITTER", "0.0"))
+    FAKE_LLM_ERROR_RATE = float(os.getenv("LEXI_FAKE_LLM_ERROR_RATE", "0.0"))
+    FAKE_LLM_SEED = int(os.getenv("LEXI_FAKE_LLM_SEED", "0"))
+    # Pause between graph nodes to stay under hosted rate limits (not needed offline)
+    RATE_LIMIT_PAUSE = float(os.getenv("LEXI_RATE_LIMIT_PAUSE", "0" if LLM_BACKEND == "fake" else "3"))
+    # Per-stage timing/token instrumentation (JSON lines + Prometheus text endpoint)
+    INSTRUMENTATION_ENABLED = os.getenv("LEXI_INSTRUMENTATION", "false").lower() == "true"
+    METRICS_JSONL_PATH = os.path.join("logs", "metrics.jsonl")
+    METRICS_PORT = int(os.getenv("LEXI_METRICS_PORT", "0"))  # 0 disables /metrics
+    # Upper bound on in-flight LLM requests per event loop for the async pipeline
+    MAX_CONCURRENT_LLM_CALLS = int(os.getenv("LEXI_MAX_CONCURRENT_LLM_CALLS", "16"))
+    # Call policy (utils/call_policy.py): timeout, retries with jittered backoff,
+    # per-model circuit breaker and optional hedging of straggling requests
+    LLM_TIMEOUT = float(os.getenv("LEXI_LLM_TIMEOUT", "60"))  # 0 disables
+    LLM_MAX_RETRIES = int(os.getenv("LEXI_LLM_MAX_RETRIES", "3"))
+    LLM_BACKOFF_BASE = float(os.getenv("LEXI_LLM_BACKOFF_BASE", "1.0"))
+    LLM_BACKOFF_MAX = float(os.getenv("LEXI_LLM_BACKOFF_MAX", "30.0"))
+    LLM_BREAKER_THRESHOLD = int(os.getenv("LEXI_LLM_BREAKER_THRESHOLD", "5"))
+    LLM_BREAKER_RESET_SECONDS = float(os.getenv("LEXI_LLM_BREAKER_RESET_SECONDS", "30"))
+    LLM_HEDGING_ENABLED = os.getenv("LEXI_LLM_HEDGING", "false").lower() == "true"
+    LLM_HEDGE_PERCENTILE = float(os.getenv("LEXI_LLM_HEDGE_PERCENTILE", "95"))
+    LLM_HEDGE_MIN_DELAY = float(os.getenv("LEXI_LLM_HEDGE_MIN_DELAY", "2.0"))
+    LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LEXI_LLM_HEDGE_MIN_SAMPLES", "20"))
+    # Worker threads for hedged requests (unhedged calls run on the caller's thread)
+    LLM_POLICY_THREADS = int(os.getenv("LEXI_LLM_POLICY_THREADS", "64"))
+except Exception as e:
+    logger.error("❌ Error loading LLM backend settings: %s", e)
+
+try:
+    # Model cascades per stage (utils/model_router.py): the first model is tried first
+    # and its answer validated; only failures escalate to the next, larger model
+    # Fast classification: answer with a category id only, reasoning switched off,
+    # a few output tokens and the stream closed as soon as a valid id arrives
+    CLASSIFICATION_FAST_MODE = os.getenv("LEXI_FAST_CLASSIFICATION", "true").lower() == "true"
+    CLASSIFICATION_MAX_TOKENS = int(os.getenv("LEXI_CLASSIFICATION_MAX_TOKENS", "4"))
+    # Request options that disable or hide reasoning traces, per model
+    NO_REASONING_KWARGS = {
+        "qwen/qwen3-32b": {"reasoning_effort": "none"},
+    }
+    MODEL_CASCADES = {
+        # qwen3-32b can turn reasoning off entirely; qwq-32b always thinks before answering
+        "classification": ["llama-3.1-8b-instant", "qwen/qwen3-32b" if CLASSIFICATION_FAST_MODE else "qwen-qwq-32b"],
+        "clause_extraction": ["meta-llama/llama-4-scout-17b-16e-instruct", "meta-llama/llama-4-maverick-17b-128e-instruct"],
+        "risk_analysis": ["meta-llama/llama-4-scout-17b-16e-instruct"],
+        "summarization": ["meta-llama/llama-4-scout-17b-16e-instruct"],
+        "document_summary": ["llama-3.1-8b-instant", "meta-llama/llama-4-scout-17b-16e-instruct"],
+    }
+    # e.g. LEXI_CASCADE_CLASSIFICATION="qwen-qwq-32b" pins a stage to one model
+    for _stage in MODEL_CASCADES:
+        if os.getenv(f"LEXI_CASCADE_{_stage.upper()}"):
+            MODEL_CASCADES[_stage] = [m.strip() for m in os.getenv(f"LEXI_CASCADE_{_stage.upper()}").split(",") if m.strip()]
+    # Approximate list prices in USD per million (input, output) tokens, for cost logging
+    MODEL_PRICES = {
+        "llama-3.1-8b-instant": (0.05, 0.08),
+        "meta-llama/llama-4-scout-17b-16e-instruct": (0.11, 0.34),
+        "meta-llama/llama-4-maverick-17b-128e-instruct": (0.20, 0.60),
+        "qwen-qwq-32b": (0.29, 0.39),
+        "qwen/qwen3-32b": (0.29, 0.59),
+    }
+except Exception as e:
+    logger.error("❌ Error loading model cascades: %s", e)
+
+try:
+    # Checkpointed graph runs (one LangGraph thread per document and analysis settings,
+    # see utils/checkpoints.thread_key) and cached per-chunk extraction results, so
+    # failed analyses resume instead of restarting
+    CHECKPOINTING_ENABLED = os.getenv("LEXI_CHECKPOINTING", "true").lower() == "true"
+    CHECKPOINT_DB_PATH = os.getenv("LEXI_CHECKPOINT_DB", os.path.join("cache", "checkpoints.sqlite"))
+    # Attempts per analysis; each retry resumes from the last completed node
+    GRAPH_MAX_ATTEMPTS = int(os.getenv("LEXI_GRAPH_MAX_ATTEMPTS", "3"))
+    GRAPH_RETRY_BACKOFF = float(os.getenv("LEXI_GRAPH_RETRY_BACKOFF", "2.0"))
+except Exception as e:
+    logger.error("❌ Error loading checkpoint settings: %s", e)
+
+try:
+    # Headless analysis service (service.py)
+    SERVICE_HOST = os.getenv("LEXI_SERVICE_HOST", "0.0.0.0")
+    SERVICE_PORT = int(os.getenv("LEXI_SERVICE_PORT", "8080"))
+    SERVICE_WORKERS = int(os.getenv("LEXI_SERVICE_WORKERS", "4"))
+    # Jobs waiting for a worker; further uploads get 503 until the queue drains
+    SERVICE_QUEUE_SIZE = int(os.getenv("LEXI_SERVICE_QUEUE_SIZE", "32"))
+    # Queued + running jobs allowed per tenant (X-Tenant header); further uploads get 429
+    SERVICE_TENANT_MAX_JOBS = int(os.getenv("LEXI_SERVICE_TENANT_MAX_JOBS", "4"))
+    # Estimated LLM calls admitted across all queued and running jobs
+    SERVICE_LLM_BUDGET = int(os.getenv("LEXI_SERVICE_LLM_BUDGET", "400"))
+    SERVICE_MAX_UPLOAD_MB = int(os.getenv("LEXI_SERVICE_MAX_UPLOAD_MB", "20"))
+    # Finished jobs kept for polling before the oldest are forgotten
+    SERVICE_MAX_FINISHED_JOBS = int(os.getenv("LEXI_SERVICE_MAX_FINISHED_JOBS", "1000"))
+except Exception as e:
+    logger.error("❌ Error loading service settings: %s", e)
+
+try:
+    # Near-duplicate detection (dedup.py): MinHash over word shingles with an LSH index;
+    # a new upload this similar to an analysed document reuses its analysis
+    DEDUP_ENABLED = os.getenv("LEXI_DEDUP", "true").lower() == "true"
+    DEDUP_THRESHOLD = float(os.getenv("LEXI_DEDUP_THRESHOLD", "0.8"))
+    DEDUP_NUM_PERM = int(128)
+    DEDUP_BANDS = int(16)
+    DEDUP_SHINGLE_SIZE = int(5)
+    DEDUP_MIN_WORDS = int(50)
+    # Share of a clause's word 3-grams that must appear in its document for the clause
+    # to count as quoted and be tracked into later versions (dedup.py); carry-over
+    # itself requires an exact match outside the changed chunks (versioning.py)
+    REVISION_UNCHANGED_CONTAINMENT = float(os.getenv("LEXI_REVISION_CONTAINMENT", "0.9"))
+    # Share of chunks that may change before a revision's document summary is
+    # recomputed from all chunks instead of revised from the changed ones
+    REVISION_RESUMMARIZE_FRACTION = float(os.getenv("LEXI_REVISION_RESUMMARIZE_FRACTION", "0.5"))
+    ANALYSIS_STORE_PATH = os.getenv("LEXI_ANALYSIS_STORE", os.path.join("cache", "analyses.sqlite"))
+except Exception as e:
+    logger.error("❌ Error loading near-duplicate settings: %s", e)
+
+try:
+    # Results store (results_store.py): every finished analysis, queryable across the corpus
+    RESULTS_STORE_ENABLED = os.getenv("LEXI_RESULTS_STORE", "true").lower() == "true"
+    RESULTS_STORE_PATH = os.getenv("LEXI_RESULTS_STORE_PATH", os.path.join("cache", "results.sqlite"))
+    # Analyses written per transaction, and the longest a queued analysis waits for a batch
+    RESULTS_BATCH_SIZE = int(50)
+    RESULTS_FLUSH_SECONDS = float(1.0)
+except Exception as e:
+    logger.error("❌ Error loading results store settings: %s", e)
+
+try:
+    # PDF text extraction (utils/pdf_engines.py): a fast text-layer engine per page,
+    # with full layout analysis only for pages that fail the quality checks
+    PDF_FAST_ENGINE = os.getenv("LEXI_PDF_FAST_ENGINE", "pdfium")  # empty: layout engine only
+    PDF_LAYOUT_ENGINE = os.getenv("LEXI_PDF_LAYOUT_ENGINE", "pdfplumber")
+    PDF_MIN_PAGE_CHARS = int(os.getenv("LEXI_PDF_MIN_PAGE_CHARS", "20"))
+    PDF_MAX_BAD_CHAR_RATIO = float(os.getenv("LEXI_PDF_MAX_BAD_CHAR_RATIO", "0.02"))
+    # Share of lines that look like table cells or column fragments before a page needs layout analysis
+    PDF_MAX_FRAGMENT_LINE_RATIO = float(os.getenv("LEXI_PDF_MAX_FRAGMENT_LINE_RATIO", "0.35"))
+except Exception as e:
+    logger.error("❌ Error loading PDF engine settings: %s", e)
+
+try:
+    # Chat agent context (chat_memory.py): hard prompt budget per LLM step. Recent
+    # messages are kept verbatim up to CHAT_RECENT_TOKENS, older ones are summarised.
+    CHAT_CONTEXT_TOKENS = int(os.getenv("LEXI_CHAT_CONTEXT_TOKENS", "3000"))
+    CHAT_RECENT_TOKENS = int(os.getenv("LEXI_CHAT_RECENT_TOKENS", "1800"))
+    CHAT_SUMMARY_TOKENS = int(250)
+    # Tool results are compacted to this size before they enter the conversation
+    CHAT_TOOL_RESULT_TOKENS = int(600)
+    CHAT_SUMMARY_MODEL = os.getenv("LEXI_CHAT_SUMMARY_MODEL", "llama-3.1-8b-instant")
+except Exception as e:
+    logger.error("❌ Error loading chat context settings: %s", e)
+
+try:
+    # Embeddings
+    EMBEDDING_ENCODE_BATCH_SIZE = int(32)
+    EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+    # "torch" (sentence-transformers) or "onnx" (utils/onnx_embedding.py: exported graph
+    # with int8 dynamic quantization on ONNX Runtime, no PyTorch at serving time)
+    EMBEDDING_BACKEND = os.getenv("LEXI_EMBEDDING_BACKEND", "torch").lower()
+    ONNX_MODEL_DIR = os.getenv("LEXI_ONNX_MODEL_DIR", os.path.join("cache", "onnx"))
+    ONNX_QUANTIZED = os.getenv("LEXI_ONNX_QUANTIZED", "true").lower() == "true"
+    ONNX_THREADS = int(os.getenv("LEXI_ONNX_THREADS", "0"))  # 0: ONNX Runtime default
+    # Lowest cosine similarity to the torch embeddings accepted by benchmark_embedding.py
+    ONNX_MIN_COSINE = float(0.99)
+except Exception as e:
+    logger.error("❌ Error loading embedding settings: %s", e)
 
 try:
     CLAUSE_EXTRACTION_PROMPT_PATH = os.path.join("prompts", "clause_extraction.txt")
+    CLAUSE_EXTRACTION_BATCH_PROMPT_PATH = os.path.join("prompts", "clause_extraction_batch.txt")
     RISK_ANALYZER_PATH = os.path.join("prompts", "risk_analysis.txt")
     DOC_CLASSIFICATION_PATH = os.path.join("prompts", "document_classification.txt")
     DOC_SUMMARIZER_PATH = os.path.join("prompts", "summarization.txt")
     FILE_PATH = os.path.join("data", "Example-One-Way-Non-Disclosure-Agreement.pdf")
 except FileNotFoundError as f:
-    logging.error(f"❌ {f.filename} not found.")
+    logger.error("❌ %s not found.", f.filename)
 try:
     # Constants
     CHUNK_SIZE = int(1000)
     CHUNK_OVERLAP = int(200)
     # MODEL_NAME = ["qwen-qwq-32b", "meta-llama/llama-4-maverick-17b-128e-instruct"]
     MAX_TEXT_LIMIT = int(3000)
+    # Batched clause extraction: pack several chunks into one request up to a token budget
+    CLAUSE_BATCH_MODE = os.getenv("LEXI_CLAUSE_BATCH_MODE", "true").lower() == "true"
+    CLAUSE_BATCH_TOKEN_BUDGET = int(4000)
+    CLAUSE_BATCH_MAX_CHUNKS = int(6)
+    # Resolve clauses from section headings before asking the LLM (section_parser.py)
+    CLAUSE_RULES_ENABLED = os.getenv("LEXI_CLAUSE_RULES", "true").lower() == "true"
+    RULE_CLAUSE_MAX_CHARS = int(1500)
+    # Uploaded files the Streamlit analyzer processes at the same time
+    ANALYZER_MAX_PARALLEL_FILES = int(os.getenv("LEXI_ANALYZER_MAX_PARALLEL_FILES", "3"))
+    # Clauses every extraction is normalised to (missing ones become "Not Found")
+    REQUIRED_CLAUSES = [
+        "Termination Clause", "Confidentiality Clause", "Governing Law", "Payment Terms",
+        "Liability Clause", "Force Majeure", "Dispute Resolution", "Indemnification Clause",
+        "Intellectual Property", "Amendment Clause"
+    ]
 except Exception as e:
-    logging.error(f"❌ Error loading Constants: {str(e)}")
+    logger.error("❌ Error loading Constants: %s", e)
 
-logging.info("✅ Configuration Loaded Successfully.")
\ No newline at end of file
+logger.info("✅ Configuration Loaded Successfully.")
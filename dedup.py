@@ -0,0 +1,212 @@
+import os
+import re
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+from config import config as CONFIG
+from utils import instrumentation
+from utils.logging_setup import get_logger
+
+# Near-duplicate detection for template documents. Every finished analysis is stored
+# with a MinHash signature of its word shingles; an LSH index over the signatures
+# finds a previously analysed near-duplicate of a new upload in well under a
+# millisecond, and its results are reused so only the differing text goes to the LLM
+# (see versioning.py). Analyses are scoped per tenant: a document is only ever
+# matched against earlier analyses of the same tenant.
+
+logger = get_logger("dedup", "dedup.log")
+
+_MERSENNE = (1 << 61) - 1
+_rng = np.random.RandomState(1)  # fixed seed: signatures must be comparable across processes
+_A = _rng.randint(1, 1 << 32, size=CONFIG.DEDUP_NUM_PERM, dtype=np.uint64)
+_B = _rng.randint(0, 1 << 32, size=CONFIG.DEDUP_NUM_PERM, dtype=np.uint64)
+
+def normalize(text: str) -> str:
+    return " ".join(re.findall(r'\w+', text.lower()))
+
+def text_hash(text: str) -> str:
+    """Hash of a text after normalising case, punctuation and whitespace."""
+    return hashlib.sha1(normalize(text).encode("utf-8")).hexdigest()
+
+def shingles(text: str, size: int) -> Set[int]:
+    """CRC32 of every run of `size` consecutive words."""
+    words = normalize(text).split()
+    if len(words) < size:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))} if words else set()
+    return {zlib.crc32(" ".join(words[i:i + size]).encode("utf-8")) for i in range(len(words) - size + 1)}
+
+def minhash(text: str) -> np.ndarray:
+    """MinHash signature of the document's word shingles (CONFIG.DEDUP_NUM_PERM values)."""
+    values = np.fromiter(shingles(text, CONFIG.DEDUP_SHINGLE_SIZE), dtype=np.uint64)
+    signature = np.full(CONFIG.DEDUP_NUM_PERM, np.iinfo(np.uint64).max, dtype=np.uint64)
+    # (a * x + b) mod p per permutation; a, x < 2**32 so the product cannot overflow.
+    # Blocks keep the shingles x permutations matrix small on long documents.
+    for start in range(0, values.size, 4096):
+        hashed = (np.outer(values[start:start + 4096], _A) + _B) % _MERSENNE
+        np.minimum(signature, (hashed & np.uint64(0xFFFFFFFF)).min(axis=0), out=signature)
+    return signature
+
+def _too_short(text: str) -> bool:
+    # Near-empty texts (e.g. scans without a text layer) would all look alike
+    return len(normalize(text).split()) < CONFIG.DEDUP_MIN_WORDS
+
+def containment(value: str, text_shingles: Set[int]) -> float:
+    """Share of `value`'s word 3-grams found in a text's 3-gram set."""
+    value_shingles = shingles(value, 3)
+    return len(value_shingles & text_shingles) / len(value_shingles) if value_shingles else 0.0
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+class MinHashLSH:
+    """
+    Banded LSH over MinHash signatures: documents sharing any whole band are
+    candidates. With 16 bands of 8 rows, pairs above ~0.7 Jaccard are almost always found.
+    """
+
+    def __init__(self, bands: int):
+        self.bands = bands
+        self.rows = CONFIG.DEDUP_NUM_PERM // bands
+        self._buckets: Dict[Tuple[int, bytes], Set[str]] = defaultdict(set)
+        self.signatures: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def _keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def insert(self, key: str, signature: np.ndarray):
+        with self._lock:
+            self.signatures[key] = signature
+            for band_key in self._keys(signature):
+                self._buckets[band_key].add(key)
+
+    def query(self, signature: np.ndarray, threshold: float) -> Optional[Tuple[str, float]]:
+        """Most similar indexed document at or above `threshold`, or None."""
+        with self._lock:
+            candidates = set().union(*(self._buckets.get(k, ()) for k in self._keys(signature)))
+            scored = [(key, similarity(signature, self.signatures[key])) for key in candidates]
+        scored = [pair for pair in scored if pair[1] >= threshold]
+        return max(scored, key=lambda pair: pair[1]) if scored else None
+
+class AnalysisStore:
+    """Finished analyses keyed by tenant and normalised text hash, with their MinHash signatures."""
+
+    FIELDS = ["doc_type", "clauses", "risks", "clause_summary", "doc_summary", "chunk_hashes"]
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(analyses)")]
+            if columns and "tenant" not in columns:
+                # Stores from before tenant scoping: their analyses belong to the default tenant
+                self._conn.execute("ALTER TABLE analyses RENAME TO analyses_unscoped")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS analyses ("
+                "tenant TEXT NOT NULL, hash TEXT NOT NULL, name TEXT, signature BLOB NOT NULL, result TEXT NOT NULL, "
+                "created REAL NOT NULL, PRIMARY KEY (tenant, hash))"
+            )
+            if columns and "tenant" not in columns:
+                self._conn.execute("INSERT INTO analyses SELECT '', hash, name, signature, result, created FROM analyses_unscoped")
+                self._conn.execute("DROP TABLE analyses_unscoped")
+
+    def put(self, tenant: str, key: str, name: str, signature: np.ndarray, result: Dict[str, Any]):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?, ?, ?)",
+                               (tenant, key, name, signature.tobytes(), json.dumps(result), time.time()))
+
+    def get(self, tenant: str, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT name, result FROM analyses WHERE tenant = ? AND hash = ?", (tenant, key)).fetchone()
+        if row is None:
+            return None
+        return {"name": row[0], **json.loads(row[1])}
+
+    def signatures(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT tenant, hash, signature FROM analyses").fetchall()
+        for tenant, key, blob in rows:
+            yield tenant, key, np.frombuffer(blob, dtype=np.uint64)
+
+_lock = threading.Lock()
+_store: Optional[AnalysisStore] = None
+_indexes: Optional[Dict[str, MinHashLSH]] = None
+
+def get_index(tenant: str = "") -> Tuple[AnalysisStore, MinHashLSH]:
+    """Process-wide store and `tenant`'s LSH index (all loaded from the store on first use)."""
+    global _store, _indexes
+    with _lock:
+        if _indexes is None:
+            _store = AnalysisStore(CONFIG.ANALYSIS_STORE_PATH)
+            _indexes = defaultdict(lambda: MinHashLSH(CONFIG.DEDUP_BANDS))
+            count = 0
+            for owner, key, signature in _store.signatures():
+                _indexes[owner].insert(key, signature)
+                count += 1
+            logger.info("🗂️ Loaded %s analysed documents of %s tenants into the near-duplicate index", count, len(_indexes))
+        return _store, _indexes[tenant]
+
+def find_near_duplicate(full_text: str, tenant: str = "") -> Optional[Tuple[Dict[str, Any], float]]:
+    """
+    A stored analysis of a near-duplicate of `full_text` among `tenant`'s analyses,
+    with its estimated Jaccard similarity, or None.
+    """
+    if not CONFIG.DEDUP_ENABLED or _too_short(full_text):
+        return None
+    try:
+        _, index = get_index(tenant)
+        signature = minhash(full_text)
+        start = time.perf_counter()
+        match = index.query(signature, CONFIG.DEDUP_THRESHOLD)
+        instrumentation.observe("lexi_dedup_lookup_seconds", time.perf_counter() - start)
+        if match is None:
+            return None
+        record = get_analysis(match[0], tenant)
+        if record is None:
+            return None
+        logger.info("🪞 Near-duplicate of %s (similarity %.2f)", record.get("name"), match[1])
+        instrumentation.increment("lexi_dedup_hits_total")
+        return record, match[1]
+    except Exception as e:
+        logger.error("❌ Near-duplicate lookup failed: %s", e)
+        return None
+
+def remember_analysis(name: str, full_text: str, chunks: List[str], state: Dict[str, Any], tenant: str = ""):
+    """Store a finished analysis so later near-duplicates of the same tenant can reuse it."""
+    if not CONFIG.DEDUP_ENABLED or _too_short(full_text):
+        return
+    try:
+        store, index = get_index(tenant)
+        key, signature = text_hash(full_text), minhash(full_text)
+        result = {field: state.get(field) for field in AnalysisStore.FIELDS}
+        result["chunk_hashes"] = [text_hash(chunk) for chunk in chunks]
+        # Clauses quoted (near-)verbatim can be tracked into later versions of the text
+        text_shingles = shingles(full_text, 3)
+        result["verbatim_clauses"] = [clause for clause, value in (state.get("clauses") or {}).items()
+                                      if containment(value, text_shingles) >= CONFIG.REVISION_UNCHANGED_CONTAINMENT]
+        store.put(tenant, key, name, signature, result)
+        index.insert(key, signature)
+    except Exception as e:
+        logger.error("❌ Failed to store analysis of %s: %s", name, e)
+
+def get_analysis(key: str, tenant: str = "") -> Optional[Dict[str, Any]]:
+    """`tenant`'s stored analysis of the document whose text_hash is `key`, or None."""
+    try:
+        store, _ = get_index(tenant)
+        record = store.get(tenant, key)
+        if record is not None:
+            record["hash"] = key
+        return record
+    except Exception as e:
+        logger.error("❌ Failed to read stored analysis %s: %s", key, e)
+        return None
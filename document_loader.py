@@ -1,73 +1,92 @@
-import os, docx, pdfplumber, logging, warnings
-from typing import List
+import io, os, docx, warnings
+from typing import BinaryIO, List, Optional, Tuple, Union
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from config import config as CONFIG
+from utils import instrumentation
+from utils.pdf_engines import extract_pdf_text
+from utils.logging_setup import get_logger
 
 warnings.filterwarnings(action="ignore")
 
 # Setup logging
-os.makedirs("logs", exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler("logs/document_classifier.log"),
-        logging.StreamHandler()
-    ]
-)
+logger = get_logger("document_loader", "document_loader.log")
 
-def load_pdf(file_path: str) -> str:
+# A document can be a path on disk, the raw bytes of an upload, or a binary file-like object
+Source = Union[str, bytes, BinaryIO]
+
+def _describe(source: Source, file_name: Optional[str] = None) -> str:
+    if isinstance(source, str):
+        return source
+    return file_name or getattr(source, "name", None) or "<in-memory document>"
+
+def _as_stream(source: Source) -> Union[str, BinaryIO]:
+    """Paths and file-like objects pass through; bytes are wrapped in a stream."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return source
+
+def load_pdf(file_path: Source) -> str:
     try:
-        text = ""
-        with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                extracted = page.extract_text()
-                if extracted:
-                    text += extracted + "\n"
-        logging.info(f"✅ PDF loaded successfully: {file_path}")
+        source = file_path if isinstance(file_path, str) else _as_stream(file_path).read()
+        text, _ = extract_pdf_text(source)
+        logger.info("✅ PDF loaded successfully: %s", _describe(file_path))
         return text
     except Exception as e:
-        logging.error(f"❌ Failed to load PDF file: {file_path}. Error: {e}")
+        logger.error("❌ Failed to load PDF file: %s. Error: %s", _describe(file_path), e)
         raise
 
-def load_docx(file_path: str) -> str:
+def load_docx(file_path: Source) -> str:
     try:
-        doc = docx.Document(file_path)
+        doc = docx.Document(_as_stream(file_path))
         text = "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
-        logging.info(f"✅ DOCX loaded successfully: {file_path}")
+        logger.info("✅ DOCX loaded successfully: %s", _describe(file_path))
         return text
     except Exception as e:
-        logging.error(f"❌ Failed to load DOCX file: {file_path}. Error: {e}")
+        logger.error("❌ Failed to load DOCX file: %s. Error: %s", _describe(file_path), e)
         raise
 
-def load_txt(file_path: str) -> str:
+def load_txt(file_path: Source) -> str:
     try:
-        with open(file_path, "r", encoding="utf-8") as file:
-            content = file.read()
-        logging.info(f"✅ TXT loaded successfully: {file_path}")
+        if isinstance(file_path, str):
+            with open(file_path, "r", encoding="utf-8") as file:
+                content = file.read()
+        else:
+            content = _as_stream(file_path).read()
+            if isinstance(content, bytes):
+                content = content.decode("utf-8")
+        logger.info("✅ TXT loaded successfully: %s", _describe(file_path))
         return content
     except Exception as e:
-        logging.error(f"❌ Failed to load TXT file: {file_path}. Error: {e}")
+        logger.error("❌ Failed to load TXT file: %s. Error: %s", _describe(file_path), e)
         raise
 
-def load_document(file_path: str) -> str:
-    if not os.path.exists(file_path):
-        logging.error(f"⛔ File not found: {file_path}")
+def load_document(file_path: Source, file_name: Optional[str] = None) -> str:
+    """
+    Load a PDF, DOCX or TXT document from a path, bytes or a binary file-like object.
+    For bytes and streams the format is taken from `file_name` (or the stream's `name`).
+    """
+    if isinstance(file_path, str) and not os.path.exists(file_path):
+        logger.error("⛔ File not found: %s", file_path)
         raise FileNotFoundError(f"⛔ File not found: {file_path}")
 
-    ext = os.path.splitext(file_path)[-1].lower()
+    ext = os.path.splitext(_describe(file_path, file_name))[-1].lower()
     try:
-        if ext == ".pdf":
-            return load_pdf(file_path)
-        elif ext == ".docx":
-            return load_docx(file_path)
-        elif ext == ".txt":
-            return load_txt(file_path)
-        else:
-            logging.error(f"⛔ Unsupported file format: {ext}")
-            raise ValueError(f"⛔ Unsupported file format {ext}")
+        with instrumentation.span("load_document", format=ext) as span:
+            if ext == ".pdf":
+                text = load_pdf(file_path)
+            elif ext == ".docx":
+                text = load_docx(file_path)
+            elif ext == ".txt":
+                text = load_txt(file_path)
+            else:
+                logger.error("⛔ Unsupported file format: %s", ext)
+                raise ValueError(f"⛔ Unsupported file format {ext}")
+            span.set(characters=len(text))
+            return text
     except Exception as e:
-        logging.exception(f"❌ Error loading document: {file_path}")
+        logger.exception("❌ Error loading document: %s", _describe(file_path, file_name))
         raise
 
 def chunk_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
@@ -77,20 +96,22 @@ def chunk_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
             chunk_overlap=chunk_overlap,
             length_function=len
         )
-        chunks = splitter.split_text(text=text)
-        logging.info(f"✅ Text chunked into {len(chunks)} chunks with size={chunk_size}, overlap={chunk_overlap}")
+        with instrumentation.span("chunk_text") as span:
+            chunks = splitter.split_text(text=text)
+            span.set(chunks=len(chunks))
+        logger.info("✅ Text chunked into %s chunks with size=%s, overlap=%s", len(chunks), chunk_size, chunk_overlap)
         return chunks
     except Exception as e:
-        logging.error("❌ Error during text chunking.")
+        logger.error("❌ Error during text chunking.")
         raise
 
-def load_and_chunk(file_path: str) -> str:
+def load_and_chunk(file_path: Source, file_name: Optional[str] = None) -> Tuple[str, List[str]]:
     try:
-        full_text = load_document(file_path)
+        full_text = load_document(file_path, file_name)
         chunks = chunk_text(full_text, CONFIG.CHUNK_SIZE, CONFIG.CHUNK_OVERLAP)
         return full_text, chunks
     except Exception as e:
-        logging.exception(f"❌ Failed to load and chunk file: {file_path}")
+        logger.exception("❌ Failed to load and chunk file: %s", _describe(file_path, file_name))
         raise
 
 # Example Usage (for testing)
@@ -1,19 +1,21 @@
 import streamlit as st
-import os, logging
-from pdf_agent import build_graph
-from utils import utils
+import queue
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from pdf_agent import build_graph, run_analysis, SYNC_NODES
+from config import config as CONFIG
+from document_loader import load_and_chunk
+from utils.checkpoints import get_checkpointer
+from utils import utils, instrumentation
+from utils.logging_setup import get_logger
 from chat_agent import stream_chat_response
 
 # Setup
 st.set_page_config(page_title="LexiAgent: Legal Document Assistant", page_icon="📄", layout="wide")
 
 # Logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[logging.FileHandler("logs/langgraph.log"), logging.StreamHandler()]
-)
-logger = logging.getLogger(__name__)
+logger = get_logger("lexi", "lexi.log")
+instrumentation.start_metrics_server()  # No-op unless LEXI_INSTRUMENTATION and LEXI_METRICS_PORT are set
 
 # CSS
 st.markdown("""
@@ -56,15 +58,25 @@ with st.sidebar:
     uploaded_file = st.sidebar.file_uploader("📤 **Upload PDF Files**", type=["pdf"], accept_multiple_files=True)
     page_choice = st.radio("🔀 **Select Mode**", ["**📘 LexiAgent - Overview**", "📊 **LexiAgent: Document Analyzer**", "💬 **LexiAgent: AI Assistant**"])
 
-    if uploaded_file:
-        os.makedirs("temp", exist_ok=True)
-        first_file = uploaded_file[0]  # Get the first uploaded file
-        file_path = os.path.join("temp", first_file.name)
-        with open(file_path, "wb") as f:
-            f.write(first_file.getbuffer())
-        st.success(f"✅ Uploaded: {first_file.name}")
+    # Uploads stay in memory: file name -> raw bytes, scoped to this browser session
+    uploads = {upload.name: upload.getvalue() for upload in uploaded_file or []}
+    if uploads:
+        st.success(f"✅ Uploaded: {', '.join(uploads)}")
+
+    # The assistant chats about one document at a time
+    if len(uploads) > 1:
+        chat_file = st.selectbox("💬 **Chat about**", list(uploads))
     else:
-        file_path = None
+        chat_file = next(iter(uploads), None)
+
+def parsed_document(name: str) -> dict:
+    """Parse an upload once per session; reruns and chat turns reuse the result."""
+    parsed = st.session_state.setdefault("parsed_documents", {})
+    digest = hashlib.sha256(uploads[name]).hexdigest()
+    if name not in parsed or parsed[name]["sha256"] != digest:
+        full_text, chunks = load_and_chunk(uploads[name], name)
+        parsed[name] = {"name": name, "sha256": digest, "full_text": full_text, "chunks": chunks}
+    return parsed[name]
 
 def home():
     # Custom CSS
@@ -168,68 +180,135 @@ def home():
     st.markdown("<div style='text-align:center;'>Built with ❤️ by Muhammad Umer Khan | 2025</div>", unsafe_allow_html=True)
 
 
+@st.cache_resource(show_spinner="⚙️ Compiling the analysis graph...")
+def get_analysis_graph():
+    """Compiled once per server process and shared by every session and rerun."""
+    return build_graph(checkpointer=get_checkpointer())
+
 # 📊 Page 1: Analyzer
+def render_result(result):
+    # Any stage may be missing when an analysis failed part-way; show what completed
+    if result.get("error"):
+        st.warning(f"⚠️ Analysis stopped early: {result['error']}. Showing partial results; run it again to resume.")
+    if result.get("reused_from"):
+        st.info(f"♻️ Compared with {result['reused_from']}: its analysis was reused and only the changed text re-analysed.")
+        changed = (result.get("revision_report") or {}).get("clauses")
+        if changed:
+            st.markdown("### 🔀 Changed Clauses and Risks")
+            st.dataframe([{"Clause": c["clause"], "Change": c["status"], "Previous risk": c["old_risk"] or "",
+                           "New risk": c["new_risk"] or "", "Suggestion": c["suggestion"] or ""} for c in changed],
+                         use_container_width=True)
+
+    st.markdown("<div class='section-block'>", unsafe_allow_html=True)
+    st.markdown("### 📄 Document Type")
+    st.write(f"- {result.get('doc_type') or 'Not available'}")
+    st.markdown("</div>", unsafe_allow_html=True)
+
+    st.markdown("<div class='section-block'>", unsafe_allow_html=True)
+    st.markdown("### 📌 Found Clauses")
+    for clause, detail in (result.get("clauses") or {}).items():
+        st.write(f"- **{clause}**: {detail}")
+    st.markdown("</div>", unsafe_allow_html=True)
+
+    st.markdown("<div class='section-block'>", unsafe_allow_html=True)
+    st.markdown("### 📝 Document Summary")
+    bullets = [line.strip() for line in (result.get("doc_summary") or "").split("\n") if line.strip().startswith("-")]
+    for bullet in bullets:
+        st.write(bullet)
+    st.markdown("</div>", unsafe_allow_html=True)
+
+    clause_summary = result.get("clause_summary") or {}
+    st.markdown("<div class='section-block'>", unsafe_allow_html=True)
+    st.markdown("### 📑 Clause Summaries")
+    if clause_summary.get("overall_summary"):
+        st.write(f"- {clause_summary['overall_summary']}")
+    for clause, summary in clause_summary.get("clause_summaries", {}).items():
+        st.write(f"- **{clause}**: {summary}")
+    st.markdown("</div>", unsafe_allow_html=True)
+
+    risks = result.get("risks") or {}
+    st.markdown("<div class='section-block'>", unsafe_allow_html=True)
+    st.markdown("### ⚠️ Risks Identified")
+
+    st.markdown("#### 🌀 Ambiguous Clauses")
+    for clause, issue in risks.get("ambiguous_clauses", {}).items():
+        st.write(f"- **{clause}**: {issue}")
+
+    st.markdown("#### 💡 Suggestions")
+    for clause, suggestion in risks.get("suggestions", {}).items():
+        st.write(f"- **{clause}**: {suggestion}")
+    st.markdown("</div>", unsafe_allow_html=True)
+
+def analyze_file(agent, name: str, data: bytes, events: queue.Queue):
+    """
+    Run (or resume) the analysis of one file in a worker thread, reporting
+    ("node", name) after each node and ("done", state) at the end.
+    "done" is always reported, with {"error": ...} if the run raised, so the
+    script thread never waits forever. Streamlit calls stay on the script thread.
+    """
+    state = {"error": "analysis did not finish"}
+    try:
+        inputs = {"document": data, "file_name": name, "query": "What are the key terms and risks in this document?"}
+        state = run_analysis(agent, inputs, on_node=lambda node, _: events.put((name, "node", node)))
+    except Exception as e:
+        logger.error("❌ Analysis of %s failed: %s", name, e)
+        state = {"error": str(e) or type(e).__name__}
+    finally:
+        events.put((name, "done", state or {"error": "analysis returned no result"}))
+
+def comparison_rows(results):
+    rows = []
+    for name, result in results.items():
+        clauses = result.get("clauses") or {}
+        found = [c for c in CONFIG.REQUIRED_CLAUSES if clauses.get(c, "Not Found") != "Not Found"]
+        row = {"File": name, "Document Type": result.get("doc_type"), "Found": len(found),
+               "Missing": len(CONFIG.REQUIRED_CLAUSES) - len(found)}
+        row.update({c: "✅" if c in found else "❌" for c in CONFIG.REQUIRED_CLAUSES})
+        rows.append(row)
+    return rows
+
 def show_document_analyzer():
-    if not file_path:
+    if not uploads:
         st.warning("📎 Please upload a PDF to start analysis.")
         return
 
-    st.markdown("### 🛠️ Click below to start analyzing your legal document:")
+    st.markdown("### 🛠️ Click below to start analyzing your legal documents:")
     if st.button("🚀 Start Analyzing"):
-        with st.spinner("⚙️ Analyzing your document with LexiAgent..."):
-            agent = build_graph()
-            result = agent.invoke({
-                "file_path": file_path,
-                "query": "What are the key terms and risks in this document?"
-            })
-
-        # Display Results
-        st.markdown("<div class='section-block'>", unsafe_allow_html=True)
-        st.markdown("### 📄 Document Type")
-        st.write(f"- {result['doc_type']}")
-        st.markdown("</div>", unsafe_allow_html=True)
-
-        st.markdown("<div class='section-block'>", unsafe_allow_html=True)
-        st.markdown("### 📌 Found Clauses")
-        for clause, detail in result["clauses"].items():
-            st.write(f"- **{clause}**: {detail}")
-        st.markdown("</div>", unsafe_allow_html=True)
-
-        st.markdown("<div class='section-block'>", unsafe_allow_html=True)
-        st.markdown("### 📝 Document Summary")
-        bullets = [line.strip() for line in result["doc_summary"].split("\n") if line.strip().startswith("-")]
-        for bullet in bullets:
-            st.write(bullet)
-        st.markdown("</div>", unsafe_allow_html=True)
-
-        st.markdown("<div class='section-block'>", unsafe_allow_html=True)
-        st.markdown("### 📑 Clause Summaries")
-        st.write(f"- {result['clause_summary']['overall_summary']}")
-        for clause, summary in result["clause_summary"]["clause_summaries"].items():
-            st.write(f"- **{clause}**: {summary}")
-        st.markdown("</div>", unsafe_allow_html=True)
-
-        st.markdown("<div class='section-block'>", unsafe_allow_html=True)
-        st.markdown("### ⚠️ Risks Identified")
-
-        st.markdown("#### 🌀 Ambiguous Clauses")
-        for clause, issue in result["risks"]["ambiguous_clauses"].items():
-            st.write(f"- **{clause}**: {issue}")
-
-        st.markdown("#### 💡 Suggestions")
-        for clause, suggestion in result["risks"]["suggestions"].items():
-            st.write(f"- **{clause}**: {suggestion}")
-        st.markdown("</div>", unsafe_allow_html=True)
-
-        if "error" in result:
-            st.error(f"❌ Error: {result['error']}")
+        agent = get_analysis_graph()
+        events = queue.Queue()
+        progress = {name: st.progress(0.0, text=f"⏳ {name}: queued") for name in uploads}
+        results = {}
+
+        # Files run concurrently on a bounded pool; results render as each one finishes
+        with ThreadPoolExecutor(max_workers=CONFIG.ANALYZER_MAX_PARALLEL_FILES) as pool:
+            for name, data in uploads.items():
+                pool.submit(analyze_file, agent, name, data, events)
+
+            nodes_done = {name: 0 for name in uploads}
+            while len(results) < len(uploads):
+                name, kind, payload = events.get()
+                if kind == "node":
+                    nodes_done[name] += 1
+                    progress[name].progress(min(1.0, nodes_done[name] / len(SYNC_NODES)), text=f"⚙️ {name}: {payload} done")
+                    continue
+                results[name] = payload
+                progress[name].progress(1.0, text=f"{'❌' if payload.get('error') else '✅'} {name}: finished")
+                with st.expander(f"📄 {name}", expanded=len(uploads) == 1):
+                    try:
+                        render_result(payload)
+                    except Exception as e:
+                        st.error(f"❌ Could not display results for {name}: {e}")
+
+        if len(results) > 1:
+            st.markdown("### 🗂️ Comparison Across Documents")
+            st.dataframe(comparison_rows(results), use_container_width=True)
 
 
 
 # 💬 Page 2: Chatbot
 @utils.enable_chat_history
 def show_chatbot():
-    if not file_path:
+    if not chat_file:
         st.warning("📎 Please upload a PDF to interact with the chatbot.")
         return
 
@@ -241,7 +320,9 @@ def show_chatbot():
         with st.chat_message("assistant"):
             try:
                 with st.spinner("⚙️ LexiAgent is analyzing your document..."):
-                    response = stream_chat_response(user_input, file_path)
+                    # Earlier turns, without the greeting and the message just added
+                    history = st.session_state.messages[1:-1]
+                    response = stream_chat_response(user_input, parsed_document(chat_file), history)
                     st.write(response)
                     st.session_state.messages.append({"role": "assistant", "content": response})
                     utils.print_qa(show_chatbot, user_input, response)
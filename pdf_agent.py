@@ -1,28 +1,31 @@
-import logging, time
-from typing import Dict, Any, TypedDict
+import time
+import asyncio
+import inspect
+from typing import Any, Callable, Dict, Optional, TypedDict
 from langgraph.graph import StateGraph, END
 
 # Import your existing scripts
 from document_loader import load_and_chunk
-from classify_documents import get_classified_doc
-from clause_extractor import get_clause_extracted
-from risk_detector import get_clause_risks
-from summarizer import get_summary
+from classify_documents import classify_document, aclassify_document
+from clause_extractor import extract_clauses_from_document, aextract_clauses_from_document, merge_clause_chunks
+from risk_detector import analyze_clause_risks, aanalyze_clause_risks
+from summarizer import summarize_contract, asummarize_contract, summarize_chunks, asummarize_chunks
+from dedup import find_near_duplicate, remember_analysis
+from results_store import record_analysis
+from versioning import previous_analysis, reanalyze_revision, areanalyze_revision
+from config import config as CONFIG
+from utils import instrumentation
+from utils.checkpoints import document_hash, get_checkpointer, thread_key, thread_lock
+from utils.logging_setup import get_logger
 
 # Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler("logs/langgraph.log"),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+logger = get_logger("pdf_agent", "langgraph.log")
 
 # Define State Schema using TypedDict for clarity
 class State(TypedDict):
     file_path: str
+    document: Any  # Upload bytes or file-like object, used instead of file_path when set
+    file_name: str  # Name of the upload (gives the format of `document`)
     full_text: str
     chunks: list
     doc_type: str
@@ -32,92 +35,333 @@ class State(TypedDict):
     clause_summary: str
     error: str
     query: str  # Optional, for future RAG integration
+    timings: Dict[str, float]  # Wall seconds per node
+    previous_version: str  # Optional input: text hash or path of an analysed earlier version
+    tenant: str  # Optional input: owner of the document; stored analyses are only reused within a tenant
+    document_hash: str  # sha256 of the raw document bytes (the results store's document id)
+    template: Optional[Dict[str, Any]]  # Stored analysis of the earlier version or a near-duplicate
+    reused_from: str  # Name of the document whose analysis was reused
+    revision_report: Dict[str, Any]  # Changed chunks, sections, clauses and risks vs. reused_from
 
-# Node functions
+def _source(state: State):
+    # Empty bytes are still an upload (and fail to load), not a missing one
+    return state["document"] if state.get("document") is not None else state["file_path"]
+
+def document_name(state: State) -> str:
+    return state.get("file_name") or state.get("file_path")
+
+def find_template(state: State) -> Optional[Dict[str, Any]]:
+    """Stored analysis to revise: the given previous version, else a near-duplicate."""
+    if state.get("previous_version"):
+        return previous_analysis(state["previous_version"], state.get("tenant") or "")
+    match = find_near_duplicate(state["full_text"], state.get("tenant") or "")
+    return match[0] if match else None
+
+# Node functions. The document is parsed once by the load node; later nodes work on
+# state["full_text"], state["chunks"] and state["clauses"] without touching the file.
+# Failures are raised, not swallowed, so a checkpointed run stops after the last
+# completed node and run_analysis can resume from there.
 def load_and_prepare(state: State) -> State:
     try:
-        file_path = state["file_path"]
-        full_text, chunks = load_and_chunk(file_path)
+        name = document_name(state)
+        full_text, chunks = load_and_chunk(_source(state), name)
         state["full_text"] = full_text
         state["chunks"] = chunks
-        logger.info(f"Loaded and chunked {file_path} into {len(chunks)} chunks")
+        state["document_hash"] = document_hash(_source(state))
+        state["document"] = None  # Parsed; don't carry the raw bytes through the graph
+        state["template"] = find_template(state)
+        logger.info("Loaded and chunked %s into %s chunks", name, len(chunks))
         return state
     except Exception as e:
-        logger.error(f"Failed to load {file_path}: {e}")
-        state["error"] = str(e)
-        return state
+        logger.error("Failed to load %s: %s", name, e)
+        raise
 
 def classify(state: State) -> State:
     try:
-        state["doc_type"] = get_classified_doc(state["file_path"])
-        logger.info(f"Classified document as: {state['doc_type']}")
-        time.sleep(3)
+        state["doc_type"] = classify_document(state["full_text"])
+        if state["doc_type"] is None:
+            raise RuntimeError("Classification returned no document type")
+        logger.info("Classified document as: %s", state['doc_type'])
+        time.sleep(CONFIG.RATE_LIMIT_PAUSE)
         return state
     except Exception as e:
-        logger.error(f"Classification failed: {e}")
-        state["error"] = str(e)
-        return state
+        logger.error("Classification failed: %s", e)
+        raise
 
 def extract(state: State) -> State:
     try:
-        state["clauses"] = get_clause_extracted(state["file_path"])
+        state["clauses"] = merge_clause_chunks(extract_clauses_from_document(state["full_text"], state["chunks"], strict=True))
         logger.info("Clauses extracted")
-        time.sleep(3)
+        time.sleep(CONFIG.RATE_LIMIT_PAUSE)
         return state
     except Exception as e:
-        logger.error(f"Clause extraction failed: {e}")
-        state["error"] = str(e)
-        return state
+        logger.error("Clause extraction failed: %s", e)
+        raise
 
 def detect_risks(state: State) -> State:
     try:
-        state["risks"] = get_clause_risks(state["file_path"])
+        result = analyze_clause_risks(state["clauses"], CONFIG.RISK_ANALYZER_PATH)
+        if result is None:
+            raise RuntimeError("Risk analysis returned no result")
+        state["risks"], _ = result
         logger.info("Risks detected")
-        time.sleep(3)
+        time.sleep(CONFIG.RATE_LIMIT_PAUSE)
         return state
     except Exception as e:
-        logger.error(f"Risk detection failed: {e}")
-        state["error"] = str(e)
-        return state
+        logger.error("Risk detection failed: %s", e)
+        raise
 
 def summarize(state: State) -> State:
     try:
-        state["clause_summary"], state["doc_summary"] = get_summary(state["file_path"])
+        state["clause_summary"] = summarize_contract(state["clauses"])
+        if state["clause_summary"] is None:
+            raise RuntimeError("Clause summarization returned no result")
+        state["doc_summary"] = summarize_chunks(state["chunks"])
+        logger.info("Document and clauses summarized")
+        time.sleep(CONFIG.RATE_LIMIT_PAUSE)
+        return state
+    except Exception as e:
+        logger.error("Summarization failed: %s", e)
+        raise
+
+def reuse(state: State) -> State:
+    try:
+        state = reanalyze_revision(state, state["template"])
+        state["template"] = None
+        logger.info("Re-analysed changes against %s", state["reused_from"])
+        return state
+    except Exception as e:
+        logger.error("Incremental re-analysis failed: %s", e)
+        raise
+
+def remember(state: State) -> State:
+    remember_analysis(document_name(state), state["full_text"], state["chunks"], state, state.get("tenant") or "")
+    record_analysis(document_name(state), state)
+    return state
+
+# Async node functions, used by build_graph(async_mode=True)
+async def aload_and_prepare(state: State) -> State:
+    try:
+        name = document_name(state)
+        full_text, chunks = await asyncio.to_thread(load_and_chunk, _source(state), name)
+        state["full_text"] = full_text
+        state["chunks"] = chunks
+        state["document_hash"] = await asyncio.to_thread(document_hash, _source(state))
+        state["document"] = None
+        state["template"] = await asyncio.to_thread(find_template, state)
+        logger.info("Loaded and chunked %s into %s chunks", name, len(chunks))
+        return state
+    except Exception as e:
+        logger.error("Failed to load %s: %s", name, e)
+        raise
+
+async def aclassify(state: State) -> State:
+    try:
+        state["doc_type"] = await aclassify_document(state["full_text"])
+        if state["doc_type"] is None:
+            raise RuntimeError("Classification returned no document type")
+        logger.info("Classified document as: %s", state['doc_type'])
+        await asyncio.sleep(CONFIG.RATE_LIMIT_PAUSE)
+        return state
+    except Exception as e:
+        logger.error("Classification failed: %s", e)
+        raise
+
+async def aextract(state: State) -> State:
+    try:
+        state["clauses"] = merge_clause_chunks(await aextract_clauses_from_document(state["full_text"], state["chunks"], strict=True))
+        logger.info("Clauses extracted")
+        await asyncio.sleep(CONFIG.RATE_LIMIT_PAUSE)
+        return state
+    except Exception as e:
+        logger.error("Clause extraction failed: %s", e)
+        raise
+
+async def adetect_risks(state: State) -> State:
+    try:
+        result = await aanalyze_clause_risks(state["clauses"], CONFIG.RISK_ANALYZER_PATH)
+        if result is None:
+            raise RuntimeError("Risk analysis returned no result")
+        state["risks"], _ = result
+        logger.info("Risks detected")
+        await asyncio.sleep(CONFIG.RATE_LIMIT_PAUSE)
+        return state
+    except Exception as e:
+        logger.error("Risk detection failed: %s", e)
+        raise
+
+async def asummarize(state: State) -> State:
+    try:
+        state["clause_summary"], state["doc_summary"] = await asyncio.gather(
+            asummarize_contract(state["clauses"]), asummarize_chunks(state["chunks"])
+        )
+        if state["clause_summary"] is None:
+            raise RuntimeError("Clause summarization returned no result")
         logger.info("Document and clauses summarized")
-        time.sleep(5)
+        await asyncio.sleep(CONFIG.RATE_LIMIT_PAUSE)
         return state
     except Exception as e:
-        logger.error(f"Summarization failed: {e}")
-        state["error"] = str(e)
+        logger.error("Summarization failed: %s", e)
+        raise
+
+async def areuse(state: State) -> State:
+    try:
+        state = await areanalyze_revision(state, state["template"])
+        state["template"] = None
+        logger.info("Re-analysed changes against %s", state["reused_from"])
         return state
+    except Exception as e:
+        logger.error("Incremental re-analysis failed: %s", e)
+        raise
+
+async def aremember(state: State) -> State:
+    await asyncio.to_thread(remember_analysis, document_name(state), state["full_text"], state["chunks"], state,
+                            state.get("tenant") or "")
+    record_analysis(document_name(state), state)  # only queues; the store is written in the background
+    return state
+
+def instrumented(name: str, node):
+    """
+    Wrap a node (sync or async) so its wall time is stored in state["timings"] and
+    recorded as a "node.<name>" span tagged with the document being analysed.
+    """
+    if inspect.iscoroutinefunction(node):
+        async def awrapper(state: State) -> State:
+            start = time.perf_counter()
+            with instrumentation.bind_context(document=document_name(state)), instrumentation.span(f"node.{name}"):
+                state = await node(state)
+            state.setdefault("timings", {})[name] = time.perf_counter() - start
+            return state
+        return awrapper
+
+    def wrapper(state: State) -> State:
+        start = time.perf_counter()
+        with instrumentation.bind_context(document=document_name(state)), instrumentation.span(f"node.{name}"):
+            state = node(state)
+        state.setdefault("timings", {})[name] = time.perf_counter() - start
+        return state
+    return wrapper
+
+SYNC_NODES = {
+    "load": load_and_prepare,
+    "classify": classify,
+    "extract_clauses": extract,
+    "risk_analysis": detect_risks,
+    "summarization": summarize,
+    "reuse_analysis": reuse,
+    "remember": remember,
+}
+
+ASYNC_NODES = {
+    "load": aload_and_prepare,
+    "classify": aclassify,
+    "extract_clauses": aextract,
+    "risk_analysis": adetect_risks,
+    "summarization": asummarize,
+    "reuse_analysis": areuse,
+    "remember": aremember,
+}
 
 # Build LangGraph
-def build_graph() -> StateGraph:
+def build_graph(async_mode: bool = False, checkpointer=None) -> StateGraph:
+    """
+    Compile the analysis graph. With async_mode=True the nodes are coroutines, so the
+    graph must be driven with ainvoke/astream (e.g. via utils.async_runtime.run_sync).
+    A `checkpointer` (see utils.checkpoints.get_checkpointer, sync graph only) makes
+    runs resumable through run_analysis.
+    """
     builder = StateGraph(state_schema=State)  # Pass the state schema
 
-    builder.add_node("load", load_and_prepare)
-    builder.add_node("classify", classify)
-    builder.add_node("extract_clauses", extract)
-    builder.add_node("risk_analysis", detect_risks)
-    builder.add_node("summarization", summarize)
+    for name, node in (ASYNC_NODES if async_mode else SYNC_NODES).items():
+        builder.add_node(name, instrumented(name, node))
 
     builder.set_entry_point("load")
 
     # Corrected edges (removed non-existent 'retrieve')
-    builder.add_edge("load", "classify")
+    # Revisions and near-duplicates of an analysed document reuse its results (see versioning.py)
+    builder.add_conditional_edges("load", lambda state: "reuse_analysis" if state.get("template") else "classify",
+                                  ["reuse_analysis", "classify"])
     builder.add_edge("classify", "extract_clauses")
     builder.add_edge("extract_clauses", "risk_analysis")
     builder.add_edge("risk_analysis", "summarization")
-    builder.add_edge("summarization", END)
+    builder.add_edge("summarization", "remember")
+    builder.add_edge("reuse_analysis", "remember")
+    builder.add_edge("remember", END)
+
+    return builder.compile(checkpointer=checkpointer)
+
+def run_analysis(graph, inputs: Dict[str, Any], on_node: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Run the graph on `inputs`, calling on_node(name, state) after each node.
+
+    With a checkpointed graph the run is a LangGraph thread keyed by the document hash,
+    the tenant, the previous version and the analysis settings (utils.checkpoints.thread_key), and
+    runs of one thread are serialised: a finished analysis with the same key is
+    returned as is, an interrupted one resumes from its last completed node, and
+    failures are retried (resuming, with backoff) up to CONFIG.GRAPH_MAX_ATTEMPTS times. Never raises: on final failure the
+    partial state is returned with "error" set.
+    """
+    if graph.checkpointer is None:
+        state = dict(inputs)
+        try:
+            for update in graph.stream(inputs, stream_mode="updates"):
+                for node, values in update.items():
+                    state.update(values or {})
+                    if on_node:
+                        on_node(node, values or {})
+        except Exception as e:
+            logger.exception("Analysis failed: %s", e)
+            state["error"] = str(e)
+        return state
+
+    try:
+        thread_id = thread_key(inputs)
+    except Exception as e:
+        logger.error("Cannot identify the document to analyse: %s", e)
+        return {**inputs, "error": str(e)}
+    # Concurrent runs of one thread (same bytes from two sessions of a tenant) take turns;
+    # the later one then finds the finished analysis
+    entry = thread_lock(thread_id)
+    with entry.lock:
+        state = _run_thread(graph, inputs, thread_id, on_node)
+    # A reused analysis may have been stored under another upload name
+    state.update({key: inputs[key] for key in ("file_name", "file_path") if inputs.get(key)})
+    return state
+
+def _run_thread(graph, inputs: Dict[str, Any], thread_id: str,
+                on_node: Optional[Callable[[str, Dict[str, Any]], None]]) -> Dict[str, Any]:
+    config = {"configurable": {"thread_id": thread_id}}
+    error = None
+    for attempt in range(1, CONFIG.GRAPH_MAX_ATTEMPTS + 1):
+        snapshot = graph.get_state(config)
+        if snapshot.values and not snapshot.next:
+            logger.info("Reusing completed analysis %s", thread_id[:12])
+            return dict(snapshot.values)
+        if snapshot.next:
+            logger.info("Resuming analysis %s at %s (attempt %s)", thread_id[:12], snapshot.next, attempt)
+        try:
+            # None resumes the thread from its checkpoint instead of starting over
+            for update in graph.stream(None if snapshot.next else inputs, config, stream_mode="updates"):
+                for node, values in update.items():
+                    if on_node:
+                        on_node(node, values or {})
+            return dict(graph.get_state(config).values)
+        except Exception as e:
+            error = e
+            logger.warning("Analysis %s failed on attempt %s/%s: %s", thread_id[:12], attempt, CONFIG.GRAPH_MAX_ATTEMPTS, e)
+            if attempt < CONFIG.GRAPH_MAX_ATTEMPTS:
+                time.sleep(CONFIG.GRAPH_RETRY_BACKOFF * 2 ** (attempt - 1))
 
-    return builder.compile()
+    state = dict(graph.get_state(config).values or inputs)
+    state["error"] = str(error)
+    return state
 
 if __name__ == "__main__":
     # Use absolute path for robustness
     file_path ="./data/Example-One-Way-Non-Disclosure-Agreement.pdf"
 
-    agent = build_graph()
-    result = agent.invoke({"file_path": file_path, "query": "What are the key terms and risks in this document?"})
+    agent = build_graph(checkpointer=get_checkpointer())
+    result = run_analysis(agent, {"file_path": file_path, "query": "What are the key terms and risks in this document?"})
 
     if "error" not in result:
         print("\n📄 Document Type:", result["doc_type"])
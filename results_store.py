@@ -0,0 +1,272 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+from config import config as CONFIG
+from utils import instrumentation
+from utils.logging_setup import get_logger
+
+# Local store of finished analyses for corpus-wide questions ("which contracts lack an
+# Indemnification Clause?") without re-running the pipeline. One row per document,
+# one per (document, clause) and one per (document, stage); indexes on document type
+# and clause presence keep those queries in the millisecond range. Documents are
+# identified like checkpoints, by the sha256 of their raw bytes, and every row
+# belongs to a tenant (the service's X-Tenant); queries only see one tenant's rows.
+# Pipeline runs hand their results to a background writer that inserts them in
+# batches, so concurrent batch workers never contend on SQLite write locks.
+
+logger = get_logger("results_store", "results_store.log")
+
+NOT_FOUND = "Not Found"
+
+TABLES = ("documents", "clauses", "stage_timings")
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS documents ("
+    "tenant TEXT NOT NULL, hash TEXT NOT NULL, name TEXT, doc_type TEXT, doc_summary TEXT, overall_summary TEXT, "
+    "reused_from TEXT, total_seconds REAL, analyzed REAL NOT NULL, PRIMARY KEY (tenant, hash))",
+    "CREATE TABLE IF NOT EXISTS clauses ("
+    "tenant TEXT NOT NULL, hash TEXT NOT NULL, clause TEXT NOT NULL, present INTEGER NOT NULL, value TEXT, "
+    "risk TEXT, suggestion TEXT, summary TEXT, PRIMARY KEY (tenant, hash, clause))",
+    "CREATE TABLE IF NOT EXISTS stage_timings ("
+    "tenant TEXT NOT NULL, hash TEXT NOT NULL, stage TEXT NOT NULL, seconds REAL NOT NULL, PRIMARY KEY (tenant, hash, stage))",
+    "CREATE INDEX IF NOT EXISTS idx_documents_type ON documents (tenant, doc_type)",
+    "CREATE INDEX IF NOT EXISTS idx_clauses_presence ON clauses (tenant, clause, present)",
+    "CREATE INDEX IF NOT EXISTS idx_stage_timings_stage ON stage_timings (tenant, stage)",
+]
+
+def to_record(name: str, state: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten a finished analysis State into the rows stored for one document."""
+    if not state.get("document_hash"):
+        raise ValueError("analysis has no document_hash")
+    risks = state.get("risks") or {}
+    clause_summary = state.get("clause_summary") or {}
+    ambiguous, suggestions = risks.get("ambiguous_clauses") or {}, risks.get("suggestions") or {}
+    summaries = (clause_summary.get("clause_summaries") or {}) if isinstance(clause_summary, dict) else {}
+    clauses = state.get("clauses") or {}
+    timings = state.get("timings") or {}
+    return {
+        "tenant": state.get("tenant") or "",
+        "hash": state["document_hash"],
+        "name": name,
+        "doc_type": state.get("doc_type"),
+        "doc_summary": state.get("doc_summary"),
+        "overall_summary": clause_summary.get("overall_summary") if isinstance(clause_summary, dict) else None,
+        "reused_from": state.get("reused_from"),
+        "total_seconds": sum(timings.values()),
+        "clauses": [{
+            "clause": clause,
+            "present": int(bool(clauses.get(clause)) and clauses.get(clause) != NOT_FOUND),
+            "value": clauses.get(clause, NOT_FOUND),
+            "risk": ambiguous.get(clause),
+            "suggestion": suggestions.get(clause),
+            "summary": summaries.get(clause),
+        } for clause in dict.fromkeys(list(CONFIG.REQUIRED_CLAUSES) + list(clauses))],
+        "timings": timings,
+    }
+
+class ResultsStore:
+    """SQLite tables of analysed documents, their clauses and per-stage timings."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(documents)")]
+            unscoped = bool(columns) and "tenant" not in columns
+            if unscoped:
+                # Stores from before tenant scoping: their rows belong to the default tenant
+                for table in TABLES:
+                    self._conn.execute(f"ALTER TABLE {table} RENAME TO {table}_unscoped")
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+            if unscoped:
+                for table in TABLES:
+                    self._conn.execute(f"INSERT INTO {table} SELECT '', * FROM {table}_unscoped")
+                    self._conn.execute(f"DROP TABLE {table}_unscoped")
+                for statement in SCHEMA:  # the indexes went with the old tables
+                    self._conn.execute(statement)
+
+    def put_many(self, records: List[Dict[str, Any]]):
+        """Insert or replace many documents in one transaction."""
+        keys = [(r["tenant"], r["hash"]) for r in records]
+        documents = [(r["tenant"], r["hash"], r["name"], r["doc_type"], r["doc_summary"], r["overall_summary"],
+                      r["reused_from"], r["total_seconds"], time.time()) for r in records]
+        clauses = [(r["tenant"], r["hash"], c["clause"], c["present"], c["value"], c["risk"], c["suggestion"], c["summary"])
+                   for r in records for c in r["clauses"]]
+        timings = [(r["tenant"], r["hash"], stage, seconds) for r in records for stage, seconds in r["timings"].items()]
+        with self._lock, self._conn:
+            # A re-analysed document replaces all of its earlier rows
+            self._conn.executemany("DELETE FROM clauses WHERE tenant = ? AND hash = ?", keys)
+            self._conn.executemany("DELETE FROM stage_timings WHERE tenant = ? AND hash = ?", keys)
+            self._conn.executemany("INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", documents)
+            self._conn.executemany("INSERT INTO clauses VALUES (?, ?, ?, ?, ?, ?, ?, ?)", clauses)
+            self._conn.executemany("INSERT INTO stage_timings VALUES (?, ?, ?, ?)", timings)
+
+    def query(self, sql: str, params: Iterable[Any] = ()) -> List[Dict[str, Any]]:
+        """Run a read query and return rows as dicts."""
+        with self._lock:
+            cursor = self._conn.execute(sql, tuple(params))
+            columns = [d[0] for d in cursor.description]
+            rows = cursor.fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+
+    def documents_missing(self, clause: str, doc_type: Optional[str] = None, tenant: str = "") -> List[Dict[str, Any]]:
+        """`tenant`'s documents (optionally of one type) where `clause` was not found."""
+        sql = ("SELECT d.hash, d.name, d.doc_type FROM documents d WHERE d.tenant = ? AND NOT EXISTS "
+               "(SELECT 1 FROM clauses c WHERE c.tenant = d.tenant AND c.hash = d.hash AND c.clause = ? AND c.present = 1)")
+        params: List[Any] = [tenant, clause]
+        if doc_type:
+            sql += " AND d.doc_type = ?"
+            params.append(doc_type)
+        return self.query(sql + " ORDER BY d.name", params)
+
+    def documents_of_type(self, doc_type: str, tenant: str = "") -> List[Dict[str, Any]]:
+        return self.query("SELECT hash, name, analyzed FROM documents WHERE tenant = ? AND doc_type = ? ORDER BY name",
+                          [tenant, doc_type])
+
+    def clause_coverage(self, tenant: str = "") -> List[Dict[str, Any]]:
+        """Per clause: `tenant`'s documents where it was found, out of all their documents."""
+        return self.query(
+            "SELECT clause, SUM(present) AS found, COUNT(*) AS documents FROM clauses WHERE tenant = ? "
+            "GROUP BY clause ORDER BY clause", [tenant]
+        )
+
+    def stage_timings(self, tenant: str = "") -> List[Dict[str, Any]]:
+        """Per stage: runs, mean and max wall seconds of `tenant`'s analyses."""
+        return self.query(
+            "SELECT stage, COUNT(*) AS runs, AVG(seconds) AS mean_seconds, MAX(seconds) AS max_seconds "
+            "FROM stage_timings WHERE tenant = ? GROUP BY stage ORDER BY mean_seconds DESC", [tenant]
+        )
+
+    def export(self, output_dir: str, fmt: str = "parquet", tenant: str = "") -> Optional[List[str]]:
+        """
+        Write `tenant`'s rows of each table to `output_dir` as Parquet or Arrow IPC
+        ("arrow") files for analytics tools. Needs pyarrow; returns the written paths, or None.
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            import pyarrow.feather as feather
+        except ImportError:
+            logger.error("❌ Export needs pyarrow (pip install pyarrow)")
+            return None
+        os.makedirs(output_dir, exist_ok=True)
+        paths = []
+        for table in TABLES:
+            arrow_table = pa.Table.from_pylist(self.query(f"SELECT * FROM {table} WHERE tenant = ?", [tenant]))
+            path = os.path.join(output_dir, f"{table}.{fmt}")
+            if fmt == "parquet":
+                pq.write_table(arrow_table, path)
+            else:
+                feather.write_feather(arrow_table, path)
+            paths.append(path)
+        logger.info("📤 Exported results store to %s", output_dir)
+        return paths
+
+class ResultsWriter:
+    """
+    Background thread that drains recorded analyses into the store in batches of up
+    to CONFIG.RESULTS_BATCH_SIZE, waiting at most CONFIG.RESULTS_FLUSH_SECONDS for a batch to fill.
+    """
+
+    def __init__(self, store: ResultsStore):
+        self.store = store
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        threading.Thread(target=self._run, name="lexi-results-writer", daemon=True).start()
+
+    def put(self, record: Dict[str, Any]):
+        self._queue.put(record)
+
+    def flush(self):
+        """Block until every record put so far is stored."""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + CONFIG.RESULTS_FLUSH_SECONDS
+            while len(batch) < CONFIG.RESULTS_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                start = time.perf_counter()
+                self.store.put_many(batch)
+                instrumentation.observe("lexi_results_insert_seconds", time.perf_counter() - start)
+                instrumentation.increment("lexi_results_stored_total", len(batch))
+            except Exception as e:
+                logger.error("❌ Failed to store %s analyses: %s", len(batch), e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+_lock = threading.Lock()
+_store: Optional[ResultsStore] = None
+_writer: Optional[ResultsWriter] = None
+
+def get_results_store() -> ResultsStore:
+    """Process-wide results store at CONFIG.RESULTS_STORE_PATH."""
+    global _store
+    with _lock:
+        if _store is None:
+            _store = ResultsStore(CONFIG.RESULTS_STORE_PATH)
+    return _store
+
+def _get_writer() -> ResultsWriter:
+    global _writer
+    store = get_results_store()
+    with _lock:
+        if _writer is None:
+            _writer = ResultsWriter(store)
+            atexit.register(_writer.flush)
+    return _writer
+
+def record_analysis(name: str, state: Dict[str, Any]):
+    """Queue a finished analysis for the results store (written in the background)."""
+    if not CONFIG.RESULTS_STORE_ENABLED:
+        return
+    try:
+        _get_writer().put(to_record(name, state))
+    except Exception as e:
+        logger.error("❌ Failed to record analysis of %s: %s", name, e)
+
+def record_analyses(items: Iterable[tuple]):
+    """Store many (name, state) analyses at once, e.g. from a batch job."""
+    records = [to_record(name, state) for name, state in items]
+    if records:
+        get_results_store().put_many(records)
+
+def flush_results():
+    """Wait until every queued analysis is stored."""
+    if _writer is not None:
+        _writer.flush()
+
+# Sample Test (LEXI_TENANT selects the tenant, default ""):
+#   python results_store.py missing "Indemnification Clause" [doc_type]
+#   python results_store.py coverage | timings
+#   python results_store.py export out_dir [parquet|arrow]
+if __name__ == "__main__":
+    store = get_results_store()
+    tenant = os.getenv("LEXI_TENANT", "")
+    command, args = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else ("coverage", [])
+    start = time.perf_counter()
+    if command == "missing":
+        rows = store.documents_missing(args[0], args[1] if len(args) > 1 else None, tenant)
+    elif command == "timings":
+        rows = store.stage_timings(tenant)
+    elif command == "export":
+        rows = store.export(args[0], args[1] if len(args) > 1 else "parquet", tenant)
+    else:
+        rows = store.clause_coverage(tenant)
+    print(json.dumps(rows, indent=2, default=str))
+    print(f"⏱️ {(time.perf_counter() - start) * 1000:.1f} ms")
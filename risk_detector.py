@@ -1,63 +1,78 @@
-import os, logging, json
-from typing import Dict, Optional
-from utils.utils import configure_llm, load_prompt_template
-from clause_extractor import extract_clauses, merge_clause_chunks
-from clause_extractor import parse_json_safely
+import json
+from typing import Dict, Optional, Tuple
+from utils.utils import configure_llm, load_prompt_template, invoke_structured, ainvoke_structured, PARSE_STATS, estimate_tokens
+from utils.model_router import route, aroute
+from clause_extractor import extract_clauses, aextract_clauses, merge_clause_chunks
+from schemas import RiskAnalysis
 from config import config as CONFIG
+from utils.logging_setup import get_logger
 
 # Setup logging
-os.makedirs("logs", exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler("logs/risk_detector.log"),
-        logging.StreamHandler()
-    ]
-)
-
-def analyze_clause_risks(clauses: Dict[str, str], prompt_path: str) -> Optional[Dict]:
+logger = get_logger("risk_detector", "risk_detector.log")
+
+def build_risk_prompt(clauses: Dict[str, str], prompt_path: str) -> str:
+    prompt_template = load_prompt_template(prompt_path)
+    return prompt_template.replace("{clauses}", json.dumps(clauses, indent=2))
+
+def _risk_result(parsed: Optional[Dict], raw_output: str) -> Tuple[Dict, str]:
+    logger.info("📊 Risk analysis parse-failure rate: %.1f%%", PARSE_STATS.failure_rate("risk_analysis") * 100)
+    if parsed is None:
+        logger.warning("⚠️ Structured risk analysis failed. Returning raw response.")
+        return {
+            "ambiguous_clauses": {},
+            "suggestions": {},
+            "raw_response": raw_output
+        }, raw_output
+
+    logger.info("✅ Risk analysis complete.")
+    return parsed, raw_output
+
+def _parsed_ok(result: Tuple[Optional[Dict], str]) -> Optional[str]:
+    return None if result[0] is not None else "invalid structured output"
+
+def analyze_clause_risks(clauses: Dict[str, str], prompt_path: str) -> Optional[Tuple[Dict, str]]:
+    try:
+        prompt = build_risk_prompt(clauses, prompt_path)
+        logger.info("🛡️ Sending clauses to LLM for risk analysis...")
+
+        def attempt(model: str):
+            parsed, raw = invoke_structured(configure_llm(MODEL_NAME=model), prompt, RiskAnalysis, stage="risk_analysis")
+            return (parsed, raw), estimate_tokens(prompt), estimate_tokens(raw)
+
+        return _risk_result(*route("risk_analysis", attempt, _parsed_ok))
+
+    except Exception as e:
+        logger.error("❌ Risk detection failed: %s", e)
+        return None
+
+async def aanalyze_clause_risks(clauses: Dict[str, str], prompt_path: str) -> Optional[Tuple[Dict, str]]:
     try:
-        prompt_template = load_prompt_template(prompt_path)
-        clause_json = json.dumps(clauses, indent=2)
-        prompt = prompt_template.replace("{clauses}", clause_json)
-
-        llm = configure_llm(MODEL_NAME="meta-llama/llama-4-scout-17b-16e-instruct")
-        logging.info("🛡️ Sending clauses to LLM for risk analysis...")
-        response = llm.invoke(prompt)
-
-        raw_output = str(response.content if hasattr(response, "content") else response)
-
-        # Try to extract JSON manually from the string (strip code block markdowns if any)
-        try:
-            json_start = raw_output.find('{')
-            json_end = raw_output.rfind('}') + 1
-            json_text = raw_output[json_start:json_end]
-            parsed = json.loads(json_text)
-            logging.info("✅ Risk analysis complete.")
-            return parsed, raw_output
-        except Exception as json_err:
-            logging.warning("⚠️ Failed to parse JSON manually. Returning raw response.")
-            return {
-                "ambiguous_clauses": {},
-                "suggestions": {},
-                "raw_response": raw_output
-            }
+        prompt = build_risk_prompt(clauses, prompt_path)
+        logger.info("🛡️ Sending clauses to LLM for risk analysis...")
+
+        async def attempt(model: str):
+            parsed, raw = await ainvoke_structured(configure_llm(MODEL_NAME=model), prompt, RiskAnalysis, stage="risk_analysis")
+            return (parsed, raw), estimate_tokens(prompt), estimate_tokens(raw)
+
+        return _risk_result(*await aroute("risk_analysis", attempt, _parsed_ok))
 
     except Exception as e:
-        logging.error(f"❌ Risk detection failed: {e}")
+        logger.error("❌ Risk detection failed: %s", e)
         return None
 
 def get_clause_risks(file_path: str):
     
-    extracted = extract_clauses(file_path)
-    parsed_result = [parse_json_safely(text, idx) for idx, text in enumerate(extracted) if parse_json_safely(text, idx)]
-    merged_clauses = merge_clause_chunks(parsed_result)
+    merged_clauses = merge_clause_chunks(extract_clauses(file_path))
     
     risks, raw_output = analyze_clause_risks(merged_clauses, CONFIG.RISK_ANALYZER_PATH)    
     # return json.dumps(risks, indent=2)
     return risks
 
+async def aget_clause_risks(file_path: str):
+    merged_clauses = merge_clause_chunks(await aextract_clauses(file_path))
+    risks, raw_output = await aanalyze_clause_risks(merged_clauses, CONFIG.RISK_ANALYZER_PATH)
+    return risks
+
 # Sample Test
 if __name__ == "__main__":
 
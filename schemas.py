@@ -0,0 +1,48 @@
+from functools import lru_cache
+from typing import Dict, Optional, Tuple, Type
+from pydantic import BaseModel, ConfigDict, Field, create_model
+
+# Pydantic schemas for the JSON each stage asks the LLM for. Field aliases match
+# the keys used in the prompt templates, so `model_dump(by_alias=True)` returns
+# exactly the dicts the rest of the pipeline already works with.
+
+class ClauseExtraction(BaseModel):
+    """Clauses found in a single chunk, as requested by prompts/clause_extraction.txt."""
+    model_config = ConfigDict(populate_by_name=True)
+
+    termination_clause: Optional[str] = Field("Not Found", alias="Termination Clause")
+    confidentiality_clause: Optional[str] = Field("Not Found", alias="Confidentiality Clause")
+    governing_law: Optional[str] = Field("Not Found", alias="Governing Law")
+    payment_terms: Optional[str] = Field("Not Found", alias="Payment Terms")
+    liability_clause: Optional[str] = Field("Not Found", alias="Liability Clause")
+    force_majeure: Optional[str] = Field("Not Found", alias="Force Majeure")
+    dispute_resolution: Optional[str] = Field("Not Found", alias="Dispute Resolution")
+    indemnification_clause: Optional[str] = Field("Not Found", alias="Indemnification Clause")
+    intellectual_property: Optional[str] = Field("Not Found", alias="Intellectual Property")
+    amendment_clause: Optional[str] = Field("Not Found", alias="Amendment Clause")
+
+class ClauseBatchExtraction(BaseModel):
+    """Output of prompts/clause_extraction_batch.txt, keyed by chunk id."""
+    chunks: Dict[str, ClauseExtraction] = Field(default_factory=dict)
+
+@lru_cache(maxsize=None)
+def clause_subset_schemas(clauses: Tuple[str, ...]) -> Tuple[Type[BaseModel], Type[BaseModel]]:
+    """ClauseExtraction and ClauseBatchExtraction restricted to `clauses` (by alias)."""
+    fields = {name: (field.annotation, field) for name, field in ClauseExtraction.model_fields.items() if field.alias in clauses}
+    single = create_model("ClauseSubsetExtraction", __config__=ConfigDict(populate_by_name=True), **fields)
+    batch = create_model("ClauseSubsetBatchExtraction", chunks=(Dict[str, single], Field(default_factory=dict)))
+    return single, batch
+
+class RiskAnalysis(BaseModel):
+    """Output of prompts/risk_analysis.txt."""
+    ambiguous_clauses: Dict[str, str] = Field(default_factory=dict)
+    suggestions: Dict[str, str] = Field(default_factory=dict)
+
+class ContractSummary(BaseModel):
+    """Output of prompts/summarization.txt."""
+    overall_summary: str
+    clause_summaries: Dict[str, str] = Field(default_factory=dict)
+
+class DocumentClassification(BaseModel):
+    """Structured fallback answer for prompts/doc_classification.txt."""
+    category: str
@@ -0,0 +1,199 @@
+import re
+import json
+from typing import Dict, List, Tuple
+from config import config as CONFIG
+from document_loader import load_document
+from utils import instrumentation
+from utils.logging_setup import get_logger
+
+# Setup logging
+logger = get_logger("section_parser", "section_parser.log")
+
+# "12.", "12.3", "Section 4", "Article IV." followed by the heading or first sentence
+NUMBERED_LINE = re.compile(
+    r'^[ \t]*(?:(?i:article|section|clause)[ \t]+)?'
+    r'(?:(?P<number>\d{1,3}(?:\.\d{1,3})*)\.?\)?|(?P<roman>[IVXLC]{1,6})[.)])'
+    r'[ \t]+(?P<title>\S[^\n]*)$',
+    re.MULTILINE
+)
+# Unnumbered headings: short all-caps lines such as "GOVERNING LAW"
+CAPS_LINE = re.compile(r'^[ \t]*(?P<title>[A-Z][A-Z0-9 &,/\'-]{2,80})[ \t]*$', re.MULTILINE)
+
+# Headings that name one required clause. A heading matching two rules is ambiguous.
+HEADING_RULES = {
+    "Termination Clause": re.compile(r'\bterminat', re.I),
+    "Confidentiality Clause": re.compile(r'\bconfidential|\bnon-?disclosure', re.I),
+    "Governing Law": re.compile(r'\bgoverning law|\bchoice of law|\bapplicable law|\bjurisdiction', re.I),
+    "Payment Terms": re.compile(r'\bpayment|\bfees\b|\bcompensation|\binvoic', re.I),
+    "Liability Clause": re.compile(r'\bliabilit', re.I),
+    "Force Majeure": re.compile(r'\bforce majeure', re.I),
+    "Dispute Resolution": re.compile(r'\bdisputes?\b|\barbitration', re.I),
+    "Indemnification Clause": re.compile(r'\bindemn', re.I),
+    "Intellectual Property": re.compile(r'\bintellectual property|\bownership of (?:work|deliverables)', re.I),
+    "Amendment Clause": re.compile(r'\bamendments?\b|\bmodifications?\b|\bvariation', re.I),
+}
+# Sentences that state a clause on their own, for documents without a matching heading
+SENTENCE_RULES = {
+    "Governing Law": re.compile(r'[^.\n]*\b(?:governed by|construed in accordance with)\b[^.]*\blaws? of\b[^.]*\.', re.I),
+    "Force Majeure": re.compile(r'[^.\n]*\bforce majeure\b[^.]*\.', re.I),
+}
+
+def _heading_text(title: str) -> str:
+    """The heading part of a numbered line ("Governing Law. This Agreement ..." -> "Governing Law")."""
+    head = re.split(r'(?<=[a-z\)])\.\s|:\s|\s[-–—]\s', title, maxsplit=1)[0].strip().rstrip(".:")
+    words = head.split()
+    if not words or len(words) > 8 or not head[0].isupper():
+        return ""
+    # Headings are Title Case or CAPS; sentences ("The Client shall pay ...") are not
+    capitalised = sum(1 for w in words if w[0].isupper() or not w[0].isalpha())
+    return head if head == title.rstrip(".:").strip() or capitalised >= max(1, len(words) - 2) else ""
+
+def _numbered_headings(text: str) -> List[Dict]:
+    headings, top = [], None
+    for match in NUMBERED_LINE.finditer(text):
+        number = match.group("number") or match.group("roman")
+        parts = number.split(".") if match.group("number") else [number]
+        if match.group("number"):
+            first = int(parts[0])
+            # Numbering must continue the current section ("3" after "2", "3.1" inside "3");
+            # anything else is a wrapped line that merely starts with a number ("30 days after ...")
+            if top is not None and not (first == top + 1 if len(parts) == 1 else first == top):
+                continue
+            top = first
+        heading = _heading_text(match.group("title"))
+        headings.append({
+            "number": number,
+            "heading": heading,
+            "level": len(parts),
+            "start": match.start(),
+            # Inline headings ("3. Governing Law. This Agreement ...") have their body on the same line
+            "body_start": match.start("title") + len(heading),
+        })
+    return headings
+
+def _caps_headings(text: str) -> List[Dict]:
+    return [
+        {"number": None, "heading": m.group("title").strip(), "level": 1, "start": m.start(), "body_start": m.end()}
+        for m in CAPS_LINE.finditer(text)
+        if len(m.group("title").split()) <= 8
+    ]
+
+def parse_sections(text: str) -> List[Dict]:
+    """
+    Build the section tree of a document from its numbered headings (or all-caps
+    headings when it has no numbering).
+
+    Returns:
+        Top-level sections; each is {"number", "heading", "level", "start", "body_start",
+        "end", "children"} with character offsets into `text`.
+    """
+    headings = _numbered_headings(text)
+    if sum(1 for h in headings if h["level"] == 1) < 2:
+        headings = _caps_headings(text)
+
+    roots, stack = [], []
+    for section in headings:
+        section["children"] = []
+        while stack and stack[-1]["level"] >= section["level"]:
+            stack.pop()["end"] = section["start"]
+        (stack[-1]["children"] if stack else roots).append(section)
+        stack.append(section)
+    for section in stack:
+        section["end"] = len(text)
+    return roots
+
+def iter_sections(sections: List[Dict]):
+    """Depth-first walk over a section tree."""
+    for section in sections:
+        yield section
+        yield from iter_sections(section["children"])
+
+def _clause_value(text: str, start: int, end: int) -> str:
+    value = re.sub(r'\s+', ' ', text[start:end]).strip()
+    return value[:CONFIG.RULE_CLAUSE_MAX_CHARS]
+
+def resolve_clauses(text: str, sections: List[Dict]) -> Tuple[Dict[str, str], List[Tuple[int, int]]]:
+    """
+    Fill required clauses from headings and unambiguous sentences, without a model call.
+
+    A clause is resolved only when exactly one section (ignoring its own subsections)
+    has a heading naming it and no other clause, or, failing that, exactly one
+    sentence states it.
+
+    Returns:
+        (resolved clauses, character spans of the sections they were taken from)
+    """
+    flat = [s for s in iter_sections(sections) if s["heading"]]
+    resolved, spans = {}, []
+    for clause, rule in HEADING_RULES.items():
+        matches = [s for s in flat if rule.search(s["heading"])]
+        # A heading and its sub-headings ("12 Termination", "12.1 Termination for Cause") count once
+        outer = [s for s in matches if not any(o is not s and o["start"] <= s["start"] and s["end"] <= o["end"] for o in matches)]
+        if len(outer) != 1:
+            continue
+        section = outer[0]
+        if any(other.search(section["heading"]) for name, other in HEADING_RULES.items() if name != clause):
+            continue
+        if len(text[section["body_start"]:section["end"]].strip()) < 20:
+            continue
+        resolved[clause] = _clause_value(text, section["start"], section["end"])
+        spans.append((section["start"], section["end"]))
+
+    for clause, rule in SENTENCE_RULES.items():
+        if clause in resolved:
+            continue
+        sentences = {re.sub(r'\s+', ' ', m.group(0)).strip() for m in rule.finditer(text)}
+        if len(sentences) == 1:
+            resolved[clause] = sentences.pop()[:CONFIG.RULE_CLAUSE_MAX_CHARS]
+    return resolved, spans
+
+def uncovered_chunks(text: str, chunks: List[str], spans: List[Tuple[int, int]]) -> List[str]:
+    """Chunks that are not entirely inside the given spans (and so may hold other clauses)."""
+    merged: List[List[int]] = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    remaining, cursor = [], 0
+    for chunk in chunks:
+        start = text.find(chunk, cursor)
+        if start == -1:
+            start = text.find(chunk)
+        if start == -1:
+            remaining.append(chunk)
+            continue
+        cursor = start + 1
+        end = start + len(chunk)
+        if not any(s <= start and end <= e for s, e in merged):
+            remaining.append(chunk)
+    return remaining
+
+def structural_extraction(text: str, chunks: List[str]) -> Tuple[Dict[str, str], List[str]]:
+    """
+    Parse the section tree once and resolve what clauses it can.
+
+    Returns:
+        (clauses resolved without a model, chunks that still need LLM extraction)
+    """
+    try:
+        sections = parse_sections(text)
+        resolved, spans = resolve_clauses(text, sections)
+        remaining = uncovered_chunks(text, chunks, spans)
+        instrumentation.observe("lexi_rule_resolved_clause_fraction", len(resolved) / len(CONFIG.REQUIRED_CLAUSES))
+        instrumentation.increment("lexi_rule_skipped_chunks_total", len(chunks) - len(remaining))
+        logger.info("🧩 %s sections; resolved %s/%s clauses without a model call (%.0f%%), %s/%s chunks still need the LLM",
+                    sum(1 for _ in iter_sections(sections)), len(resolved), len(CONFIG.REQUIRED_CLAUSES),
+                    100 * len(resolved) / len(CONFIG.REQUIRED_CLAUSES), len(remaining), len(chunks))
+        return resolved, remaining
+    except Exception as e:
+        logger.error("❌ Structural clause detection failed: %s", e)
+        return {}, chunks
+
+# Sample Test
+if __name__ == "__main__":
+    text = load_document(CONFIG.FILE_PATH)
+    for section in iter_sections(parse_sections(text)):
+        print(f"{'  ' * (section['level'] - 1)}{section['number'] or '-'} {section['heading']} [{section['start']}:{section['end']}]")
+    print("\n🧩 Resolved clauses:\n", json.dumps(resolve_clauses(text, parse_sections(text))[0], indent=2))
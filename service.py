@@ -0,0 +1,298 @@
+import os, json, math, time, uuid, queue, argparse, threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse, parse_qs
+from pdf_agent import build_graph, run_analysis
+from config import config as CONFIG
+from utils import instrumentation
+from utils.checkpoints import get_checkpointer
+from utils.logging_setup import get_logger
+
+# Headless HTTP front end for the analysis graph.
+#
+#   POST /analyze?filename=contract.pdf   (raw file bytes, optional X-Tenant header)
+#        -> 202 {"job_id": ...} | 400 empty | 413 too large | 429 tenant limit | 503 queue/LLM budget full
+#   GET  /jobs/<id>         -> job status, and the result once finished
+#   GET  /jobs/<id>/stream  -> server-sent events, one per finished graph node
+#   GET  /healthz           -> queue depth, running jobs and LLM budget in use
+
+logger = get_logger("service", "service.log")
+
+SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
+# State keys worth returning to clients (full_text and chunks are large and internal)
+RESULT_KEYS = ["doc_type", "clauses", "risks", "clause_summary", "doc_summary", "error", "timings", "reused_from", "revision_report"]
+
+class AdmissionError(Exception):
+    """Upload refused before queueing; carries the HTTP status to answer with."""
+
+    def __init__(self, status: int, message: str, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+def estimate_llm_calls(num_bytes: int, extension: str) -> int:
+    """
+    Rough number of LLM calls one analysis will make, used for admission control.
+    PDFs carry roughly a third of their bytes as text.
+    """
+    chars = num_bytes // 3 if extension == ".pdf" else num_bytes
+    chunks = max(1, math.ceil(chars / max(1, CONFIG.CHUNK_SIZE - CONFIG.CHUNK_OVERLAP)))
+    extraction_requests = math.ceil(chunks / CONFIG.CLAUSE_BATCH_MAX_CHUNKS) if CONFIG.CLAUSE_BATCH_MODE else chunks
+    # classify + risk + clause summary + final summary, clause extraction, one summary per chunk
+    return 4 + extraction_requests + chunks
+
+class Job:
+    def __init__(self, tenant: str, filename: str, data: bytes, llm_calls: int):
+        self.id = uuid.uuid4().hex
+        self.tenant = tenant
+        self.filename = filename
+        self.data: Optional[bytes] = data  # Dropped once the job has run
+        self.llm_calls = llm_calls
+        self.status = "queued"
+        self.result: Optional[Dict[str, Any]] = None
+        self.events: List[Dict[str, Any]] = []
+        self.created = time.time()
+        self.queued_at = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.changed = threading.Condition()
+
+    def publish(self, event: Dict[str, Any], status: Optional[str] = None):
+        with self.changed:
+            self.events.append(event)
+            if status:
+                self.status = status
+            self.changed.notify_all()
+
+    def finish(self, result: Dict[str, Any], status: str):
+        with self.changed:
+            self.result = result
+            self.finished = time.time()
+            self.status = status
+            self.events.append({"status": status})
+            self.changed.notify_all()
+
+    def describe(self) -> Dict[str, Any]:
+        with self.changed:
+            return {"job_id": self.id, "tenant": self.tenant, "filename": self.filename, "status": self.status,
+                    "created": self.created, "finished": self.finished, "estimated_llm_calls": self.llm_calls,
+                    "nodes_done": [e["node"] for e in self.events if "node" in e], "result": self.result}
+
+class JobManager:
+    """
+    Bounded job queue drained by a fixed pool of worker threads, with admission
+    control on queue depth, per-tenant jobs and the estimated LLM calls in flight.
+    """
+
+    def __init__(self, workers: int = CONFIG.SERVICE_WORKERS, queue_size: int = CONFIG.SERVICE_QUEUE_SIZE,
+                 tenant_max_jobs: int = CONFIG.SERVICE_TENANT_MAX_JOBS, llm_budget: int = CONFIG.SERVICE_LLM_BUDGET,
+                 graph=None):
+        self.graph = graph if graph is not None else build_graph(checkpointer=get_checkpointer())
+        self.queue: "queue.Queue[Job]" = queue.Queue(maxsize=queue_size)
+        self.tenant_max_jobs = tenant_max_jobs
+        self.llm_budget = llm_budget
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.active_by_tenant: Dict[str, int] = {}
+        self.llm_calls_in_use = 0
+        self.running = 0
+        self._lock = threading.Lock()
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"lexi-worker-{i}", daemon=True).start()
+
+    def submit(self, tenant: str, filename: str, data: bytes) -> Job:
+        extension = os.path.splitext(filename)[1].lower()
+        if extension not in SUPPORTED_EXTENSIONS:
+            raise AdmissionError(415, f"Unsupported file type: {extension or filename}")
+        if not data:
+            raise AdmissionError(400, "Empty upload")
+        if len(data) > CONFIG.SERVICE_MAX_UPLOAD_MB * 1024 * 1024:
+            raise AdmissionError(413, f"Upload exceeds {CONFIG.SERVICE_MAX_UPLOAD_MB} MB")
+
+        llm_calls = estimate_llm_calls(len(data), extension)
+        with self._lock:
+            if self.active_by_tenant.get(tenant, 0) >= self.tenant_max_jobs:
+                self._reject("tenant_limit")
+                raise AdmissionError(429, f"Tenant {tenant} already has {self.tenant_max_jobs} jobs in progress", retry_after=30)
+            # A single job larger than the whole budget is still admitted when nothing else is in flight
+            if self.llm_calls_in_use and self.llm_calls_in_use + llm_calls > self.llm_budget:
+                self._reject("llm_budget")
+                raise AdmissionError(503, "LLM budget saturated, retry later", retry_after=30)
+
+            job = Job(tenant, os.path.basename(filename), data, llm_calls)
+            try:
+                self.queue.put_nowait(job)
+            except queue.Full:
+                self._reject("queue_full")
+                raise AdmissionError(503, "Job queue full, retry later", retry_after=10)
+
+            self.jobs[job.id] = job
+            self.active_by_tenant[tenant] = self.active_by_tenant.get(tenant, 0) + 1
+            self.llm_calls_in_use += llm_calls
+
+        instrumentation.increment("lexi_service_jobs_total", status="accepted")
+        logger.info("📥 Job %s queued for tenant %s (%s, ~%s LLM calls)", job.id, tenant, job.filename, llm_calls)
+        return job
+
+    def _reject(self, reason: str):
+        instrumentation.increment("lexi_service_jobs_total", status="rejected", reason=reason)
+        logger.warning("⛔ Upload rejected: %s", reason)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def health(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"queued": self.queue.qsize(), "running": self.running,
+                    "llm_calls_in_use": self.llm_calls_in_use, "llm_budget": self.llm_budget}
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            with self._lock:
+                self.running += 1
+            job.publish({"status": "running"}, status="running")
+            try:
+                self._run(job)
+            except Exception as e:
+                # A failure outside run_analysis must not leave the job running or kill the worker
+                logger.exception("❌ Job %s crashed: %s", job.id, e)
+                job.finish({"error": str(e)}, "failed")
+                instrumentation.increment("lexi_service_jobs_total", status="failed")
+            finally:
+                self._release(job)
+                self.queue.task_done()
+
+    def _run(self, job: Job):
+        inputs: Dict[str, Any] = {"document": job.data, "file_name": job.filename, "tenant": job.tenant}
+
+        def on_node(node: str, values: Dict[str, Any]):
+            # Streamed to clients as each node lands
+            job.publish({"node": node, "seconds": values.get("timings", {}).get(node)})
+
+        with instrumentation.bind_context(job=job.id, tenant=job.tenant), \
+                instrumentation.span("service.job", queued_at=job.queued_at):
+            # Retries resume from the last checkpointed node; partial results come back with "error"
+            state = run_analysis(self.graph, inputs, on_node=on_node)
+        status = "failed" if state.get("error") else "done"
+
+        job.finish({key: state.get(key) for key in RESULT_KEYS}, status)
+        instrumentation.increment("lexi_service_jobs_total", status=status)
+        logger.info("✅ Job %s finished: %s", job.id, status)
+
+    def _release(self, job: Job):
+        job.data = None
+        with self._lock:
+            self.running -= 1
+            self.llm_calls_in_use -= job.llm_calls
+            self.active_by_tenant[job.tenant] -= 1
+            if not self.active_by_tenant[job.tenant]:
+                del self.active_by_tenant[job.tenant]
+            finished = [j for j in self.jobs.values() if j.finished is not None]
+            # Forget the oldest finished jobs beyond the retention limit
+            for old in finished[:max(0, len(finished) - CONFIG.SERVICE_MAX_FINISHED_JOBS)]:
+                del self.jobs[old.id]
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    manager: JobManager = None  # set by serve()
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        payload = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/analyze":
+            self._send_json(404, {"error": "not found"})
+            return
+        filename = parse_qs(url.query).get("filename", [""])[0] or self.headers.get("X-Filename", "")
+        tenant = self.headers.get("X-Tenant", "default")
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > CONFIG.SERVICE_MAX_UPLOAD_MB * 1024 * 1024:
+            self.close_connection = True
+            self._send_json(413, {"error": f"Upload exceeds {CONFIG.SERVICE_MAX_UPLOAD_MB} MB"})
+            return
+        data = self.rfile.read(length)
+        try:
+            job = self.manager.submit(tenant, filename, data)
+        except AdmissionError as e:
+            headers = {"Retry-After": str(e.retry_after)} if e.retry_after else None
+            self._send_json(e.status, {"error": str(e)}, headers)
+            return
+        self._send_json(202, {"job_id": job.id, "status": job.status},
+                        {"Location": f"/jobs/{job.id}"})
+
+    def do_GET(self):
+        parts = urlparse(self.path).path.strip("/").split("/")
+        if parts == ["healthz"]:
+            self._send_json(200, self.manager.health())
+            return
+        if len(parts) not in (2, 3) or parts[0] != "jobs" or (len(parts) == 3 and parts[2] != "stream"):
+            self._send_json(404, {"error": "not found"})
+            return
+        job = self.manager.get(parts[1])
+        if job is None:
+            self._send_json(404, {"error": "unknown job"})
+            return
+        if len(parts) == 2:
+            self._send_json(200, job.describe())
+        else:
+            self._stream(job)
+
+    def _stream(self, job: Job):
+        """Server-sent events: replays past node events, then follows the job until it ends."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        sent = 0
+        try:
+            while True:
+                with job.changed:
+                    if sent == len(job.events) and job.finished is None:
+                        job.changed.wait(timeout=15)
+                    events, done = job.events[sent:], job.finished is not None
+                if not events and not done:
+                    self.wfile.write(b": keep-alive\n\n")
+                for event in events:
+                    self.wfile.write(f"data: {json.dumps(event, default=str)}\n\n".encode("utf-8"))
+                sent += len(events)
+                if done:
+                    self.wfile.write(f"event: result\ndata: {json.dumps(job.describe(), default=str)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                if done:
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            logger.info("🔌 Stream client for job %s disconnected", job.id)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+def serve(host: str = CONFIG.SERVICE_HOST, port: int = CONFIG.SERVICE_PORT):
+    ServiceHandler.manager = JobManager()
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    instrumentation.start_metrics_server()
+    logger.info("🚀 Analysis service listening on %s:%s (%s workers)", host, port, CONFIG.SERVICE_WORKERS)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("🛑 Shutting down analysis service")
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless LexiAgent analysis service.")
+    parser.add_argument("--host", default=CONFIG.SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=CONFIG.SERVICE_PORT)
+    args = parser.parse_args()
+    serve(args.host, args.port)
@@ -1,76 +1,134 @@
-import os, json, logging
-from typing import Dict, Optional
-from utils.utils import configure_llm, load_prompt_template
-from clause_extractor import parse_json_safely
-from clause_extractor import extract_clauses, merge_clause_chunks, parse_json_safely
+import json
+import asyncio
+from typing import Dict, List, Optional, Tuple
+from utils.utils import configure_llm, load_prompt_template, invoke_llm, invoke_structured, ainvoke_structured, ainvoke_llm, PARSE_STATS, estimate_tokens
+from utils.model_router import route, aroute
+from clause_extractor import extract_clauses, aextract_clauses, merge_clause_chunks
+from schemas import ContractSummary
 from document_loader import load_and_chunk
 from config import config as CONFIG
+from utils.logging_setup import get_logger
 
 # Setup logging
-os.makedirs("logs", exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler("logs/summarizer.log"),
-        logging.StreamHandler()
-    ]
-)
+logger = get_logger("summarizer", "summarizer.log")
+
+def build_summary_prompt(clauses: Dict[str, str]) -> str:
+    prompt_template = load_prompt_template(CONFIG.DOC_SUMMARIZER_PATH)
+    return prompt_template.replace("{clauses}", json.dumps(clauses, indent=2))
+
+def _summary_result(parsed: Optional[Dict], raw_output: str) -> Dict:
+    logger.info("📊 Summarization parse-failure rate: %.1f%%", PARSE_STATS.failure_rate("summarization") * 100)
+    if parsed is None:
+        logger.warning("⚠️ Structured summarization failed. Returning raw response.")
+        return {"raw_response": raw_output}
+
+    logger.info("✅ Summarization complete.")
+    return parsed
+
+def _parsed_ok(result: Tuple[Optional[Dict], str]) -> Optional[str]:
+    return None if result[0] is not None else "invalid structured output"
 
 def summarize_contract(clauses: Dict[str, str]) -> Optional[Dict]:
     try:
-        prompt_template = load_prompt_template(CONFIG.DOC_SUMMARIZER_PATH)
-        clause_json = json.dumps(clauses, indent=2)
-        prompt = prompt_template.replace("{clauses}", clause_json)
-
-        llm = configure_llm(MODEL_NAME="meta-llama/llama-4-scout-17b-16e-instruct")
-        logging.info("📝 Sending clauses to LLM for summarization...")
-        response = llm.invoke(prompt)
-        raw_output = str(response.content if hasattr(response, "content") else response)
-        try:
-            json_start = raw_output.find('{')
-            json_end = raw_output.rfind('}') + 1
-            json_text = raw_output[json_start:json_end]
-            parsed = json.loads(json_text)
-            
-            logging.info("✅ Summarization complete.")
-            return parsed
-        except Exception as parse_err:
-            logging.warning("⚠️ Failed to parse JSON. Returning raw response.")
-            return {"raw_response": str(raw_output)}
+        prompt = build_summary_prompt(clauses)
+        logger.info("📝 Sending clauses to LLM for summarization...")
+
+        def attempt(model: str):
+            parsed, raw = invoke_structured(configure_llm(MODEL_NAME=model), prompt, ContractSummary, stage="summarization")
+            return (parsed, raw), estimate_tokens(prompt), estimate_tokens(raw)
+
+        return _summary_result(*route("summarization", attempt, _parsed_ok))
     except Exception as e:
-        logging.error(f"❌ Summarization failed: {e}")
+        logger.error("❌ Summarization failed: %s", e)
         return None
 
-def get_doc_summary(file_path):
-    doc_chunks = load_and_chunk(file_path)
-    chunk_summaries = []
-    for i, chunk in enumerate(doc_chunks):
-        prompt = f"""
+async def asummarize_contract(clauses: Dict[str, str]) -> Optional[Dict]:
+    try:
+        prompt = build_summary_prompt(clauses)
+        logger.info("📝 Sending clauses to LLM for summarization...")
+
+        async def attempt(model: str):
+            parsed, raw = await ainvoke_structured(configure_llm(MODEL_NAME=model), prompt, ContractSummary, stage="summarization")
+            return (parsed, raw), estimate_tokens(prompt), estimate_tokens(raw)
+
+        return _summary_result(*await aroute("summarization", attempt, _parsed_ok))
+    except Exception as e:
+        logger.error("❌ Summarization failed: %s", e)
+        return None
+
+def chunk_summary_prompt(chunk: str) -> str:
+    return f"""
         You are a legal document assistant. Summarize the following legal text in plain English as bullet points:
         {chunk}    
         Bullet Point Summary:
         """
-        llm = configure_llm("meta-llama/llama-4-scout-17b-16e-instruct")
-        summary = llm.invoke(prompt)
-        chunk_summaries.append(summary.content.strip())
-    
-    combined_summary = "\n".join(chunk_summaries)
 
-    final_prompt = f"""
+def final_summary_prompt(combined_summary: str) -> str:
+    return f"""
     You are a legal assistant. The following is a collection of summaries of parts of a legal document. Combine them into a single, high-quality bullet point summary for the entire document, removing repetition and improving clarity.
     {combined_summary}
     Final Summary:
     """
-    final_summary = llm.invoke(final_prompt)
-    
-    return final_summary.content.strip()
+
+def revision_summary_prompt(previous_summary: str, changed_summaries: str) -> str:
+    return f"""
+    You are a legal assistant. Below is the bullet point summary of an earlier version of a legal document, followed by summaries of the parts that were added or rewritten in the new version. Update it into a single, high-quality bullet point summary of the new version, removing repetition and improving clarity.
+    Earlier Summary:
+    {previous_summary}
+    Changed Parts:
+    {changed_summaries}
+    Final Summary:
+    """
+
+def _has_bullets(summary: str) -> Optional[str]:
+    bullets = [line for line in summary.splitlines() if line.strip().startswith(("-", "*", "•"))]
+    return None if bullets else "no bullet points"
+
+def _summarize(prompt: str) -> str:
+    def attempt(model: str):
+        summary = invoke_llm(configure_llm(model), prompt).content.strip()
+        return summary, estimate_tokens(prompt), estimate_tokens(summary)
+    return route("document_summary", attempt, _has_bullets)
+
+async def _asummarize(prompt: str) -> str:
+    async def attempt(model: str):
+        summary = (await ainvoke_llm(configure_llm(model), prompt)).content.strip()
+        return summary, estimate_tokens(prompt), estimate_tokens(summary)
+    return await aroute("document_summary", attempt, _has_bullets)
+
+def summarize_chunks(doc_chunks: List[str]) -> str:
+    """Bullet-point summary of a whole document from its chunks (map, then combine)."""
+    chunk_summaries = [_summarize(chunk_summary_prompt(chunk)) for chunk in doc_chunks]
+    combined_summary = "\n".join(chunk_summaries)
+    return _summarize(final_summary_prompt(combined_summary))
+
+async def asummarize_chunks(doc_chunks: List[str]) -> str:
+    """Async variant of summarize_chunks; chunk summaries are requested concurrently."""
+    chunk_summaries = await asyncio.gather(*(_asummarize(chunk_summary_prompt(chunk)) for chunk in doc_chunks))
+    combined_summary = "\n".join(chunk_summaries)
+    return await _asummarize(final_summary_prompt(combined_summary))
+
+def revise_summary(previous_summary: str, changed_chunks: List[str]) -> str:
+    """Summary of a new version of a document from its earlier version's summary and the changed chunks."""
+    chunk_summaries = [_summarize(chunk_summary_prompt(chunk)) for chunk in changed_chunks]
+    return _summarize(revision_summary_prompt(previous_summary, "\n".join(chunk_summaries)))
+
+async def arevise_summary(previous_summary: str, changed_chunks: List[str]) -> str:
+    """Async variant of revise_summary."""
+    chunk_summaries = await asyncio.gather(*(_asummarize(chunk_summary_prompt(chunk)) for chunk in changed_chunks))
+    return await _asummarize(revision_summary_prompt(previous_summary, "\n".join(chunk_summaries)))
+
+def get_doc_summary(file_path):
+    _, doc_chunks = load_and_chunk(file_path)
+    return summarize_chunks(doc_chunks)
+
+async def aget_doc_summary(file_path):
+    _, doc_chunks = await asyncio.to_thread(load_and_chunk, file_path)
+    return await asummarize_chunks(doc_chunks)
 
 def get_summary(file_path: str):
     
-    extracted = extract_clauses(file_path)
-    parsed = [parse_json_safely(text, idx) for idx, text in enumerate(extracted) if parse_json_safely(text, idx)]
-    merged_clauses = merge_clause_chunks(parsed)
+    merged_clauses = merge_clause_chunks(extract_clauses(file_path))
 
     clause_summary = summarize_contract(merged_clauses)
     doc_summary = get_doc_summary(file_path)
@@ -78,6 +136,10 @@ def get_summary(file_path: str):
     # return json.dumps(clause_summary, indent=2), doc_summary
     return clause_summary, doc_summary
 
+async def aget_summary(file_path: str):
+    merged_clauses = merge_clause_chunks(await aextract_clauses(file_path))
+    return await asyncio.gather(asummarize_contract(merged_clauses), aget_doc_summary(file_path))
+
 if __name__ == "__main__":
 
     clause_summary, doc_summary = get_summary(CONFIG.FILE_PATH)
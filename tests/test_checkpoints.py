@@ -0,0 +1,33 @@
+import io
+from config import config as CONFIG
+from utils.checkpoints import document_hash, thread_key, thread_lock
+
+def test_empty_upload_is_keyed_by_its_bytes():
+    # b"" must not fall through to a missing file_path
+    assert thread_key({"document": b""}) != thread_key({"document": b"x"})
+
+def test_thread_key_changes_with_previous_version_and_settings(monkeypatch):
+    base = thread_key({"document": b"contract"})
+    assert thread_key({"document": b"contract"}) == base
+    assert thread_key({"document": b"contract", "previous_version": "abc"}) != base
+    monkeypatch.setattr(CONFIG, "MODEL_CASCADES", {**CONFIG.MODEL_CASCADES, "classification": ["other-model"]})
+    assert thread_key({"document": b"contract"}) != base
+
+def test_thread_lock_is_shared_per_thread():
+    first = thread_lock("thread-a")
+    assert thread_lock("thread-a") is first
+    assert thread_lock("thread-b") is not first
+
+def test_file_like_documents_hash_their_contents_and_keep_their_position():
+    class Upload:  # read/seek/tell only, no getvalue
+        def __init__(self, data):
+            self.buffer = io.BytesIO(data)
+            self.read, self.seek, self.tell = self.buffer.read, self.buffer.seek, self.buffer.tell
+
+    expected = document_hash(b"contract")
+    buffered, upload = io.BytesIO(b"contract"), Upload(b"contract")
+    buffered.seek(3)
+    upload.seek(5)
+    assert document_hash(buffered) == document_hash(upload) == expected
+    assert (buffered.tell(), upload.tell()) == (3, 5)
+    assert thread_key({"document": io.BytesIO(b"contract")}) == thread_key({"document": b"contract"})
@@ -0,0 +1,31 @@
+import clause_extractor
+from config import config as CONFIG
+from utils.utils import load_prompt_template
+
+def test_restrict_prompt_keeps_only_unresolved_clauses():
+    template = load_prompt_template(CONFIG.CLAUSE_EXTRACTION_PROMPT_PATH)
+    prompt = clause_extractor.restrict_prompt(template, ("Governing Law", "Amendment Clause"))
+    assert "1. Governing Law\n2. Amendment Clause\n" in prompt
+    assert '"Governing Law": "...",\n  "Amendment Clause": "..."\n}' in prompt
+    assert "Termination Clause" not in prompt
+
+def test_document_skips_llm_when_headings_resolve_every_clause(monkeypatch):
+    resolved = {clause: f"{clause} text" for clause in CONFIG.REQUIRED_CLAUSES}
+    monkeypatch.setattr(CONFIG, "CLAUSE_RULES_ENABLED", True)
+    monkeypatch.setattr(clause_extractor, "structural_extraction", lambda text, chunks: (resolved, chunks[1:]))
+
+    def fail(*args, **kwargs):
+        raise AssertionError("LLM extraction should not run")
+
+    monkeypatch.setattr(clause_extractor, "extract_clauses_from_chunks", fail)
+    assert clause_extractor.extract_clauses_from_document("text", ["a", "b"]) == [resolved]
+
+def test_document_asks_only_for_unresolved_clauses(monkeypatch):
+    resolved = {clause: f"{clause} text" for clause in CONFIG.REQUIRED_CLAUSES[1:]}
+    calls = []
+    monkeypatch.setattr(CONFIG, "CLAUSE_RULES_ENABLED", True)
+    monkeypatch.setattr(clause_extractor, "structural_extraction", lambda text, chunks: (resolved, chunks))
+    monkeypatch.setattr(clause_extractor, "extract_clauses_from_chunks",
+                        lambda chunks, strict, clauses: calls.append(clauses) or [])
+    clause_extractor.extract_clauses_from_document("text", ["a"])
+    assert calls == [[CONFIG.REQUIRED_CLAUSES[0]]]
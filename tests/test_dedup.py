@@ -0,0 +1,35 @@
+import sqlite3
+import numpy as np
+import pytest
+import dedup
+from config import config as CONFIG
+
+TEXT = " ".join(f"The supplier shall deliver item {i} within thirty days of each written order." for i in range(20))
+
+@pytest.fixture
+def store_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "analyses.sqlite")
+    monkeypatch.setattr(CONFIG, "ANALYSIS_STORE_PATH", path)
+    monkeypatch.setattr(CONFIG, "DEDUP_ENABLED", True)
+    monkeypatch.setattr(dedup, "_store", None)
+    monkeypatch.setattr(dedup, "_indexes", None)
+    return path
+
+def test_near_duplicates_are_only_found_within_a_tenant(store_path):
+    state = {"doc_type": "Service Agreement", "clauses": {}, "doc_summary": "- Tenant A's contract"}
+    dedup.remember_analysis("a.pdf", TEXT, [TEXT], state, tenant="a")
+    assert dedup.find_near_duplicate(TEXT + " Signed.", tenant="b") is None
+    assert dedup.get_analysis(dedup.text_hash(TEXT), tenant="b") is None
+    record, _ = dedup.find_near_duplicate(TEXT + " Signed.", tenant="a")
+    assert record["name"] == "a.pdf"
+
+def test_unscoped_store_is_migrated_to_the_default_tenant(store_path):
+    conn = sqlite3.connect(store_path)
+    conn.execute("CREATE TABLE analyses (hash TEXT PRIMARY KEY, name TEXT, signature BLOB NOT NULL, "
+                 "result TEXT NOT NULL, created REAL NOT NULL)")
+    conn.execute("INSERT INTO analyses VALUES (?, ?, ?, ?, ?)",
+                 (dedup.text_hash(TEXT), "old.pdf", dedup.minhash(TEXT).tobytes(), "{}", 0.0))
+    conn.commit()
+    conn.close()
+    assert dedup.get_analysis(dedup.text_hash(TEXT))["name"] == "old.pdf"
+    assert dedup.find_near_duplicate(TEXT, tenant="other") is None
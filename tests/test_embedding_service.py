@@ -0,0 +1,39 @@
+import threading
+import numpy as np
+from utils.embedding_service import EmbeddingService
+
+class FakeModel:
+    """Embeds a text as [len(text), 1]; the first encode waits for `release`."""
+
+    def __init__(self, fail_first: bool = False):
+        self.release = threading.Event()
+        self.fail_first = fail_first
+        self.calls = 0
+
+    def encode(self, texts, **kwargs):
+        self.calls += 1
+        if self.calls == 1:
+            self.release.wait(5)
+            if self.fail_first:
+                raise RuntimeError("model failed")
+        return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+def test_cancelled_request_does_not_stop_the_batcher():
+    model = FakeModel()
+    service = EmbeddingService(model, max_batch=8, max_wait_ms=1, encode_batch_size=8)
+    busy = service.submit(["first"])
+    while model.calls == 0:  # wait until the batcher is inside encode
+        threading.Event().wait(0.001)
+    cancelled = service.submit(["gone"])
+    assert cancelled.cancel()
+    model.release.set()
+    assert busy.result(5).tolist() == [[5.0, 1.0]]
+    assert service.encode(["next one"], timeout=5).tolist() == [[8.0, 1.0]]
+
+def test_failed_batch_does_not_stop_the_batcher():
+    model = FakeModel(fail_first=True)
+    service = EmbeddingService(model, max_batch=8, max_wait_ms=1, encode_batch_size=8)
+    failed = service.submit(["first"])
+    model.release.set()
+    assert isinstance(failed.exception(5), RuntimeError)
+    assert service.encode(["after"], timeout=5).tolist() == [[5.0, 1.0]]
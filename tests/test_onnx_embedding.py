@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from config import config as CONFIG
+
+# The ONNX backend is optional (requirements-onnx.txt); exporting also needs torch
+pytest.importorskip("onnxruntime")
+pytest.importorskip("tokenizers")
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+sentence_transformers = pytest.importorskip("sentence_transformers")
+
+SENTENCES = [
+    "This Agreement shall be governed by the laws of the State of New York.",
+    "Either party may terminate this Agreement upon thirty days' written notice.",
+    "The Receiving Party shall keep all Confidential Information strictly confidential.",
+    "Payment is due within forty-five days of the invoice date.",
+    "Short clause.",
+]
+
+def test_int8_embeddings_stay_within_cosine_tolerance_of_fp32(tmp_path):
+    from utils.onnx_embedding import OnnxEmbeddingModel, export_onnx_model
+
+    export_onnx_model(CONFIG.EMBEDDING_MODEL_NAME, str(tmp_path))
+    onnx = OnnxEmbeddingModel(str(tmp_path), quantized=True).encode(SENTENCES)
+    torch = sentence_transformers.SentenceTransformer(CONFIG.EMBEDDING_MODEL_NAME, device="cpu").encode(
+        SENTENCES, convert_to_numpy=True, normalize_embeddings=True)
+    cosine = (np.asarray(torch, dtype=np.float32) * onnx).sum(axis=1)
+    assert cosine.min() >= CONFIG.ONNX_MIN_COSINE
@@ -0,0 +1,32 @@
+import sqlite3
+import pytest
+from config import config as CONFIG
+from utils import checkpoints
+
+SqliteSaver = pytest.importorskip("langgraph.checkpoint.sqlite").SqliteSaver
+import pdf_agent
+
+CONTRACT = (b"NON-DISCLOSURE AGREEMENT\n\nThe Receiving Party shall keep all confidential information secret. "
+            b"This Agreement shall be governed by the laws of the State of New York. Either party may terminate "
+            b"this Agreement upon thirty days' written notice. Payment of fees is due within thirty days.")
+
+@pytest.fixture
+def graph(tmp_path, monkeypatch):
+    monkeypatch.setattr(CONFIG, "LLM_BACKEND", "fake")
+    monkeypatch.setattr(CONFIG, "RATE_LIMIT_PAUSE", 0)
+    monkeypatch.setattr(CONFIG, "DEDUP_ENABLED", False)
+    monkeypatch.setattr(CONFIG, "RESULTS_STORE_ENABLED", False)
+    monkeypatch.setattr(CONFIG, "CHECKPOINT_DB_PATH", str(tmp_path / "checkpoints.sqlite"))
+    monkeypatch.setattr(checkpoints, "_chunk_cache", None)
+    saver = SqliteSaver(sqlite3.connect(str(tmp_path / "graph.sqlite"), check_same_thread=False))
+    return pdf_agent.build_graph(checkpointer=saver)
+
+def test_checkpointed_run_completes_on_the_fake_backend(graph):
+    inputs = {"document": CONTRACT, "file_name": "contract.txt", "tenant": "test"}
+    state = pdf_agent.run_analysis(graph, inputs)
+    assert not state.get("error")
+    assert state["doc_type"] == "Non Disclosure Agreement"
+    assert state["clauses"]["Governing Law"] != "Not Found"
+    assert state["clause_summary"]["overall_summary"]
+    # The finished thread is reused as is
+    assert pdf_agent.run_analysis(graph, inputs)["clauses"] == state["clauses"]
@@ -0,0 +1,37 @@
+import sqlite3
+from results_store import ResultsStore, to_record
+
+def state(tenant, doc_type, indemnification):
+    return {"tenant": tenant, "document_hash": "same-bytes", "doc_type": doc_type,
+            "clauses": {"Indemnification Clause": indemnification}, "timings": {"classify": 1.0}}
+
+def test_records_are_keyed_by_document_hash_and_tenant():
+    record = to_record("a.pdf", {**state("a", "Lease Agreement", "Not Found"), "full_text": "text"})
+    assert (record["tenant"], record["hash"]) == ("a", "same-bytes")
+
+def test_queries_only_see_one_tenant(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.sqlite"))
+    store.put_many([to_record("a.pdf", state("a", "Lease Agreement", "Not Found")),
+                    to_record("b.pdf", state("b", "Lease Agreement", "Tenant B indemnifies."))])
+    assert [r["name"] for r in store.documents_missing("Indemnification Clause", tenant="a")] == ["a.pdf"]
+    assert store.documents_missing("Indemnification Clause", tenant="b") == []
+    assert [r["name"] for r in store.documents_of_type("Lease Agreement", tenant="b")] == ["b.pdf"]
+    coverage = {r["clause"]: r for r in store.clause_coverage(tenant="b")}
+    assert (coverage["Indemnification Clause"]["found"], coverage["Indemnification Clause"]["documents"]) == (1, 1)
+    assert store.stage_timings(tenant="c") == []
+
+def test_unscoped_store_is_migrated_to_the_default_tenant(tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE documents (hash TEXT PRIMARY KEY, name TEXT, doc_type TEXT, doc_summary TEXT, "
+                 "overall_summary TEXT, reused_from TEXT, total_seconds REAL, analyzed REAL NOT NULL)")
+    conn.execute("CREATE TABLE clauses (hash TEXT NOT NULL, clause TEXT NOT NULL, present INTEGER NOT NULL, value TEXT, "
+                 "risk TEXT, suggestion TEXT, summary TEXT, PRIMARY KEY (hash, clause))")
+    conn.execute("CREATE TABLE stage_timings (hash TEXT NOT NULL, stage TEXT NOT NULL, seconds REAL NOT NULL, "
+                 "PRIMARY KEY (hash, stage))")
+    conn.execute("INSERT INTO documents VALUES ('h', 'old.pdf', 'Lease Agreement', NULL, NULL, NULL, 1.0, 0.0)")
+    conn.commit()
+    conn.close()
+    store = ResultsStore(path)
+    assert [r["name"] for r in store.documents_of_type("Lease Agreement")] == ["old.pdf"]
+    assert store.query("SELECT name FROM sqlite_master WHERE type = 'index' AND name = 'idx_documents_type'")
@@ -0,0 +1,41 @@
+import time
+import pytest
+import service
+from service import AdmissionError, JobManager
+
+def wait_finished(job, manager, timeout=5.0):
+    with job.changed:
+        job.changed.wait_for(lambda: job.finished is not None, timeout=timeout)
+    assert job.finished is not None, f"job still {job.status}"
+    # The worker releases the job's slot right after finishing it
+    deadline = time.monotonic() + timeout
+    while manager.health()["running"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+@pytest.fixture
+def manager():
+    # The graph is never used: run_analysis is patched in each test
+    return JobManager(workers=1, graph=object())
+
+def test_empty_upload_is_rejected(manager):
+    with pytest.raises(AdmissionError) as excinfo:
+        manager.submit("tenant", "contract.pdf", b"")
+    assert excinfo.value.status == 400
+    assert manager.health()["queued"] == 0
+
+def test_raising_graph_fails_job_and_keeps_worker(manager, monkeypatch):
+    def crash(graph, inputs, on_node=None):
+        raise KeyError("file_path")
+    monkeypatch.setattr(service, "run_analysis", crash)
+    job = manager.submit("tenant", "contract.pdf", b"%PDF-1.4")
+    wait_finished(job, manager)
+    assert job.status == "failed"
+    assert "file_path" in job.result["error"]
+
+    # The single worker survived and the tenant's slot and LLM budget were released
+    monkeypatch.setattr(service, "run_analysis", lambda graph, inputs, on_node=None: {"doc_type": "NDA"})
+    job = manager.submit("tenant", "contract.pdf", b"%PDF-1.4")
+    wait_finished(job, manager)
+    assert job.status == "done"
+    assert job.result["doc_type"] == "NDA"
+    assert manager.health()["llm_calls_in_use"] == 0
@@ -0,0 +1,83 @@
+import versioning
+
+PREVIOUS = {
+    "name": "template.pdf", "hash": "abc", "doc_type": "Lease Agreement", "doc_summary": "- Another tenant's lease",
+    "clauses": {"Governing Law": "Laws of Texas."}, "verbatim_clauses": ["Governing Law"],
+    "risks": {"ambiguous_clauses": {}, "suggestions": {}},
+    "clause_summary": {"overall_summary": "Another tenant's lease.", "clause_summaries": {}},
+    "chunk_hashes": [versioning.text_hash("Governing law: Laws of Texas.")],
+}
+
+def test_identical_near_duplicate_makes_no_llm_calls(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("unexpected LLM call")
+    for name in ("summarize_chunks", "revise_summary", "extract_clauses_from_chunks", "summarize_contract"):
+        monkeypatch.setattr(versioning, name, fail)
+    chunks = ["Governing law: Laws of Texas."]
+    state = {"full_text": chunks[0], "chunks": chunks}
+    state = versioning.reanalyze_revision(state, PREVIOUS)
+    assert state["doc_type"] == PREVIOUS["doc_type"]
+    assert state["doc_summary"] == PREVIOUS["doc_summary"]
+    assert state["clauses"]["Governing Law"] == "Laws of Texas."
+
+def test_near_duplicate_revises_its_summary_from_changed_chunks(monkeypatch):
+    revised = []
+    monkeypatch.setattr(versioning, "summarize_chunks", lambda chunks: "- Recomputed")
+    monkeypatch.setattr(versioning, "revise_summary", lambda summary, chunks: revised.append(chunks) or "- Revised")
+    monkeypatch.setattr(versioning, "extract_clauses_from_chunks", lambda chunks, strict: [{}])
+    chunks = ["Governing law: Laws of Texas.", "Fees: 10 USD."]
+    state = {"full_text": " ".join(chunks), "chunks": chunks}
+    state = versioning.reanalyze_revision(state, PREVIOUS)
+    assert (state["doc_type"], state["doc_summary"]) == (PREVIOUS["doc_type"], "- Revised")
+    assert revised == [["Fees: 10 USD."]]
+    monkeypatch.setattr(versioning.CONFIG, "REVISION_RESUMMARIZE_FRACTION", 0.25)
+    state = versioning.reanalyze_revision({"full_text": " ".join(chunks), "chunks": chunks}, PREVIOUS)
+    assert state["doc_summary"] == "- Recomputed"
+
+def test_any_clause_change_regenerates_the_overall_summary(monkeypatch):
+    summarized = []
+    monkeypatch.setattr(versioning, "summarize_chunks", lambda chunks: "- Rewritten")
+    monkeypatch.setattr(versioning, "extract_clauses_from_chunks",
+                        lambda chunks, strict: [{"Governing Law": "Laws of Ohio."}])
+    monkeypatch.setattr(versioning, "analyze_clause_risks", lambda clauses, path: ({"ambiguous_clauses": {}, "suggestions": {}}, ""))
+    monkeypatch.setattr(versioning, "summarize_contract",
+                        lambda clauses: summarized.append(clauses) or {"overall_summary": "Ohio law.", "clause_summaries": {}})
+    chunks = ["Governing law: Laws of Ohio."]
+    state = {"full_text": chunks[0], "chunks": chunks, "previous_version": "abc"}
+    state = versioning.reanalyze_revision(state, PREVIOUS)
+    assert state["clauses"]["Governing Law"] == "Laws of Ohio."
+    assert state["clause_summary"]["overall_summary"] == "Ohio law."
+    assert summarized == [state["clauses"]]
+
+def test_unchanged_version_keeps_its_summaries(monkeypatch):
+    monkeypatch.setattr(versioning, "summarize_contract", lambda clauses: None)
+    chunks = ["Governing law: Laws of Texas."]
+    state = {"full_text": chunks[0], "chunks": chunks, "previous_version": "abc"}
+    state = versioning.reanalyze_revision(state, PREVIOUS)
+    assert state["doc_summary"] == PREVIOUS["doc_summary"]
+    assert state["clause_summary"] == PREVIOUS["clause_summary"]
+
+def test_negation_redline_is_a_modified_clause(monkeypatch):
+    tail = " this Agreement at any time upon thirty days' prior written notice to the other party, delivered by hand or by registered mail."
+    old, new = "Either party may terminate" + tail, "Either party may not terminate" + tail
+    previous = dict(PREVIOUS, clauses={"Termination": old}, verbatim_clauses=["Termination"],
+                    chunk_hashes=[versioning.text_hash(old)])
+    monkeypatch.setattr(versioning, "summarize_chunks", lambda chunks: "- Rewritten")
+    monkeypatch.setattr(versioning, "extract_clauses_from_chunks", lambda chunks, strict: [{"Termination": new}])
+    monkeypatch.setattr(versioning, "analyze_clause_risks",
+                        lambda clauses, path: ({"ambiguous_clauses": {"Termination": "No exit."}, "suggestions": {}}, ""))
+    monkeypatch.setattr(versioning, "summarize_contract",
+                        lambda clauses: {"overall_summary": "No termination.", "clause_summaries": {}})
+    state = {"full_text": new, "chunks": [new], "previous_version": "abc"}
+    state = versioning.reanalyze_revision(state, previous)
+    assert state["clauses"]["Termination"] == new
+    assert state["risks"]["ambiguous_clauses"]["Termination"] == "No exit."
+    [entry] = state["revision_report"]["clauses"]
+    assert (entry["clause"], entry["status"], entry["old_value"]) == ("Termination", "modified", old)
+
+def test_verbatim_clause_outside_changed_chunks_carries_over():
+    text = "Governing law: Laws of\nTexas. Fees: 10 USD."
+    clauses, changes = versioning.diff_clauses({"Governing Law": "Laws of Texas."}, {}, text,
+                                               {"Governing Law"}, [(text.index("Fees"), len(text))])
+    assert clauses["Governing Law"] == "Laws of Texas."
+    assert "Governing Law" not in changes
@@ -0,0 +1,37 @@
+import asyncio, threading, weakref
+from typing import Any, Awaitable, Optional
+from config import config as CONFIG
+
+# One event loop per process, on a daemon thread, shared by every async analysis.
+# Synchronous callers (Streamlit scripts, worker threads) submit coroutines to it
+# with run_sync, so all in-flight analyses share the cached LLM clients and their
+# connection pools.
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_lock = threading.Lock()
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Return the shared event loop, starting it on first use."""
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="lexi-event-loop", daemon=True).start()
+    return _loop
+
+def run_sync(coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """Run `coro` on the shared loop and block the calling thread until it finishes."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
+
+def llm_semaphore() -> asyncio.Semaphore:
+    """
+    Semaphore capping concurrent LLM requests on the running loop at
+    CONFIG.MAX_CONCURRENT_LLM_CALLS, across every analysis on that loop.
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        semaphore = _semaphores.get(loop)
+        if semaphore is None:
+            semaphore = _semaphores[loop] = asyncio.Semaphore(CONFIG.MAX_CONCURRENT_LLM_CALLS)
+    return semaphore
@@ -0,0 +1,234 @@
+import time, random, asyncio, threading, contextvars
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+from config import config as CONFIG
+from utils import instrumentation
+from utils.logging_setup import get_logger
+
+# Shared policy for every LLM request: per-call timeout, exponential backoff with
+# full jitter for retryable errors, a circuit breaker per model and optional hedging
+# (a duplicate request once the first one runs past the model's p95 latency).
+# Synchronous calls run on the caller's thread and rely on the client's request
+# timeout; only hedged calls use the worker pool.
+
+logger = get_logger("utils.call_policy", "utils.log")
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_NAMES = ("Timeout", "RateLimit", "APIConnection", "InternalServer", "ServiceUnavailable", "FakeLLMError")
+
+class LLMTimeoutError(TimeoutError):
+    """An LLM request exceeded CONFIG.LLM_TIMEOUT."""
+
+class CircuitOpenError(RuntimeError):
+    """Requests to a model are refused while its circuit breaker is open."""
+
+def is_retryable(error: Exception) -> bool:
+    """Timeouts, connection problems, rate limits and 5xx answers are worth retrying."""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status in RETRYABLE_STATUS:
+        return True
+    return any(name in type(error).__name__ for name in RETRYABLE_NAMES)
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for the given (1-based) retry."""
+    cap = min(CONFIG.LLM_BACKOFF_MAX, CONFIG.LLM_BACKOFF_BASE * 2 ** (attempt - 1))
+    return random.uniform(0, cap)
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and refuses calls for `reset_seconds`;
+    then lets one trial call through (half-open) and closes again if it succeeds.
+    """
+
+    def __init__(self, model: str, threshold: int, reset_seconds: float):
+        self.model = model
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at >= self.reset_seconds and not self.trial_running:
+                self.trial_running = True  # half-open: one trial request
+                return
+        instrumentation.increment("lexi_llm_circuit_rejections_total", model=self.model)
+        raise CircuitOpenError(f"Circuit open for {self.model}; retry in {self.reset_seconds:.0f}s")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning("🔌 Circuit opened for %s after %s consecutive failures", self.model, self.failures)
+                    instrumentation.increment("lexi_llm_circuit_opened_total", model=self.model)
+                self.opened_at = time.monotonic()
+
+class LatencyTracker:
+    """Recent successful call latencies of one model, for the hedging delay."""
+
+    def __init__(self, size: int = 200):
+        self.samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            if len(self.samples) < CONFIG.LLM_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+_lock = threading.Lock()
+_breakers: Dict[str, CircuitBreaker] = {}
+_latencies: Dict[str, LatencyTracker] = {}
+_executor: Optional[ThreadPoolExecutor] = None
+
+def breaker(model: str) -> CircuitBreaker:
+    with _lock:
+        if model not in _breakers:
+            _breakers[model] = CircuitBreaker(model, CONFIG.LLM_BREAKER_THRESHOLD, CONFIG.LLM_BREAKER_RESET_SECONDS)
+        return _breakers[model]
+
+def latency(model: str) -> LatencyTracker:
+    with _lock:
+        if model not in _latencies:
+            _latencies[model] = LatencyTracker()
+        return _latencies[model]
+
+def hedge_delay(model: str) -> Optional[float]:
+    """Seconds after which a duplicate request is issued, or None when hedging is off."""
+    if not CONFIG.LLM_HEDGING_ENABLED:
+        return None
+    p = latency(model).percentile(CONFIG.LLM_HEDGE_PERCENTILE)
+    return None if p is None else max(p, CONFIG.LLM_HEDGE_MIN_DELAY)
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=CONFIG.LLM_POLICY_THREADS, thread_name_prefix="lexi-llm")
+        return _executor
+
+def _submit(fn: Callable[[], Any]):
+    # Run in a copy of the caller's context so instrumentation and callbacks keep their tags
+    return _pool().submit(contextvars.copy_context().run, fn)
+
+def _run_once(fn: Callable[[], Any], model: str) -> Any:
+    """
+    One attempt. The timeout is enforced by the client request itself (see
+    utils.llm_backends), so an attempt only leaves the calling thread when it may
+    need a hedge.
+    """
+    delay = hedge_delay(model)
+    if delay is None:
+        return fn()
+
+    timeout = CONFIG.LLM_TIMEOUT or None
+    start = time.monotonic()
+    futures = {_submit(fn)}
+    done, _ = wait(futures, timeout=delay)
+    if not done and (timeout is None or delay < timeout):
+        logger.info("🐢 %s request past p%s (%.1fs); sending a hedge", model, CONFIG.LLM_HEDGE_PERCENTILE, delay)
+        instrumentation.increment("lexi_llm_hedges_total", model=model)
+        futures.add(_submit(fn))
+        remaining = None if timeout is None else max(0.0, timeout - (time.monotonic() - start))
+        done, _ = wait(futures, timeout=remaining, return_when=FIRST_COMPLETED)
+    if not done:
+        # The client-side timeout ends the abandoned requests and frees their threads
+        raise LLMTimeoutError(f"{model} request timed out after {timeout}s")
+    # Prefer a successful copy when both finished
+    finished = sorted(done, key=lambda f: f.exception() is not None)
+    return finished[0].result()
+
+async def _arun_once(factory: Callable[[], Awaitable[Any]], model: str) -> Any:
+    timeout = CONFIG.LLM_TIMEOUT or None
+    delay = hedge_delay(model)
+    start = time.monotonic()
+    tasks = {asyncio.ensure_future(factory())}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay if delay is not None else timeout)
+        if not done and delay is not None and (timeout is None or delay < timeout):
+            logger.info("🐢 %s request past p%s (%.1fs); sending a hedge", model, CONFIG.LLM_HEDGE_PERCENTILE, delay)
+            instrumentation.increment("lexi_llm_hedges_total", model=model)
+            tasks.add(asyncio.ensure_future(factory()))
+            remaining = None if timeout is None else max(0.0, timeout - (time.monotonic() - start))
+            done, _ = await asyncio.wait(tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            raise LLMTimeoutError(f"{model} request timed out after {timeout}s")
+        finished = sorted(done, key=lambda t: t.exception() is not None)
+        return finished[0].result()
+    finally:
+        for task in tasks:
+            task.cancel()  # losers of a hedge and timed-out requests are really cancelled
+
+def _after_failure(model: str, error: Exception, attempt: int) -> Optional[float]:
+    """Record a failed attempt; return the backoff before the next one, or None to give up."""
+    if not is_retryable(error):
+        # The model answered (e.g. a 400 for invalid JSON); that says nothing about its health
+        breaker(model).record_success()
+        return None
+    breaker(model).record_failure()
+    if attempt > CONFIG.LLM_MAX_RETRIES:
+        return None
+    reason = "timeout" if isinstance(error, TimeoutError) else "error"
+    instrumentation.increment("lexi_llm_retries_total", reason=reason, model=model)
+    delay = backoff_delay(attempt)
+    logger.warning("🔁 %s failed (%s: %s). Retry %s/%s in %.1fs",
+                   model, type(error).__name__, error, attempt, CONFIG.LLM_MAX_RETRIES, delay)
+    return delay
+
+def call_with_policy(fn: Callable[[], Any], model: str) -> Any:
+    """Call `fn` (one LLM request) under the timeout, retry, breaker and hedging policy."""
+    attempt = 0
+    while True:
+        breaker(model).allow()
+        start = time.monotonic()
+        try:
+            result = _run_once(fn, model)
+        except Exception as e:
+            attempt += 1
+            delay = _after_failure(model, e, attempt)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            continue
+        breaker(model).record_success()
+        latency(model).add(time.monotonic() - start)
+        return result
+
+async def acall_with_policy(factory: Callable[[], Awaitable[Any]], model: str) -> Any:
+    """Async variant of call_with_policy; `factory` creates a fresh coroutine per request."""
+    attempt = 0
+    while True:
+        breaker(model).allow()
+        start = time.monotonic()
+        try:
+            result = await _arun_once(factory, model)
+        except Exception as e:
+            attempt += 1
+            delay = _after_failure(model, e, attempt)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            continue
+        breaker(model).record_success()
+        latency(model).add(time.monotonic() - start)
+        return result
@@ -0,0 +1,169 @@
+import os, json, time, sqlite3, hashlib, threading, weakref
+from typing import Any, Dict, List, Optional, Union
+from config import config as CONFIG
+from utils.logging_setup import get_logger
+
+# Local SQLite persistence that lets long analyses survive failures: LangGraph
+# checkpoints (one thread per document and analysis configuration) and a cache of
+# per-chunk LLM results.
+
+logger = get_logger("utils.checkpoints", "utils.log")
+
+_lock = threading.Lock()
+_checkpointer = None
+_chunk_cache: Optional["ChunkResultCache"] = None
+
+def _connect(path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+def document_hash(source: Any) -> str:
+    """
+    sha256 of a document's bytes: read from disk when given a path, and from the
+    contents of a file-like object (e.g. a Streamlit upload) without moving its position.
+    """
+    digest = hashlib.sha256()
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    elif hasattr(source, "getvalue"):
+        digest.update(_as_bytes(source.getvalue()))
+    elif hasattr(source, "read"):
+        position = source.tell()
+        source.seek(0)
+        try:
+            for block in iter(lambda: source.read(1 << 20), source.read(0)):
+                digest.update(_as_bytes(block))
+        finally:
+            source.seek(position)
+    else:
+        digest.update(bytes(source))
+    return digest.hexdigest()
+
+def _as_bytes(data: Union[str, bytes]) -> bytes:
+    return data.encode("utf-8") if isinstance(data, str) else bytes(data)
+
+# Settings that change an analysis' result; a finished checkpoint is only reused while they match
+ANALYSIS_SETTINGS = [
+    "MODEL_CASCADES", "REQUIRED_CLAUSES", "CHUNK_SIZE", "CHUNK_OVERLAP", "CLAUSE_BATCH_MODE",
+    "CLAUSE_RULES_ENABLED", "CLASSIFICATION_FAST_MODE", "DEDUP_ENABLED", "DEDUP_THRESHOLD",
+    "PDF_FAST_ENGINE", "PDF_LAYOUT_ENGINE",
+]
+PROMPT_PATHS = [
+    "CLAUSE_EXTRACTION_PROMPT_PATH", "CLAUSE_EXTRACTION_BATCH_PROMPT_PATH", "RISK_ANALYZER_PATH",
+    "DOC_CLASSIFICATION_PATH", "DOC_SUMMARIZER_PATH",
+]
+
+def analysis_fingerprint() -> str:
+    """Hash of the prompts, models and settings an analysis depends on."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps({name: getattr(CONFIG, name, None) for name in ANALYSIS_SETTINGS},
+                             sort_keys=True, default=str).encode("utf-8"))
+    for name in PROMPT_PATHS:
+        path = getattr(CONFIG, name, None)
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+def thread_key(inputs: Dict[str, Any]) -> str:
+    """
+    Checkpoint thread for an analysis: the document's bytes plus everything else that
+    changes its result (the tenant whose stored analyses it may reuse, the earlier
+    version it is revised against, prompts, models, settings).
+    """
+    document = inputs.get("document")
+    parts = [
+        document_hash(document if document is not None else inputs["file_path"]),
+        inputs.get("tenant") or "",
+        inputs.get("previous_version") or "",
+        analysis_fingerprint(),
+    ]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+class _ThreadLock:
+    def __init__(self):
+        self.lock = threading.Lock()
+
+_thread_locks: "weakref.WeakValueDictionary[str, _ThreadLock]" = weakref.WeakValueDictionary()
+
+def thread_lock(thread_id: str) -> _ThreadLock:
+    """
+    Lock serialising runs of one checkpoint thread. Hold a reference to the returned
+    object while running; the lock is forgotten once no run holds it.
+    """
+    with _lock:
+        entry = _thread_locks.get(thread_id)
+        if entry is None:
+            entry = _thread_locks[thread_id] = _ThreadLock()
+    return entry
+
+def get_checkpointer():
+    """
+    Process-wide LangGraph SqliteSaver at CONFIG.CHECKPOINT_DB_PATH, or None when
+    checkpointing is disabled. Supports the synchronous graph only.
+    """
+    global _checkpointer
+    if not CONFIG.CHECKPOINTING_ENABLED:
+        return None
+    with _lock:
+        if _checkpointer is None:
+            from langgraph.checkpoint.sqlite import SqliteSaver
+            _checkpointer = SqliteSaver(_connect(CONFIG.CHECKPOINT_DB_PATH))
+            logger.info("💾 Graph checkpoints stored in %s", CONFIG.CHECKPOINT_DB_PATH)
+    return _checkpointer
+
+class ChunkResultCache:
+    """
+    Per-chunk results keyed by (namespace, chunk text). The namespace should name the
+    stage, model and prompt version so any of them changing misses the cache.
+    """
+
+    def __init__(self, path: str):
+        self._conn = _connect(path)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunk_results ("
+                "key TEXT PRIMARY KEY, namespace TEXT NOT NULL, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+
+    @staticmethod
+    def _key(namespace: str, text: str) -> str:
+        return hashlib.sha256(f"{namespace}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, namespace: str, texts: List[str]) -> Dict[int, Any]:
+        """Cached results for `texts`, keyed by their position in the list."""
+        keys = [self._key(namespace, text) for text in texts]
+        found: Dict[str, Any] = {}
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM chunk_results WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update((key, json.loads(value)) for key, value in rows)
+        return {i: found[key] for i, key in enumerate(keys) if key in found}
+
+    def put_many(self, namespace: str, results: Dict[str, Any]):
+        """Store results keyed by chunk text."""
+        if not results:
+            return
+        now = time.time()
+        rows = [(self._key(namespace, text), namespace, json.dumps(value), now) for text, value in results.items()]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO chunk_results VALUES (?, ?, ?, ?)", rows)
+
+def get_chunk_cache() -> Optional[ChunkResultCache]:
+    """Process-wide chunk result cache, or None when checkpointing is disabled."""
+    global _chunk_cache
+    if not CONFIG.CHECKPOINTING_ENABLED:
+        return None
+    with _lock:
+        if _chunk_cache is None:
+            _chunk_cache = ChunkResultCache(CONFIG.CHECKPOINT_DB_PATH)
+    return _chunk_cache
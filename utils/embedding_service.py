@@ -0,0 +1,137 @@
+import time, queue, asyncio, threading
+import numpy as np
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Dict, List, Optional, Tuple
+from utils import instrumentation
+from utils.logging_setup import get_logger
+
+# In-process embedding micro-batcher. Concurrent callers submit texts to one queue;
+# a single worker thread coalesces whatever arrives within `max_wait_ms` into one
+# encode call (up to `max_batch` texts), sorted by length so each model batch pads
+# to similar lengths. Nothing in the pipeline embeds text yet, so there is no
+# process-wide instance; wrap configure_embedding_model() when a caller appears.
+
+logger = get_logger("utils.embedding_service", "utils.log")
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+class EmbeddingService:
+    """Coalesces concurrent encode requests against one shared embedding model."""
+
+    def __init__(self, model, max_batch: int, max_wait_ms: float, encode_batch_size: int):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.encode_batch_size = encode_batch_size
+        self._queue: "queue.Queue[Tuple[List[str], Future, float]]" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "sentences": 0, "batches": 0, "encode_seconds": 0.0}
+        self._batch_sizes: Dict[int, int] = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS}
+        threading.Thread(target=self._run, name="lexi-embedding-batcher", daemon=True).start()
+
+    def submit(self, texts: List[str]) -> "Future[np.ndarray]":
+        """Queue `texts` for encoding; the future resolves to one embedding row per text."""
+        future: "Future[np.ndarray]" = Future()
+        if not texts:
+            future.set_result(np.empty((0, 0), dtype=np.float32))
+        else:
+            self._queue.put((list(texts), future, time.perf_counter()))
+        return future
+
+    def encode(self, texts: List[str], timeout: Optional[float] = None) -> np.ndarray:
+        """Blocking encode through the shared batcher."""
+        return self.submit(texts).result(timeout)
+
+    async def aencode(self, texts: List[str]) -> np.ndarray:
+        """Async encode through the shared batcher."""
+        return await asyncio.wrap_future(self.submit(texts))
+
+    def _collect(self) -> List[Tuple[List[str], Future, float]]:
+        """
+        Block for one live request, then take whatever else arrives within the latency
+        window. Requests whose callers already cancelled them are dropped.
+        """
+        requests: List[Tuple[List[str], Future, float]] = []
+        while not requests:
+            request = self._queue.get()
+            if request[1].set_running_or_notify_cancel():
+                requests.append(request)
+        size = len(requests[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request[1].set_running_or_notify_cancel():
+                requests.append(request)
+                size += len(request[0])
+        return requests
+
+    def _run(self):
+        while True:
+            try:
+                requests = self._collect()
+                self._encode(requests)
+            except Exception as e:
+                # The batcher serves every caller in the process; it must outlive any one batch
+                logger.error("❌ Embedding batcher error: %s", e)
+
+    def _encode(self, requests: List[Tuple[List[str], Future, float]]):
+        texts = [text for request in requests for text in request[0]]
+        # Longest first, so each model batch holds texts of similar length
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        start = time.perf_counter()
+        try:
+            encoded = self.model.encode([texts[i] for i in order], batch_size=self.encode_batch_size,
+                                        convert_to_numpy=True, show_progress_bar=False)
+            embeddings = np.empty_like(encoded)
+            embeddings[order] = encoded
+        except Exception as e:
+            logger.error("❌ Embedding batch of %s texts failed: %s", len(texts), e)
+            for _, future, _ in requests:
+                _deliver(future, exception=e)
+            return
+        seconds = time.perf_counter() - start
+        offset = 0
+        for request_texts, future, _ in requests:
+            _deliver(future, result=embeddings[offset:offset + len(request_texts)])
+            offset += len(request_texts)
+        self._record(requests, len(texts), seconds, start)
+
+    def _record(self, requests, size: int, seconds: float, started: float):
+        with self._stats_lock:
+            self._stats["requests"] += len(requests)
+            self._stats["sentences"] += size
+            self._stats["batches"] += 1
+            self._stats["encode_seconds"] += seconds
+            bucket = next((b for b in BATCH_SIZE_BUCKETS if size <= b), BATCH_SIZE_BUCKETS[-1])
+            self._batch_sizes[bucket] += 1
+        instrumentation.increment("lexi_embedding_sentences_total", size)
+        instrumentation.increment("lexi_embedding_batches_total")
+        instrumentation.observe_histogram("lexi_embedding_batch_size", size, BATCH_SIZE_BUCKETS)
+        instrumentation.observe("lexi_embedding_encode_seconds", seconds)
+        for _, _, queued_at in requests:
+            instrumentation.observe("lexi_embedding_queue_wait_seconds", started - queued_at)
+
+    def stats(self) -> Dict[str, Any]:
+        """Totals, throughput (sentences per encode second) and the batch-size histogram."""
+        with self._stats_lock:
+            stats, histogram = dict(self._stats), dict(self._batch_sizes)
+        stats["sentences_per_second"] = round(stats["sentences"] / stats["encode_seconds"], 1) if stats["encode_seconds"] else 0.0
+        stats["mean_batch_size"] = round(stats["sentences"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["batch_size_histogram"] = histogram
+        return stats
+
+def _deliver(future: Future, result: Any = None, exception: Optional[BaseException] = None):
+    """Resolve a request's future unless it is already done."""
+    if future.done():
+        return
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
@@ -0,0 +1,263 @@
+import os, json, time, logging, threading
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from langchain_core.callbacks import BaseCallbackHandler
+from config import config as CONFIG
+from utils.logging_setup import get_logger
+
+# Structured timing/token instrumentation. Everything is a no-op unless
+# LEXI_INSTRUMENTATION=true, so the disabled cost is one attribute check per call.
+
+_context: ContextVar[Dict[str, Any]] = ContextVar("lexi_instrumentation_context", default={})
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, Tuple], float] = defaultdict(float)
+_summaries: Dict[Tuple[str, Tuple], list] = defaultdict(lambda: [0, 0.0])  # [count, sum]
+_histograms: Dict[Tuple[str, Tuple], list] = {}  # [bucket bounds, per-bucket counts, count, sum]
+_server: Optional[ThreadingHTTPServer] = None
+
+logger = get_logger("utils.instrumentation", "utils.log")
+_events = logging.getLogger("lexi.metrics")
+if CONFIG.INSTRUMENTATION_ENABLED:
+    # JSON lines go through the shared background log writer, never to the console
+    _events = get_logger("lexi.metrics", os.path.basename(CONFIG.METRICS_JSONL_PATH), fmt="%(message)s", console=False)
+
+def enabled() -> bool:
+    return CONFIG.INSTRUMENTATION_ENABLED
+
+def current_context() -> Dict[str, Any]:
+    return _context.get()
+
+@contextmanager
+def bind_context(**values):
+    """
+    Attach values (e.g. document=..., chat_turn=...) to every span and LLM call
+    recorded inside the block, including ones in LangChain callbacks.
+    """
+    token = _context.set({**_context.get(), **values})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+def _labels(labels: Dict[str, Any]) -> Tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def increment(name: str, value: float = 1, **labels):
+    """Add to a counter, e.g. increment("lexi_cache_hits_total", cache="dedup")."""
+    if not CONFIG.INSTRUMENTATION_ENABLED:
+        return
+    with _lock:
+        _counters[(name, _labels(labels))] += value
+
+def observe(name: str, value: float, **labels):
+    """Record one observation of a summary metric (count and sum are exported)."""
+    if not CONFIG.INSTRUMENTATION_ENABLED:
+        return
+    with _lock:
+        summary = _summaries[(name, _labels(labels))]
+        summary[0] += 1
+        summary[1] += value
+
+def observe_histogram(name: str, value: float, buckets: Tuple[float, ...], **labels):
+    """Record one observation of a histogram metric with the given upper bucket bounds."""
+    if not CONFIG.INSTRUMENTATION_ENABLED:
+        return
+    with _lock:
+        histogram = _histograms.setdefault((name, _labels(labels)), [tuple(buckets), [0] * len(buckets), 0, 0.0])
+        for i, bound in enumerate(histogram[0]):
+            if value <= bound:
+                histogram[1][i] += 1
+                break
+        histogram[2] += 1
+        histogram[3] += value
+
+def emit(event: str, context: Optional[Dict[str, Any]] = None, **fields):
+    """
+    Write one JSON line to CONFIG.METRICS_JSONL_PATH, tagged with `context`
+    (defaults to the current context).
+    """
+    if not CONFIG.INSTRUMENTATION_ENABLED:
+        return
+    record = {"ts": time.time(), "event": event, **(context if context is not None else _context.get()), **fields}
+    _events.info(json.dumps(record, default=str))
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+class Span:
+    """Times a block; exported as lexi_span_seconds{span=...} and a "span" JSON event."""
+
+    def __init__(self, name: str, queued_at: Optional[float] = None, **attrs):
+        self.name = name
+        self.queued_at = queued_at
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        wait = self.start - self.queued_at if self.queued_at is not None else 0.0
+        status = "error" if exc_type else "ok"
+        observe("lexi_span_seconds", seconds, span=self.name)
+        if wait:
+            observe("lexi_span_wait_seconds", wait, span=self.name)
+        if exc_type:
+            increment("lexi_span_errors_total", span=self.name)
+        emit("span", span=self.name, seconds=round(seconds, 6), wait_seconds=round(wait, 6), status=status, **self.attrs)
+        return False
+
+def span(name: str, queued_at: Optional[float] = None, **attrs):
+    """
+    Context manager timing a block. `queued_at` is a time.perf_counter() value taken
+    when the work was enqueued, used to report queue/wait time.
+    """
+    if not CONFIG.INSTRUMENTATION_ENABLED:
+        return _NOOP_SPAN
+    return Span(name, queued_at, **attrs)
+
+def _token_usage(response) -> Tuple[int, int]:
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    try:
+        metadata = response.generations[0][0].message.usage_metadata or {}
+        return metadata.get("input_tokens", 0), metadata.get("output_tokens", 0)
+    except (AttributeError, IndexError):
+        return 0, 0
+
+class InstrumentationCallback(BaseCallbackHandler):
+    """Records wall time and prompt/completion tokens of every LLM call."""
+
+    def __init__(self):
+        self._runs: Dict[Any, Tuple[float, str, Dict[str, Any]]] = {}
+
+    def _start(self, serialized, run_id, kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model_name") or params.get("model") or (serialized or {}).get("name", "unknown")
+        self._runs[run_id] = (time.perf_counter(), model, _context.get())
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(serialized, run_id, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(serialized, run_id, kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._runs.pop(run_id, None)
+        if started is None:
+            return
+        start, model, context = started
+        seconds = time.perf_counter() - start
+        prompt_tokens, completion_tokens = _token_usage(response)
+        increment("lexi_llm_calls_total", model=model)
+        increment("lexi_llm_prompt_tokens_total", prompt_tokens, model=model)
+        increment("lexi_llm_completion_tokens_total", completion_tokens, model=model)
+        observe("lexi_llm_seconds", seconds, model=model)
+        emit("llm_call", context=context, model=model, seconds=round(seconds, 6),
+             prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        started = self._runs.pop(run_id, None)
+        model = started[1] if started else "unknown"
+        increment("lexi_llm_errors_total", model=model, error=type(error).__name__)
+
+    def on_retry(self, retry_state, *, run_id, **kwargs):
+        increment("lexi_llm_retries_total", reason="client")
+
+def snapshot() -> Dict[str, Dict[str, float]]:
+    """Current counters and summaries, keyed by the Prometheus series name."""
+    with _lock:
+        counters = {_series(name, labels): value for (name, labels), value in _counters.items()}
+        summaries = {_series(name, labels): {"count": c, "sum": s} for (name, labels), (c, s) in _summaries.items()}
+        histograms = {_series(name, labels): {"buckets": dict(zip(bounds, counts)), "count": c, "sum": s}
+                      for (name, labels), (bounds, counts, c, s) in _histograms.items()}
+    return {"counters": counters, "summaries": summaries, "histograms": histograms}
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _series(name: str, labels: Tuple) -> str:
+    if not labels:
+        return name
+    rendered = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+    return f"{name}{{{rendered}}}"
+
+def render_prometheus() -> str:
+    """Render all metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        summaries = sorted((key, list(value)) for key, value in _summaries.items())
+        histograms = sorted((key, (value[0], list(value[1]), value[2], value[3])) for key, value in _histograms.items())
+    typed = set()
+    for (name, labels), value in counters:
+        if name not in typed:
+            lines.append(f"# TYPE {name} counter")
+            typed.add(name)
+        lines.append(f"{_series(name, labels)} {value}")
+    for (name, labels), (count, total) in summaries:
+        if name not in typed:
+            lines.append(f"# TYPE {name} summary")
+            typed.add(name)
+        lines.append(f"{_series(name + '_count', labels)} {count}")
+        lines.append(f"{_series(name + '_sum', labels)} {total}")
+    for (name, labels), (bounds, counts, count, total) in histograms:
+        if name not in typed:
+            lines.append(f"# TYPE {name} histogram")
+            typed.add(name)
+        cumulative = 0
+        for bound, bucket_count in zip(bounds, counts):
+            cumulative += bucket_count
+            lines.append(f"{_series(name + '_bucket', labels + (('le', str(bound)),))} {cumulative}")
+        lines.append(f"{_series(name + '_bucket', labels + (('le', '+Inf'),))} {count}")
+        lines.append(f"{_series(name + '_count', labels)} {count}")
+        lines.append(f"{_series(name + '_sum', labels)} {total}")
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port: Optional[int] = None) -> Optional[ThreadingHTTPServer]:
+    """
+    Serve /metrics on a daemon thread. Idempotent; does nothing when instrumentation
+    is disabled or no port is configured.
+    """
+    global _server
+    port = port if port is not None else CONFIG.METRICS_PORT
+    if not CONFIG.INSTRUMENTATION_ENABLED or not port:
+        return None
+    with _lock:
+        if _server is None:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="lexi-metrics", daemon=True).start()
+            logger.info("📈 Prometheus metrics served on :%s/metrics", port)
+    return _server
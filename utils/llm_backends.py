@@ -0,0 +1,296 @@
+import os, re, json, time, random, asyncio, hashlib, threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from pydantic import PrivateAttr
+from langchain_groq import ChatGroq
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from config import config as CONFIG
+from utils.utils import estimate_tokens
+from utils.instrumentation import InstrumentationCallback
+from utils.logging_setup import get_logger
+
+logger = get_logger("utils.llm_backends", "utils.log")
+
+# --- Global callbacks attached to every chat model created by configure_llm ---
+
+class CallbackDispatcher(BaseCallbackHandler):
+    """
+    Single handler installed on every model. It forwards LLM events to the handlers
+    currently registered, so callbacks registered after a (cached) model was created
+    still see its calls.
+    """
+
+    def __init__(self):
+        self.handlers: List[BaseCallbackHandler] = []
+
+    def _forward(self, method: str, *args, **kwargs):
+        for handler in list(self.handlers):
+            getattr(handler, method)(*args, **kwargs)
+
+    def on_chat_model_start(self, *args, **kwargs):
+        self._forward("on_chat_model_start", *args, **kwargs)
+
+    def on_llm_start(self, *args, **kwargs):
+        self._forward("on_llm_start", *args, **kwargs)
+
+    def on_llm_end(self, *args, **kwargs):
+        self._forward("on_llm_end", *args, **kwargs)
+
+    def on_llm_error(self, *args, **kwargs):
+        self._forward("on_llm_error", *args, **kwargs)
+
+    def on_retry(self, *args, **kwargs):
+        self._forward("on_retry", *args, **kwargs)
+
+_DISPATCHER = CallbackDispatcher()
+
+def register_llm_callback(handler: BaseCallbackHandler):
+    """Attach `handler` to every LLM call (benchmarks, instrumentation, recording)."""
+    if handler not in _DISPATCHER.handlers:
+        _DISPATCHER.handlers.append(handler)
+
+def unregister_llm_callback(handler: BaseCallbackHandler):
+    if handler in _DISPATCHER.handlers:
+        _DISPATCHER.handlers.remove(handler)
+
+def messages_key(messages: List[BaseMessage]) -> str:
+    """Stable key of a prompt, shared by the recorder and the fake backend."""
+    text = "\n".join(f"{m.type}: {m.content}" for m in messages)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class ResponseRecorder(BaseCallbackHandler):
+    """
+    Appends every prompt/response pair to a JSONL file that FakeChatModel can replay.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._keys: Dict[Any, str] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._keys[run_id] = messages_key(messages[0])
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        key = self._keys.pop(run_id, None)
+        if key is None:
+            return
+        record = {"key": key, "response": response.generations[0][0].text}
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._keys.pop(run_id, None)
+
+if CONFIG.LLM_RECORD_PATH:
+    register_llm_callback(ResponseRecorder(CONFIG.LLM_RECORD_PATH))
+if CONFIG.INSTRUMENTATION_ENABLED:
+    register_llm_callback(InstrumentationCallback())
+
+# --- Deterministic in-process stand-in ---
+
+class FakeLLMError(RuntimeError):
+    """Failure injected by FakeChatModel to exercise error handling."""
+
+# Keyword cues used to synthesise plausible clause answers when no recording matches
+_CLAUSE_CUES = {
+    "Termination Clause": ("terminat",),
+    "Confidentiality Clause": ("confidential",),
+    "Governing Law": ("governed by", "governing law"),
+    "Payment Terms": ("payment", "fees"),
+    "Liability Clause": ("liab",),
+    "Force Majeure": ("force majeure",),
+    "Dispute Resolution": ("dispute", "arbitrat"),
+    "Indemnification Clause": ("indemn",),
+    "Intellectual Property": ("intellectual property",),
+    "Amendment Clause": ("amend",),
+}
+
+def _fake_clauses(text: str) -> Dict[str, str]:
+    sentences = re.split(r'(?<=[.;])\s+', text)
+    return {
+        clause: next((s.strip()[:300] for s in sentences if any(cue in s.lower() for cue in cues)), "Not Found")
+        for clause, cues in _CLAUSE_CUES.items()
+    }
+
+def _section_after(prompt: str, marker: str) -> str:
+    index = prompt.rfind(marker)
+    return prompt[index + len(marker):] if index != -1 else prompt
+
+def _present_clauses(prompt: str) -> Dict[str, str]:
+    try:
+        clauses = json.loads(_section_after(prompt, "Clauses:").strip())
+    except json.JSONDecodeError:
+        return {}
+    return {k: v for k, v in clauses.items() if v and v != "Not Found"}
+
+def synthesize_response(prompt: str) -> str:
+    """
+    Deterministic answer for the pipeline's prompts, shaped like a real model's output.
+    """
+    if "[chunk_" in prompt:
+        body = _section_after(prompt, "Chunks:")
+        parts = re.findall(r'\[(chunk_\d+)\]\n(.*?)(?=\n\n\[chunk_\d+\]|\Z)', body, flags=re.DOTALL)
+        return json.dumps({"chunks": {chunk_id: _fake_clauses(text) for chunk_id, text in parts}})
+    if "Extract the following clauses" in prompt:
+        return json.dumps(_fake_clauses(_section_after(prompt, "Document:")))
+    if '"ambiguous_clauses"' in prompt:
+        present = _present_clauses(prompt)
+        return json.dumps({
+            "ambiguous_clauses": {c: f"The {c} does not define its time limits or obligations precisely." for c in present},
+            "suggestions": {c: f"Specify concrete obligations, deadlines and remedies in the {c}." for c in present},
+        })
+    if '"overall_summary"' in prompt:
+        present = _present_clauses(prompt)
+        return json.dumps({
+            "overall_summary": f"An agreement covering {len(present)} key clauses.",
+            "clause_summaries": {c: v[:120] for c, v in present.items()},
+        })
+    if "classify it into one of the following categories" in prompt:
+        document = _section_after(prompt, "Document:").lower()
+        category = "Non Disclosure Agreement" if "confidential" in document else "Others"
+        return json.dumps({"category": category}) if '"category"' in prompt else category
+    sentences = [s.strip() for s in re.split(r'(?<=[.!?])\s+', prompt) if len(s.strip()) > 20]
+    return "\n".join(f"- {s[:200]}" for s in sentences[-3:]) or "- No content."
+
+class FakeChatModel(BaseChatModel):
+    """
+    Offline stand-in for ChatGroq.
+
+    Replays recorded responses (JSONL written by ResponseRecorder) keyed by prompt,
+    falls back to synthesize_response, and simulates latency and failures.
+    """
+
+    model_name: str = "fake"
+    recordings_path: Optional[str] = None
+    latency: float = 0.0
+    latency_jitter: float = 0.0
+    request_timeout: Optional[float] = None
+    error_rate: float = 0.0
+    seed: int = 0
+
+    _recordings: Dict[str, List[str]] = PrivateAttr(default_factory=dict)
+    _replayed: Dict[str, int] = PrivateAttr(default_factory=lambda: defaultdict(int))
+    _rng: random.Random = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def model_post_init(self, __context: Any) -> None:
+        super().model_post_init(__context)
+        self._rng = random.Random(self.seed)
+        if self.recordings_path and os.path.exists(self.recordings_path):
+            with open(self.recordings_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    self._recordings.setdefault(record["key"], []).append(record["response"])
+            logger.info("📼 Loaded %s recorded prompts from %s", len(self._recordings), self.recordings_path)
+
+    @property
+    def _llm_type(self) -> str:
+        return "lexi-fake"
+
+    def bind_tools(self, tools, **kwargs):
+        # The stand-in never issues tool calls; the chat graph then answers directly
+        return self.bind(**kwargs)
+
+    def _draw(self):
+        """Return (delay, should_fail) for one call, deterministic for a given seed and call order."""
+        with self._lock:
+            delay = self.latency + self._rng.uniform(0, self.latency_jitter)
+            return delay, self._rng.random() < self.error_rate
+
+    def _respond(self, messages: List[BaseMessage]) -> ChatResult:
+        key = messages_key(messages)
+        prompt = "\n".join(str(m.content) for m in messages)
+        with self._lock:
+            recorded = self._recordings.get(key)
+            if recorded:
+                content = recorded[self._replayed[key] % len(recorded)]
+                self._replayed[key] += 1
+            else:
+                content = synthesize_response(prompt)
+
+        usage = {"input_tokens": estimate_tokens(prompt), "output_tokens": estimate_tokens(content)}
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        message = AIMessage(content=content, usage_metadata=usage)
+        token_usage = {"prompt_tokens": usage["input_tokens"], "completion_tokens": usage["output_tokens"],
+                       "total_tokens": usage["total_tokens"]}
+        return ChatResult(generations=[ChatGeneration(message=message)],
+                          llm_output={"token_usage": token_usage, "model_name": self.model_name})
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        delay, fail = self._draw()
+        if self.request_timeout and delay > self.request_timeout:
+            # Behave like a client whose request timed out
+            time.sleep(self.request_timeout)
+            raise TimeoutError(f"Fake request timed out after {self.request_timeout}s")
+        time.sleep(delay)
+        if fail:
+            raise FakeLLMError("Injected fake LLM failure (503 Service Unavailable)")
+        return self._respond(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        delay, fail = self._draw()
+        if self.request_timeout and delay > self.request_timeout:
+            await asyncio.sleep(self.request_timeout)
+            raise TimeoutError(f"Fake request timed out after {self.request_timeout}s")
+        await asyncio.sleep(delay)
+        if fail:
+            raise FakeLLMError("Injected fake LLM failure (503 Service Unavailable)")
+        return self._respond(messages)
+
+# --- Backend registry ---
+
+def _create_groq(model_name: str, callbacks: List[BaseCallbackHandler]):
+    return ChatGroq(
+        temperature=0,
+        groq_api_key=CONFIG.GROQ_API_KEY,
+        model_name=model_name,
+        # Timeouts and retries are owned by utils/call_policy.py
+        request_timeout=CONFIG.LLM_TIMEOUT or None,
+        max_retries=0,
+        callbacks=callbacks or None
+    )
+
+def _create_fake(model_name: str, callbacks: List[BaseCallbackHandler]):
+    return FakeChatModel(
+        model_name=model_name,
+        recordings_path=CONFIG.FAKE_LLM_RECORDINGS_PATH,
+        latency=CONFIG.FAKE_LLM_LATENCY,
+        latency_jitter=CONFIG.FAKE_LLM_LATENCY_JITTER,
+        error_rate=CONFIG.FAKE_LLM_ERROR_RATE,
+        seed=CONFIG.FAKE_LLM_SEED,
+        request_timeout=CONFIG.LLM_TIMEOUT or None,
+        callbacks=callbacks or None
+    )
+
+BACKENDS: Dict[str, Callable[[str, List[BaseCallbackHandler]], BaseChatModel]] = {
+    "groq": _create_groq,
+    "fake": _create_fake,
+}
+
+def register_backend(name: str, factory: Callable[[str, List[BaseCallbackHandler]], BaseChatModel]):
+    """Make a new backend selectable through LEXI_LLM_BACKEND."""
+    BACKENDS[name] = factory
+
+# One client per (backend, model) so every stage, thread and coroutine shares its
+# HTTP connection pool instead of opening a new one per call
+_MODELS: Dict[Tuple[str, str], BaseChatModel] = {}
+_models_lock = threading.Lock()
+
+def create_chat_model(model_name: str, backend: Optional[str] = None) -> BaseChatModel:
+    backend = backend or CONFIG.LLM_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"⛔ Unknown LLM backend: {backend}")
+    with _models_lock:
+        model = _MODELS.get((backend, model_name))
+        if model is None:
+            model = _MODELS[(backend, model_name)] = BACKENDS[backend](model_name, [_DISPATCHER])
+    return model
+
+def clear_model_cache():
+    """Drop cached clients, e.g. after changing backend settings at runtime."""
+    with _models_lock:
+        _MODELS.clear()
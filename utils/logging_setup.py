@@ -0,0 +1,134 @@
+import os, sys, copy, queue, atexit, logging, threading
+import logging.handlers
+from typing import Dict, Optional, Set
+
+# One process-wide logging pipeline: every logger feeds a bounded in-memory queue
+# and a single background thread writes the records to per-module rotating files
+# and the console, so worker threads never block on file I/O.
+# This module must not import project modules: config/config.py uses it.
+
+LOG_DIR = "logs"
+LOG_LEVEL = os.getenv("LEXI_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+LOG_MAX_BYTES = int(os.getenv("LEXI_LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LEXI_LOG_BACKUP_COUNT", "3"))
+LOG_QUEUE_SIZE = int(os.getenv("LEXI_LOG_QUEUE_SIZE", "10000"))
+# Records logged with extra=SAMPLED (per-chunk chatter) are kept 1 in N per message
+LOG_SAMPLE_EVERY = int(os.getenv("LEXI_LOG_SAMPLE_EVERY", "10"))
+
+SAMPLED = {"sampled": True}
+
+class SamplingFilter(logging.Filter):
+    """Pass only every Nth record flagged with extra=SAMPLED, counted per message template."""
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = max(1, every)
+        self._seen: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False) or self.every == 1:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            count = self._seen.get(key, 0)
+            self._seen[key] = count + 1
+        return count % self.every == 0
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueue records without formatting them (only %-interpolation of the message)
+    and drop them, counting drops, instead of blocking when the queue is full.
+    """
+
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+class ModuleFileRouter(logging.Handler):
+    """Send each record to the rotating file registered for its logger (or nearest parent)."""
+
+    def __init__(self):
+        super().__init__()
+        self.routes: Dict[str, logging.Handler] = {}
+
+    def emit(self, record: logging.LogRecord):
+        name = record.name
+        while name:
+            handler = self.routes.get(name)
+            if handler is not None:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+                return
+            name = name.rpartition(".")[0]
+
+class ConsoleFilter(logging.Filter):
+    def __init__(self, excluded: Set[str]):
+        super().__init__()
+        self.excluded = excluded
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.name not in self.excluded
+
+_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+_router = ModuleFileRouter()
+_console_excluded: Set[str] = set()
+_sampler = SamplingFilter(LOG_SAMPLE_EVERY)
+
+def _start():
+    global _listener
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    console = logging.StreamHandler(sys.stderr)
+    console.setFormatter(logging.Formatter(LOG_FORMAT))
+    console.addFilter(ConsoleFilter(_console_excluded))
+    _listener = logging.handlers.QueueListener(log_queue, _router, console, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(_sampler)
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(LOG_LEVEL)
+
+def get_logger(name: str, filename: str, fmt: str = LOG_FORMAT, console: bool = True) -> logging.Logger:
+    """
+    Return the logger `name`, writing to logs/<filename> (rotating) through the shared
+    background writer. Safe to call repeatedly, e.g. on Streamlit reruns.
+    """
+    with _lock:
+        if _listener is None:
+            _start()
+        if name not in _router.routes:
+            os.makedirs(LOG_DIR, exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                os.path.join(LOG_DIR, filename), maxBytes=LOG_MAX_BYTES,
+                backupCount=LOG_BACKUP_COUNT, encoding="utf-8", delay=True
+            )
+            file_handler.setFormatter(logging.Formatter(fmt))
+            _router.routes[name] = file_handler
+        if not console:
+            _console_excluded.add(name)
+    return logging.getLogger(name)
+
+def shutdown_logging():
+    """Flush queued records and stop the background writer."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+    if NonBlockingQueueHandler.dropped:
+        sys.stderr.write(f"⚠️ {NonBlockingQueueHandler.dropped} log records dropped (queue full)\n")
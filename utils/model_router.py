@@ -0,0 +1,126 @@
+import time, threading
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from config import config as CONFIG
+from utils import instrumentation
+from utils.logging_setup import get_logger
+
+# Cascade routing: each stage lists models in CONFIG.MODEL_CASCADES, cheapest first.
+# An answer from a cheaper model is kept when its validator accepts it; otherwise the
+# request (or just the failing chunks) escalates to the next model. Every decision is
+# logged with estimated tokens, cost and latency, and compared against sending the
+# same work straight to the stage's largest model.
+
+logger = get_logger("utils.model_router", "utils.log")
+
+# validate(result) returns None when the answer is acceptable, else the reason to escalate
+Validator = Callable[[Any], Optional[str]]
+
+def cascade(stage: str) -> List[str]:
+    return CONFIG.MODEL_CASCADES[stage]
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    price_in, price_out = CONFIG.MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * price_in + completion_tokens * price_out) / 1_000_000
+
+class RoutingStats:
+    """Per-stage, per-model totals of routed work, plus estimated savings."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (stage, model) -> [requests, accepted, escalated, seconds, prompt_tokens, completion_tokens, answering requests]
+        self._totals: Dict[Tuple[str, str], List[float]] = defaultdict(lambda: [0, 0, 0, 0.0, 0, 0, 0])
+
+    def record(self, stage: str, model: str, accepted: int, escalated: int, seconds: float,
+               prompt_tokens: int, completion_tokens: int):
+        with self._lock:
+            totals = self._totals[(stage, model)]
+            for i, value in enumerate((1, accepted, escalated, seconds, prompt_tokens, completion_tokens, int(accepted > 0))):
+                totals[i] += value
+        outcome = "escalated" if escalated and not accepted else "accepted"
+        instrumentation.increment("lexi_route_requests_total", stage=stage, model=model, outcome=outcome)
+        instrumentation.increment("lexi_route_escalations_total", escalated, stage=stage, model=model)
+        instrumentation.observe("lexi_route_cost_usd", estimate_cost(model, prompt_tokens, completion_tokens), stage=stage, model=model)
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Per stage: work served by each model, the estimated cost actually spent and the
+        cost/latency had everything gone to the stage's last (largest) model.
+        """
+        with self._lock:
+            totals = {key: list(value) for key, value in self._totals.items()}
+        report = {}
+        for stage in {stage for stage, _ in totals}:
+            top = cascade(stage)[-1]
+            rows = {model: t for (s, model), t in totals.items() if s == stage}
+            spent = sum(estimate_cost(model, t[4], t[5]) for model, t in rows.items())
+            prompt_tokens = sum(t[4] for t in rows.values())
+            completion_tokens = sum(t[5] for t in rows.values())
+            # Latency had every answering request been served by the top model at its observed mean
+            top_mean = rows[top][3] / rows[top][0] if top in rows and rows[top][0] else None
+            answering = sum(t[6] for t in rows.values())
+            report[stage] = {
+                "served": {model: int(t[1]) for model, t in rows.items()},
+                "escalated": {model: int(t[2]) for model, t in rows.items() if t[2]},
+                "cost_usd": round(spent, 6),
+                "top_model_cost_usd": round(estimate_cost(top, prompt_tokens, completion_tokens), 6),
+                "seconds": round(sum(t[3] for t in rows.values()), 3),
+                "top_model_seconds_estimate": round(top_mean * answering, 3) if top_mean else None,
+            }
+        return report
+
+ROUTING_STATS = RoutingStats()
+
+def log_decision(stage: str, model: str, accepted: int, escalated: int, seconds: float,
+                 prompt_tokens: int, completion_tokens: int, reason: Optional[str] = None):
+    ROUTING_STATS.record(stage, model, accepted, escalated, seconds, prompt_tokens, completion_tokens)
+    cost = estimate_cost(model, prompt_tokens, completion_tokens)
+    top_cost = estimate_cost(cascade(stage)[-1], prompt_tokens, completion_tokens)
+    if escalated:
+        logger.info("🧭 %s: %s kept %s, escalated %s (%s) in %.2fs, ~$%.6f",
+                    stage, model, accepted, escalated, reason or "validation failed", seconds, cost)
+    else:
+        logger.info("🧭 %s: %s accepted %s in %.2fs, ~$%.6f (vs ~$%.6f on %s)",
+                    stage, model, accepted, seconds, cost, top_cost, cascade(stage)[-1])
+
+def route(stage: str, attempt: Callable[[str], Tuple[Any, int, int]], validate: Validator) -> Any:
+    """
+    Run `attempt(model)` down the stage's cascade until `validate` accepts the result.
+    `attempt` returns (result, prompt_tokens, completion_tokens). The last model's
+    answer is returned even if rejected; its exceptions propagate.
+    """
+    models = cascade(stage)
+    for level, model in enumerate(models):
+        last = level == len(models) - 1
+        start = time.perf_counter()
+        try:
+            result, prompt_tokens, completion_tokens = attempt(model)
+        except Exception as e:
+            if last:
+                raise
+            log_decision(stage, model, 0, 1, time.perf_counter() - start, 0, 0, f"{type(e).__name__}: {e}")
+            continue
+        reason = validate(result)
+        if reason is None or last:
+            log_decision(stage, model, 1, 0, time.perf_counter() - start, prompt_tokens, completion_tokens)
+            return result
+        log_decision(stage, model, 0, 1, time.perf_counter() - start, prompt_tokens, completion_tokens, reason)
+
+async def aroute(stage: str, attempt: Callable[[str], Awaitable[Tuple[Any, int, int]]], validate: Validator) -> Any:
+    """Async variant of route."""
+    models = cascade(stage)
+    for level, model in enumerate(models):
+        last = level == len(models) - 1
+        start = time.perf_counter()
+        try:
+            result, prompt_tokens, completion_tokens = await attempt(model)
+        except Exception as e:
+            if last:
+                raise
+            log_decision(stage, model, 0, 1, time.perf_counter() - start, 0, 0, f"{type(e).__name__}: {e}")
+            continue
+        reason = validate(result)
+        if reason is None or last:
+            log_decision(stage, model, 1, 0, time.perf_counter() - start, prompt_tokens, completion_tokens)
+            return result
+        log_decision(stage, model, 0, 1, time.perf_counter() - start, prompt_tokens, completion_tokens, reason)
@@ -0,0 +1,107 @@
+import os, time, threading
+import numpy as np
+from typing import List, Union
+from config import config as CONFIG
+from utils.logging_setup import get_logger
+
+# ONNX Runtime backend for the sentence embedding model. The model is exported once
+# (this step needs torch and transformers) and quantized to int8 with dynamic
+# quantization; serving then needs only onnxruntime and tokenizers, not PyTorch.
+# Embeddings reproduce the sentence-transformers pipeline of all-MiniLM-L6-v2:
+# mean pooling over the attention mask followed by L2 normalisation.
+
+logger = get_logger("utils.onnx_embedding", "utils.log")
+
+MODEL_FILE = "model.onnx"
+QUANTIZED_FILE = "model.int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+def export_onnx_model(model_name: str, output_dir: str) -> str:
+    """
+    Export `model_name`'s transformer to ONNX and quantize it with int8 dynamic
+    quantization. Returns the path of the quantized model.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    tokenizer.save_pretrained(output_dir)  # writes tokenizer.json for the fast tokenizer
+    model = AutoModel.from_pretrained(model_name).eval()
+    dummy = tokenizer(["An example sentence."], return_tensors="pt")
+    inputs = ["input_ids", "attention_mask", "token_type_ids"]
+    model_path = os.path.join(output_dir, MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model, tuple(dummy[name] for name in inputs), model_path,
+            input_names=inputs, output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in inputs + ["last_hidden_state"]},
+            opset_version=14,
+        )
+    quantized_path = os.path.join(output_dir, QUANTIZED_FILE)
+    quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+    logger.info("📦 Exported %s to ONNX with int8 weights in %.1fs (%s)", model_name, time.perf_counter() - start, quantized_path)
+    return quantized_path
+
+class OnnxEmbeddingModel:
+    """
+    Sentence embeddings from an exported ONNX graph. `encode` accepts the arguments
+    callers pass to SentenceTransformer.encode, so the two backends are interchangeable.
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = True, max_seq_length: int = 256, threads: int = 0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        path = os.path.join(model_dir, QUANTIZED_FILE if quantized else MODEL_FILE)
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+        self._lock = threading.Lock()  # the tokenizer's padding state is shared
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        with self._lock:
+            encodings = self.tokenizer.encode_batch(texts)
+        feed = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {k: v for k, v in feed.items() if k in self.input_names})[0]
+        mask = feed["attention_mask"][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, convert_to_numpy: bool = True,
+               show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        # Like SentenceTransformer: batch texts of similar length to keep padding small
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        sorted_texts = [texts[i] for i in order]
+        encoded = np.concatenate([self._embed(sorted_texts[i:i + batch_size])
+                                  for i in range(0, len(sorted_texts), batch_size)]).astype(np.float32)
+        embeddings = np.empty_like(encoded)
+        embeddings[order] = encoded
+        return embeddings[0] if single else embeddings
+
+def load_onnx_embedding_model(model_name: str) -> OnnxEmbeddingModel:
+    """The ONNX model for `model_name` from CONFIG.ONNX_MODEL_DIR, exporting it on first use."""
+    model_dir = os.path.join(CONFIG.ONNX_MODEL_DIR, model_name.split("/")[-1])
+    if not os.path.exists(os.path.join(model_dir, QUANTIZED_FILE if CONFIG.ONNX_QUANTIZED else MODEL_FILE)):
+        logger.info("📦 No ONNX export of %s yet; exporting (needs torch once)...", model_name)
+        export_onnx_model(model_name, model_dir)
+    start = time.perf_counter()
+    model = OnnxEmbeddingModel(model_dir, quantized=CONFIG.ONNX_QUANTIZED, threads=CONFIG.ONNX_THREADS)
+    logger.info("⚡ Loaded ONNX embedding model %s in %.2fs", model_name, time.perf_counter() - start)
+    return model
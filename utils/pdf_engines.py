@@ -0,0 +1,159 @@
+import io, re, time, threading
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from config import config as CONFIG
+from utils import instrumentation
+from utils.logging_setup import get_logger
+
+# Pluggable PDF text extraction. Every page is read with a fast text-layer engine
+# (pypdfium2) first; only pages whose text fails the quality checks below are
+# re-read with pdfplumber's character-level layout analysis.
+
+logger = get_logger("utils.pdf_engines", "utils.log")
+
+PdfSource = Union[str, bytes]
+
+# PDFium is not thread-safe; analyses run in worker threads, so calls are serialised
+_pdfium_lock = threading.RLock()
+_warned_missing = set()
+
+class PdfiumEngine:
+    """Plain text-layer dump through pypdfium2."""
+
+    name = "pdfium"
+
+    def __init__(self, source: PdfSource):
+        import pypdfium2 as pdfium
+        with _pdfium_lock:
+            self._pdf = pdfium.PdfDocument(source)
+
+    def __len__(self) -> int:
+        with _pdfium_lock:
+            return len(self._pdf)
+
+    def page_text(self, index: int) -> str:
+        with _pdfium_lock:
+            page = self._pdf[index]
+            textpage = page.get_textpage()
+            try:
+                return textpage.get_text_range().replace("\r\n", "\n")
+            finally:
+                textpage.close()
+                page.close()
+
+    def close(self):
+        with _pdfium_lock:
+            self._pdf.close()
+
+class PlumberEngine:
+    """pdfplumber's layout analysis: slower, but keeps table rows and columns in reading order."""
+
+    name = "pdfplumber"
+
+    def __init__(self, source: PdfSource):
+        import pdfplumber
+        self._pdf = pdfplumber.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+
+    def __len__(self) -> int:
+        return len(self._pdf.pages)
+
+    def page_text(self, index: int) -> str:
+        page = self._pdf.pages[index]
+        text = page.extract_text() or ""
+        page.flush_cache()  # keep memory flat on long documents
+        return text
+
+    def close(self):
+        self._pdf.close()
+
+ENGINES: Dict[str, Callable[[PdfSource], object]] = {
+    "pdfium": PdfiumEngine,
+    "pdfplumber": PlumberEngine,
+}
+
+def register_engine(name: str, factory: Callable[[PdfSource], object]):
+    """
+    Make a new engine selectable through LEXI_PDF_FAST_ENGINE / LEXI_PDF_LAYOUT_ENGINE.
+    The factory opens a document and returns an object with __len__, page_text(i) and close().
+    """
+    ENGINES[name] = factory
+
+_BAD_CHARS = re.compile(r'[\ufffd\x00-\x08\x0b\x0c\x0e-\x1f\ue000-\uf8ff]')  # replacement, control, private-use
+# Table cells and column fragments: very short lines or lines of numbers/amounts only
+_FRAGMENT_LINE = re.compile(r'^(.{1,3}|[\d\s.,:;%$€£()/+-]+)$')
+
+def page_issue(text: str) -> Optional[str]:
+    """Why a fast-engine page needs layout analysis, or None when its text looks clean."""
+    stripped = text.strip()
+    if len(stripped) < CONFIG.PDF_MIN_PAGE_CHARS:
+        return "little or no text layer"
+    if len(_BAD_CHARS.findall(stripped)) / len(stripped) > CONFIG.PDF_MAX_BAD_CHAR_RATIO:
+        return "garbled characters"
+    lines = [line.strip() for line in stripped.splitlines() if line.strip()]
+    if len(lines) >= 8:
+        fragments = sum(1 for line in lines if _FRAGMENT_LINE.match(line))
+        if fragments / len(lines) > CONFIG.PDF_MAX_FRAGMENT_LINE_RATIO:
+            return "table or column fragments"
+    words = stripped.split()
+    if len(words) >= 20 and sum(1 for w in words if len(w) == 1) / len(words) > 0.4:
+        return "broken word spacing"
+    return None
+
+def _open(name: str, source: PdfSource):
+    try:
+        return ENGINES[name](source)
+    except ImportError as e:
+        if name not in _warned_missing:
+            _warned_missing.add(name)
+            logger.warning("⚠️ PDF engine %s unavailable (%s); using layout analysis for every page", name, e)
+        return None
+    except Exception as e:
+        logger.warning("⚠️ PDF engine %s could not open the document (%s); using layout analysis", name, e)
+        return None
+
+def extract_pdf_text(source: PdfSource, fast_engine: Optional[str] = None,
+                     layout_engine: Optional[str] = None) -> Tuple[str, List[Dict]]:
+    """
+    Extract a PDF's text page by page: fast engine first, layout engine for pages that
+    fail page_issue. Pass fast_engine="" to use the layout engine for every page.
+
+    Returns:
+        (text, per-page reports {"page", "engine", "seconds", "reason"})
+    """
+    fast_name = CONFIG.PDF_FAST_ENGINE if fast_engine is None else fast_engine
+    layout_name = layout_engine or CONFIG.PDF_LAYOUT_ENGINE
+    fast = _open(fast_name, source) if fast_name else None
+    layout = None
+    pages, reports = [], []
+    try:
+        if fast is None:
+            layout = ENGINES[layout_name](source)
+        for index in range(len(fast if fast is not None else layout)):
+            start = time.perf_counter()
+            reason = None
+            if fast is not None:
+                try:
+                    text = fast.page_text(index)
+                    reason = page_issue(text)
+                except Exception as e:
+                    reason = f"fast engine error: {e}"
+            engine = fast.name if fast is not None and reason is None else layout_name
+            if engine == layout_name:
+                layout = layout or ENGINES[layout_name](source)
+                text = layout.page_text(index)
+            seconds = time.perf_counter() - start
+            reports.append({"page": index + 1, "engine": engine, "seconds": round(seconds, 4), "reason": reason})
+            instrumentation.increment("lexi_pdf_pages_total", engine=engine)
+            instrumentation.observe("lexi_pdf_page_seconds", seconds, engine=engine)
+            if text.strip():
+                pages.append(text)
+    finally:
+        for opened in (fast, layout):
+            if opened is not None:
+                opened.close()
+
+    fallbacks = [r for r in reports if r["engine"] == layout_name]
+    logger.info("📄 Extracted %s pages in %.2fs: %s fast, %s with %s",
+                len(reports), sum(r["seconds"] for r in reports), len(reports) - len(fallbacks), len(fallbacks), layout_name)
+    for r in fallbacks:
+        logger.debug("Page %s used %s (%s) in %.3fs", r["page"], layout_name, r["reason"], r["seconds"])
+    return "\n".join(pages) + ("\n" if pages else ""), reports
@@ -1,57 +1,263 @@
-from langchain_groq import ChatGroq
 from config import config as CONFIG
 import streamlit as st
-from sentence_transformers import SentenceTransformer
-import os, logging
-
-os.makedirs("logs", exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler("logs/document_classifier.log"),
-        logging.StreamHandler()
-    ]
-)
+from pydantic import BaseModel, ValidationError
+from typing import Callable, Dict, Optional, Tuple, Type
+from collections import defaultdict
+from utils import instrumentation
+from utils.async_runtime import llm_semaphore
+from utils.call_policy import call_with_policy, acall_with_policy
+from utils.logging_setup import get_logger
+import os, re, threading
+
+logger = get_logger("utils", "utils.log")
 
 def load_prompt_template(file_path: str) -> str:
     if not os.path.exists(file_path):
-        logging.error(f"❌ File not found: {file_path}")
+        logger.error("❌ File not found: %s", file_path)
         raise FileNotFoundError(f"❌ File not found: {file_path}")
 
     with open(file_path, "r") as f:
         return f.read()
     
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (~4 characters per token) used for prompt budgeting.
+    """
+    return len(text) // 4 + 1
+
 def configure_llm(MODEL_NAME):
     """
-    Configure LLM to run on Hugging Face Inference API (Cloud-Based).
+    Configure the chat model for MODEL_NAME on the backend selected by CONFIG.LLM_BACKEND
+    ("groq" for the hosted API, "fake" for the offline stand-in).
     
     Returns:
         llm (LangChain LLM object): Configured model instance.
     """
+    # Imported here because the backends module depends on this one
+    from utils.llm_backends import create_chat_model
 
-    # Sidebar to select LLM
     try:
-        # logging.info(f"🤖 Querying LLM: {MODEL_NAME}")
-        llm = ChatGroq(
-            temperature=0,
-            groq_api_key=CONFIG.GROQ_API_KEY,
-            model_name=MODEL_NAME
-        )
+        # logger.info("🤖 Querying LLM: %s", MODEL_NAME)
+        llm = create_chat_model(MODEL_NAME)
         return llm
     except Exception as e:
-        logging.error(f"❌ LLM Query Error: {str(e)}")
+        logger.error("❌ LLM Query Error: %s", e)
         return "❌ Error generating LLM response."
 
-@st.cache_resource  # Cache the embedding model to avoid reloading it every time
+class ParseStats:
+    """
+    Thread-safe counters of structured-output parse outcomes per pipeline stage.
+
+    Outcomes are "ok" (first answer parsed), "reasked" (first answer failed, the
+    re-ask parsed) and "failed" (both attempts failed).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: {"ok": 0, "reasked": 0, "failed": 0})
+
+    def record(self, stage: str, outcome: str):
+        with self._lock:
+            self._counts[stage][outcome] += 1
+
+    def failure_rate(self, stage: str) -> float:
+        """Fraction of calls whose first answer could not be parsed."""
+        with self._lock:
+            counts = self._counts[stage]
+            total = sum(counts.values())
+            return (counts["reasked"] + counts["failed"]) / total if total else 0.0
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            stages = {stage: dict(counts) for stage, counts in self._counts.items()}
+        for stage, counts in stages.items():
+            counts["failure_rate"] = self.failure_rate(stage)
+        return stages
+
+PARSE_STATS = ParseStats()
+
+REASK_SUFFIX = (
+    "\n\nYour previous answer could not be parsed ({error}). "
+    "Respond again with ONLY the JSON object in the required format, no extra text."
+)
+
+def strip_to_json(raw: str) -> str:
+    """
+    Remove <think> traces, code fences and any text around the outermost JSON object.
+    """
+    raw = re.sub(r'<think>.*?</think>', '', raw, flags=re.DOTALL)
+    start, end = raw.find('{'), raw.rfind('}')
+    return raw[start:end + 1] if start != -1 and end > start else raw.strip()
+
+def parse_structured(raw: str, schema: Type[BaseModel], exclude_unset: bool = False) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Validate an LLM answer against `schema`. With exclude_unset=True, fields the
+    answer left out are omitted instead of filled with their defaults.
+
+    Returns:
+        (parsed dict keyed by field alias, None) on success, (None, error message) otherwise.
+    """
+    for candidate in (raw, strip_to_json(raw)):
+        try:
+            return schema.model_validate_json(candidate).model_dump(by_alias=True, exclude_unset=exclude_unset), None
+        except ValidationError as e:
+            error = str(e).splitlines()[0]
+    return None, error
+
+def _is_json_mode_rejection(error: Exception) -> bool:
+    # Groq rejects JSON-mode generations that are not valid JSON with a 400 error
+    return "json_validate_failed" in str(error)
+
+def model_name(llm) -> str:
+    """Model behind `llm`, looking through .bind() wrappers."""
+    while hasattr(llm, "bound"):
+        llm = llm.bound
+    return getattr(llm, "model_name", None) or type(llm).__name__
+
+def invoke_llm(llm, prompt):
+    """`llm.invoke` under the shared call policy (timeout, retries, circuit breaker, hedging)."""
+    return call_with_policy(lambda: llm.invoke(prompt), model_name(llm))
+
+def _response_text(response) -> str:
+    return str(response.content if hasattr(response, "content") else response)
+
+def invoke_structured(llm, prompt: str, schema: Type[BaseModel], stage: str, exclude_unset: bool = False) -> Tuple[Optional[Dict], str]:
+    """
+    Invoke `llm` in JSON mode and validate the answer against `schema`.
+
+    A failed parse triggers exactly one re-ask of the same prompt with the parse
+    error appended. Outcomes are recorded in PARSE_STATS under `stage`.
+
+    Returns:
+        (parsed dict or None, raw text of the last answer)
+    """
+    json_llm = llm.bind(response_format={"type": "json_object"})
+
+    def attempt(attempt_prompt: str) -> Tuple[Optional[Dict], str, Optional[str]]:
+        try:
+            raw = _response_text(invoke_llm(json_llm, attempt_prompt))
+        except Exception as e:
+            if not _is_json_mode_rejection(e):
+                raise
+            return None, "", "response was not valid JSON"
+        parsed, error = parse_structured(raw, schema, exclude_unset)
+        return parsed, raw, error
+
+    parsed, raw, error = attempt(prompt)
+    if parsed is not None:
+        PARSE_STATS.record(stage, "ok")
+        return parsed, raw
+
+    _log_reask(stage, error)
+    parsed, raw, error = attempt(prompt + REASK_SUFFIX.format(error=error))
+    return _finish_reask(stage, parsed, raw, error)
+
+async def ainvoke_llm(llm, prompt):
+    """
+    `llm.ainvoke` under the shared call policy, bounded by the per-loop LLM
+    concurrency limit.
+    """
+    async def request():
+        async with llm_semaphore():
+            return await llm.ainvoke(prompt)
+
+    return await acall_with_policy(request, model_name(llm))
+
+def stream_until(llm, prompt, done: Callable[[str], bool]) -> str:
+    """
+    Stream `llm`'s answer under the call policy and stop reading as soon as
+    `done(text so far)` holds; closing the stream ends generation server-side.
+    """
+    def request():
+        text, stream = "", llm.stream(prompt)
+        try:
+            for chunk in stream:
+                text += _response_text(chunk)
+                if done(text):
+                    break
+        finally:
+            stream.close()
+        return text
+
+    return call_with_policy(request, model_name(llm))
+
+async def astream_until(llm, prompt, done: Callable[[str], bool]) -> str:
+    """Async variant of stream_until, bounded by the per-loop LLM concurrency limit."""
+    async def request():
+        async with llm_semaphore():
+            text, stream = "", llm.astream(prompt)
+            try:
+                async for chunk in stream:
+                    text += _response_text(chunk)
+                    if done(text):
+                        break
+            finally:
+                await stream.aclose()
+            return text
+
+    return await acall_with_policy(request, model_name(llm))
+
+async def ainvoke_structured(llm, prompt: str, schema: Type[BaseModel], stage: str, exclude_unset: bool = False) -> Tuple[Optional[Dict], str]:
+    """Async variant of invoke_structured."""
+    json_llm = llm.bind(response_format={"type": "json_object"})
+
+    async def attempt(attempt_prompt: str) -> Tuple[Optional[Dict], str, Optional[str]]:
+        try:
+            raw = _response_text(await ainvoke_llm(json_llm, attempt_prompt))
+        except Exception as e:
+            if not _is_json_mode_rejection(e):
+                raise
+            return None, "", "response was not valid JSON"
+        parsed, error = parse_structured(raw, schema, exclude_unset)
+        return parsed, raw, error
+
+    parsed, raw, error = await attempt(prompt)
+    if parsed is not None:
+        PARSE_STATS.record(stage, "ok")
+        return parsed, raw
+
+    _log_reask(stage, error)
+    parsed, raw, error = await attempt(prompt + REASK_SUFFIX.format(error=error))
+    return _finish_reask(stage, parsed, raw, error)
+
+def _log_reask(stage: str, error: Optional[str]):
+    logger.warning("⚠️ %s: unparseable structured output (%s). Re-asking once...", stage, error)
+    instrumentation.increment("lexi_llm_retries_total", reason="parse", stage=stage)
+
+def _finish_reask(stage: str, parsed: Optional[Dict], raw: str, error: Optional[str]) -> Tuple[Optional[Dict], str]:
+    if parsed is not None:
+        PARSE_STATS.record(stage, "reasked")
+        return parsed, raw
+    PARSE_STATS.record(stage, "failed")
+    logger.error("❌ %s: structured output still invalid after re-ask (%s)", stage, error)
+    return None, raw
+
+_embedding_model = None
+_embedding_lock = threading.Lock()
+
 def configure_embedding_model():
     """
-    Configures and caches the embedding model.
+    Loads the embedding model once per process and returns the shared instance.
+    Held outside Streamlit's cache so page switches and reruns never reload it.
+    With CONFIG.EMBEDDING_BACKEND="onnx" the model runs on ONNX Runtime without
+    PyTorch, falling back to sentence-transformers if that backend is unavailable.
 
     Returns:
-        embedding_model (FastEmbedEmbeddings): The loaded embedding model.
+        embedding_model (SentenceTransformer or OnnxEmbeddingModel): The loaded embedding model.
     """
-    return SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")  # Load and return the embedding model
+    global _embedding_model
+    with _embedding_lock:
+        if _embedding_model is None and CONFIG.EMBEDDING_BACKEND == "onnx":
+            try:
+                from utils.onnx_embedding import load_onnx_embedding_model
+                _embedding_model = load_onnx_embedding_model(CONFIG.EMBEDDING_MODEL_NAME)
+            except Exception as e:
+                logger.warning("⚠️ ONNX embedding backend unavailable (%s); loading sentence-transformers", e)
+        if _embedding_model is None:
+            # Imported here so the ONNX backend never loads PyTorch
+            from sentence_transformers import SentenceTransformer
+            _embedding_model = SentenceTransformer(CONFIG.EMBEDDING_MODEL_NAME)
+    return _embedding_model
 
 def enable_chat_history(func):
     """
@@ -65,7 +271,7 @@ def enable_chat_history(func):
         st.session_state["current_page"] = current_page  # Store the current chatbot session
     if st.session_state["current_page"] != current_page:
         try:
-            st.cache_resource.clear()  # Clear cached resources
+            # Only the chat session is reset; cached models and graphs stay loaded
             del st.session_state["current_page"]
             del st.session_state["messages"]
         except Exception:
@@ -104,8 +310,7 @@ def print_qa(cls, question, answer):
         question (str): User question.
         answer (str): Model response.
     """
-    log_str = f"\nUsecase: {cls.__name__}\nQuestion: {question}\nAnswer: {answer}\n" + "-" * 50
-    logging.info(log_str)  # Log the interaction using Streamlit's logger
+    logger.info("\nUsecase: %s\nQuestion: %s\nAnswer: %s\n%s", cls.__name__, question, answer, "-" * 50)
 
 def sync_st_session():
     """
@@ -0,0 +1,236 @@
+import re
+import sys
+import json
+import asyncio
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Set, Tuple
+from config import config as CONFIG
+from clause_extractor import extract_clauses_from_chunks, aextract_clauses_from_chunks, merge_clause_chunks
+from risk_detector import analyze_clause_risks, aanalyze_clause_risks
+from summarizer import (summarize_contract, asummarize_contract, summarize_chunks, asummarize_chunks,
+                        revise_summary, arevise_summary)
+from section_parser import parse_sections, iter_sections
+from dedup import get_analysis, text_hash
+from document_loader import load_document
+from utils.logging_setup import get_logger
+
+# Setup logging
+logger = get_logger("versioning", "versioning.log")
+
+NOT_FOUND = "Not Found"
+
+def previous_analysis(previous_version: str, tenant: str = "") -> Optional[Dict[str, Any]]:
+    """
+    `tenant`'s stored analysis of an earlier version, given its text hash or the path
+    of the earlier file (which must have been analysed before).
+    """
+    record = get_analysis(previous_version, tenant)
+    if record is None and previous_version.lower().endswith((".pdf", ".docx", ".txt")):
+        try:
+            record = get_analysis(text_hash(load_document(previous_version)), tenant)
+        except Exception as e:
+            logger.error("❌ Could not load previous version %s: %s", previous_version, e)
+    if record is None:
+        logger.warning("⚠️ No stored analysis for previous version %s; analysing from scratch", previous_version)
+    return record
+
+def align_chunks(old_hashes: List[str], chunks: List[str]) -> Tuple[List[int], int]:
+    """
+    Align the new chunks to the previous version's chunk hashes.
+
+    Returns:
+        (indexes of new chunks that were inserted or rewritten, number of old chunks removed or rewritten)
+    """
+    new_hashes = [text_hash(chunk) for chunk in chunks]
+    changed, removed = [], 0
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, old_hashes, new_hashes, autojunk=False).get_opcodes():
+        if tag != "equal":
+            changed.extend(range(j1, j2))
+            removed += i2 - i1
+    return changed, removed
+
+def chunk_spans(full_text: str, chunks: List[str], indexes: List[int]) -> List[Tuple[int, int]]:
+    """Character spans in `full_text` of the chunks at `indexes`."""
+    spans, cursor, indexes = [], 0, set(indexes)
+    for index, chunk in enumerate(chunks):
+        start = full_text.find(chunk, cursor)
+        if start == -1:
+            continue
+        cursor = start + 1
+        if index in indexes:
+            spans.append((start, start + len(chunk)))
+    return spans
+
+def find_verbatim(value: str, full_text: str) -> Optional[Tuple[int, int]]:
+    """Span of `value` in `full_text`, matched exactly up to whitespace, or None."""
+    words = value.split()
+    if not words:
+        return None
+    match = re.search(r'\s+'.join(re.escape(word) for word in words), full_text)
+    return match.span() if match else None
+
+def changed_sections(full_text: str, chunks: List[str], changed: List[int]) -> List[str]:
+    """Headings of the new version's sections that overlap a changed chunk."""
+    spans = chunk_spans(full_text, chunks, changed)
+    headings = []
+    for section in iter_sections(parse_sections(full_text)):
+        label = " ".join(part for part in (section["number"], section["heading"]) if part)
+        if label and not section["children"] and any(s < section["end"] and section["start"] < e for s, e in spans):
+            headings.append(label)
+    return headings
+
+def diff_clauses(previous: Dict[str, str], fresh: Dict[str, str], full_text: str,
+                 trackable: Set[str], changed_spans: List[Tuple[int, int]]) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Decide each clause of the new version.
+
+    A previous value quoted verbatim (`trackable`) carries over only while the new
+    text still contains it exactly (up to whitespace) and outside every changed
+    chunk (`changed_spans`); even a one-word redline makes it "modified". Otherwise
+    the value re-extracted from the changed chunks wins ("modified"/"added"); a
+    tracked clause that vanished without a replacement is "removed". Untracked
+    (paraphrased) values carry over unless re-extraction found a different one.
+
+    Returns:
+        (clauses of the new version, {clause: "modified" | "added" | "removed"} for changed ones)
+    """
+    clauses, changes = {}, {}
+    for clause in set(CONFIG.REQUIRED_CLAUSES) | set(previous):
+        old, new = previous.get(clause, NOT_FOUND), fresh.get(clause, NOT_FOUND)
+        tracked = clause in trackable and old != NOT_FOUND
+        span = find_verbatim(old, full_text) if tracked else None
+        untouched = span is not None and not any(s < span[1] and span[0] < e for s, e in changed_spans)
+        if untouched or (span is not None and new.split() in (old.split(), NOT_FOUND.split())):
+            # Unedited, or inside a changed chunk whose re-extraction still gives the same text
+            clauses[clause] = old
+        elif new != NOT_FOUND and new != old:
+            clauses[clause] = new
+            changes[clause] = "modified" if old != NOT_FOUND else "added"
+        elif tracked:
+            clauses[clause] = NOT_FOUND
+            changes[clause] = "removed"
+        else:
+            clauses[clause] = old
+    return clauses, changes
+
+def _patch(old: Optional[Dict], new: Optional[Dict], changes: Dict[str, str], keys: List[str]) -> Dict:
+    """Previous per-clause results with the changed clauses replaced by the new ones."""
+    patched = dict(old or {})
+    for key in keys:
+        values = {c: v for c, v in (old or {}).get(key, {}).items() if c not in changes}
+        values.update((new or {}).get(key, {}))
+        patched[key] = values
+    return patched
+
+def risk_report(previous: Dict[str, Any], state: Dict[str, Any], changes: Dict[str, str]) -> List[Dict[str, Any]]:
+    """One entry per changed clause: old and new value, old and new risk, new suggestion."""
+    old_risks = (previous.get("risks") or {}).get("ambiguous_clauses", {})
+    new_risks = (state.get("risks") or {}).get("ambiguous_clauses", {})
+    suggestions = (state.get("risks") or {}).get("suggestions", {})
+    return [{
+        "clause": clause,
+        "status": status,
+        "old_value": previous["clauses"].get(clause, NOT_FOUND),
+        "new_value": state["clauses"].get(clause, NOT_FOUND),
+        "old_risk": old_risks.get(clause),
+        "new_risk": new_risks.get(clause),
+        "suggestion": suggestions.get(clause),
+    } for clause, status in sorted(changes.items())]
+
+def _plan(state: Dict[str, Any], previous: Dict[str, Any]) -> List[int]:
+    changed, removed = align_chunks(previous.get("chunk_hashes") or [], state["chunks"])
+    logger.info("🔀 Revision of %s: %s/%s chunks new or rewritten, %s previous chunks removed or rewritten",
+                previous.get("name"), len(changed), len(state["chunks"]), removed)
+    # Near-duplicates come from the same tenant's store, so their classification is reused too
+    state["doc_type"] = previous["doc_type"]
+    state["doc_summary"] = previous["doc_summary"]
+    state["reused_from"] = previous.get("name") or previous["hash"]
+    state["revision_report"] = {"changed_chunks": len(changed), "removed_chunks": removed,
+                                "changed_sections": changed_sections(state["full_text"], state["chunks"], changed)}
+    return changed
+
+def _apply(state: Dict[str, Any], previous: Dict[str, Any], changed: List[int],
+           fresh_outputs: List[Dict[str, str]]) -> Tuple[Dict[str, str], Dict[str, str]]:
+    fresh = merge_clause_chunks(fresh_outputs) if fresh_outputs else {}
+    # Records stored before clause tracking existed: assume every clause was quoted
+    trackable = set(previous.get("verbatim_clauses", previous["clauses"]))
+    spans = chunk_spans(state["full_text"], state["chunks"], changed)
+    state["clauses"], changes = diff_clauses(previous["clauses"], fresh, state["full_text"], trackable, spans)
+    logger.info("🔀 Changed clauses: %s", changes or "none")
+    # Only clauses that still exist need fresh risks and summaries
+    return {c: state["clauses"][c] for c, status in changes.items() if status != "removed"}, changes
+
+def _finish(state: Dict[str, Any], previous: Dict[str, Any], changes: Dict[str, str],
+            risks: Optional[Dict], summary: Optional[Dict]) -> Dict[str, Any]:
+    state["risks"] = _patch(previous.get("risks"), risks, changes, ["ambiguous_clauses", "suggestions"])
+    state["clause_summary"] = summary if summary is not None else previous.get("clause_summary")
+    state["revision_report"]["clauses"] = risk_report(previous, state, changes)
+    return state
+
+def _resummarize(state: Dict[str, Any], changed: List[int]) -> bool:
+    # Revising a summary that most of the text no longer supports costs more than starting over
+    return len(changed) > CONFIG.REVISION_RESUMMARIZE_FRACTION * len(state["chunks"])
+
+def reanalyze_revision(state: Dict[str, Any], previous: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Analyse a new version of a document against the stored analysis of an earlier
+    one: only new or rewritten chunks are re-extracted, and risks are recomputed
+    only for the clauses that changed. The clause summary (with its overall
+    summary) is regenerated whenever any clause changed. The classification
+    carries over, and the document summary is revised from the changed chunks,
+    or recomputed when more than REVISION_RESUMMARIZE_FRACTION of them changed.
+    """
+    changed = _plan(state, previous)
+    chunks = [state["chunks"][i] for i in changed]
+    outputs = extract_clauses_from_chunks(chunks, strict=True) if changed else []
+    to_analyze, changes = _apply(state, previous, changed, outputs)
+    risks = summary = None
+    if _resummarize(state, changed):
+        state["doc_summary"] = summarize_chunks(state["chunks"])
+    elif changed:
+        state["doc_summary"] = revise_summary(previous["doc_summary"], chunks)
+    if to_analyze:
+        result = analyze_clause_risks(to_analyze, CONFIG.RISK_ANALYZER_PATH)
+        if result is None:
+            raise RuntimeError("Re-analysis of changed clauses returned no result")
+        risks, _ = result
+    if changes:
+        summary = summarize_contract(state["clauses"])
+        if summary is None:
+            raise RuntimeError("Clause summarization returned no result")
+    return _finish(state, previous, changes, risks, summary)
+
+async def areanalyze_revision(state: Dict[str, Any], previous: Dict[str, Any]) -> Dict[str, Any]:
+    """Async variant of reanalyze_revision; the remaining LLM stages run concurrently."""
+    changed = _plan(state, previous)
+    chunks = [state["chunks"][i] for i in changed]
+    outputs = await aextract_clauses_from_chunks(chunks, strict=True) if changed else []
+    to_analyze, changes = _apply(state, previous, changed, outputs)
+    tasks = {}
+    if _resummarize(state, changed):
+        tasks["doc_summary"] = asummarize_chunks(state["chunks"])
+    elif changed:
+        tasks["doc_summary"] = arevise_summary(previous["doc_summary"], chunks)
+    if to_analyze:
+        tasks["risks"] = aanalyze_clause_risks(to_analyze, CONFIG.RISK_ANALYZER_PATH)
+    if changes:
+        tasks["summary"] = asummarize_contract(state["clauses"])
+    results = dict(zip(tasks, await asyncio.gather(*tasks.values())))
+    if "risks" in results and results["risks"] is None:
+        raise RuntimeError("Re-analysis of changed clauses returned no result")
+    if "summary" in results and results["summary"] is None:
+        raise RuntimeError("Clause summarization returned no result")
+    if "doc_summary" in results:
+        state["doc_summary"] = results["doc_summary"]
+    risks = results["risks"][0] if "risks" in results else None
+    return _finish(state, previous, changes, risks, results.get("summary"))
+
+# Sample Test: python versioning.py old.pdf new.pdf
+if __name__ == "__main__":
+    from pdf_agent import build_graph, run_analysis
+
+    old_path, new_path = sys.argv[1:3]
+    agent = build_graph()
+    run_analysis(agent, {"file_path": old_path})  # stores the earlier version if it is new
+    result = run_analysis(agent, {"file_path": new_path, "previous_version": old_path})
+    print("\n🔀 Revision Report:\n", json.dumps(result.get("revision_report"), indent=2))